@@ -0,0 +1,241 @@
+"""
+End to end benchmark of the main.py commands against the local fake services
+and a generated Things database with 100, 1k and 10k tasks. Every command
+reports wall time, remote calls, SQLite statements and the peak RSS, the
+results are written to JSON so two versions can be compared with --compare
+"""
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BENCHMARK_DIR = Path(__file__).parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent / "things2reclaim"))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+from fake_services import FakeServices, generate_dataset  # noqa: E402
+from things_fixture import create_things_database  # noqa: E402
+
+TASK_COUNTS = [100, 1_000, 10_000]
+# share of the things tasks that are already uploaded, upload creates the rest
+UPLOADED_SHARE = 0.5
+# uploaded tasks that are deleted in things, removeDeleted completes them
+DELETED_SHARE = 0.05
+# read only commands first, then the ones changing reclaim. The client side
+# throttle of upload is lifted, the fakes don't rate limit by default
+COMMANDS = [
+    ["list"],
+    ["stats"],
+    ["time"],
+    ["tracking", "14"],
+    ["finished", "--dry-run"],
+    ["upload", "--rate-limit", "1000"],
+    ["removeDeleted"],
+]
+# metrics where a higher value in the new run is a regression
+METRICS = ["wall_time", "remote_calls", "sqlite_queries", "peak_rss_mb"]
+
+sqlite_statements: Counter = Counter()
+_connect = sqlite3.connect
+
+
+def counting_connect(*args, **kwargs):
+    """
+    sqlite3.connect with a trace callback counting the executed statements,
+    things.py opens a new connection for every query
+    """
+    connection = _connect(*args, **kwargs)
+    connection.set_trace_callback(lambda statement: sqlite_statements.update([1]))
+    return connection
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def prepare(tmp_dir: Path, task_count: int) -> FakeServices:
+    """
+    Creates the things database, the reclaim tasks of the uploaded share
+    plus the deleted ones and the uploaded tasks database
+    """
+    things_path = tmp_dir / "main.sqlite"
+    create_things_database(things_path, task_count)
+    os.environ["THINGSDB"] = str(things_path)
+
+    import database_handler
+    import things_handler
+
+    things_tasks = [
+        (task["uuid"], things_handler.full_name(task))
+        for task in things_handler.get_all_things_tasks()
+    ]
+    uploaded = things_tasks[: int(task_count * UPLOADED_SHARE)]
+    deleted = [
+        (f"deleted{index:06d}", f"Ana VL deleted {index}")
+        for index in range(max(1, int(task_count * DELETED_SHARE)))
+    ]
+    dataset = generate_dataset(len(uploaded) + len(deleted), uploaded + deleted)
+    services = FakeServices(dataset).start()
+    services.install(tmp_dir / "config", tmp_dir / "things2reclaim.sqlite")
+
+    reclaim_task_ids = {
+        task["notes"].removeprefix("things_task:"): task_id
+        for task_id, task in dataset.reclaim_tasks.items()
+    }
+    with database_handler.UploadedTasksDB(tmp_dir / "things2reclaim.sqlite") as db:
+        db.add_uploaded_tasks(list(reclaim_task_ids), reclaim_task_ids)
+    return services
+
+
+def run_command(runner, app, services: FakeServices, args: List[str]) -> Dict:
+    services.request_counts.clear()
+    sqlite_statements.clear()
+    start = time.perf_counter()
+    result = runner.invoke(app, args)
+    wall_time = time.perf_counter() - start
+    return {
+        "command": " ".join(args),
+        "exit_code": result.exit_code,
+        "error": repr(result.exception) if result.exit_code else None,
+        "wall_time": wall_time,
+        "remote_calls": sum(services.request_counts.values()),
+        "remote_calls_by_route": dict(services.request_counts.most_common()),
+        "sqlite_queries": sum(sqlite_statements.values()),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_size(task_count: int) -> List[Dict]:
+    """
+    Runs all commands on one generated dataset in this process
+    """
+    sqlite3.connect = counting_connect
+    from typer.testing import CliRunner
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        services = prepare(Path(tmp_dir), task_count)
+        try:
+            import main
+
+            runner = CliRunner()
+            return [
+                {"tasks": task_count, **run_command(runner, main.app, services, args)}
+                for args in COMMANDS
+            ]
+        finally:
+            services.stop()
+
+
+def run_isolated(task_count: int) -> List[Dict]:
+    """
+    Runs one dataset size in a fresh interpreter, so the peak RSS and the
+    warm caches of the smaller sizes don't leak into the bigger ones
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = Path(tmp_dir) / "results.json"
+        subprocess.run(
+            [sys.executable, __file__, "--single", str(task_count), "--output", output],
+            check=True,
+        )
+        return json.loads(output.read_text())
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARK_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: List[Dict]):
+    print(
+        f"{'tasks':>6} {'command':<28} {'wall ms':>10} {'remote':>7} "
+        f"{'sqlite':>7} {'rss MB':>7}"
+    )
+    for result in results:
+        status = "" if result["exit_code"] == 0 else f" failed: {result['error']}"
+        print(
+            f"{result['tasks']:>6} {result['command']:<28} "
+            f"{result['wall_time'] * 1000:>10.1f} {result['remote_calls']:>7} "
+            f"{result['sqlite_queries']:>7} {result['peak_rss_mb']:>7.1f}{status}"
+        )
+
+
+def compare(results: List[Dict], baseline_path: Path):
+    """
+    Prints the ratio of every metric to the same command in the baseline
+    """
+    baseline = {
+        (result["tasks"], result["command"]): result
+        for result in json.loads(baseline_path.read_text())["results"]
+    }
+    print(f"\nCompared to {baseline_path} (new / old)")
+    for result in results:
+        old = baseline.get((result["tasks"], result["command"]))
+        if old is None:
+            continue
+        ratios = [
+            f"{metric} {result[metric] / old[metric]:.2f}x"
+            for metric in METRICS
+            if old[metric]
+        ]
+        print(f"{result['tasks']:>6} {result['command']:<28} {'  '.join(ratios)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=TASK_COUNTS)
+    parser.add_argument("--output", type=Path, help="Write the results to this file")
+    parser.add_argument("--compare", type=Path, help="Results of an earlier run")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        args.output.write_text(json.dumps(run_size(args.single)))
+        return
+
+    results = []
+    for task_count in args.sizes:
+        results += run_isolated(task_count)
+    print_results(results)
+    output = args.output or BENCHMARK_DIR / "results" / (
+        f"e2e-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {
+                "revision": git_revision(),
+                "date": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"\nResults written to {output}")
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
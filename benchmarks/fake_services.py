@@ -0,0 +1,572 @@
+"""
+Local stand-ins for the Reclaim, Toggl and task scheduler endpoints that
+things2reclaim uses, served from one threaded HTTP server on localhost.
+Latency, a global rate limit and random server errors can be injected, so
+concurrency, caching and sync changes can be measured without the services
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import json
+import math
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+COURSES = ["Ana", "LinAlg", "DS", "EIDI", "GBS", "ERA", "DWT", "Theo", "GAD", "IN2"]
+TAGS = ["Vorlesung", "Übung", "Hausaufgabe", "Tutorium", "Zusammenfassung"]
+# prefix reclaim puts in front of the events it scheduled for a task
+EVENT_PREFIX = "\N{WHITE HEAVY CHECK MARK} "
+WORKSPACE_ID = 1
+RECLAIM_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+CONFIG_DIR_VARIABLE = "THINGS2RECLAIM_CONFIG_DIR"  # same as things2reclaim.utils
+
+
+def reclaim_datetime(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime(RECLAIM_DATETIME_FORMAT)
+
+
+def toggl_datetime(value: datetime) -> str:
+    return value.astimezone(timezone.utc).isoformat()
+
+
+class Faults(NamedTuple):
+    latency: float = 0.0  # seconds added to every response
+    rate_limit: Optional[float] = None  # requests per second before 429s
+    error_rate: float = 0.0  # share of requests answered with a 503
+
+
+class Dataset:
+    """
+    Server side state of all three services
+    """
+
+    def __init__(self):
+        self.reclaim_tasks: Dict[int, Dict] = {}
+        self.reclaim_events: Dict[str, Dict] = {}
+        self.toggl_entries: Dict[int, Dict] = {}
+        self.toggl_projects: List[Dict] = [
+            {"id": index + 1, "name": course, "wid": WORKSPACE_ID, "active": True}
+            for index, course in enumerate(COURSES)
+        ]
+        self.toggl_tags: List[Dict] = [
+            {"id": index + 1, "name": tag, "workspace_id": WORKSPACE_ID}
+            for index, tag in enumerate(TAGS)
+        ]
+        self.scheduler_tasks: List[Dict] = []
+        self.next_id = 1
+
+    def new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+    def add_reclaim_task(self, data: Dict) -> Dict:
+        task = {
+            "eventCategory": "WORK",
+            "status": "NEW",
+            "instances": [],
+            "created": reclaim_datetime(datetime.now(timezone.utc)),
+            **data,
+            "id": self.new_id(),
+        }
+        self.reclaim_tasks[task["id"]] = task
+        return task
+
+    def add_reclaim_event(self, task: Dict, start: datetime, end: datetime) -> Dict:
+        event = {
+            "eventId": f"event{self.new_id()}",
+            "taskId": task["id"],
+            "title": EVENT_PREFIX + task["title"],
+            "start": reclaim_datetime(start),
+            "end": reclaim_datetime(end),
+        }
+        self.reclaim_events[event["eventId"]] = event
+        task["instances"].append(event)
+        task["status"] = "SCHEDULED"
+        return event
+
+    def add_toggl_entry(
+        self, description: str, project: str, start: datetime, end: Optional[datetime]
+    ) -> Dict:
+        entry = {
+            "id": self.new_id(),
+            "wid": WORKSPACE_ID,
+            "pid": COURSES.index(project) + 1 if project in COURSES else None,
+            "description": description,
+            "start": toggl_datetime(start),
+            "stop": None if end is None else toggl_datetime(end),
+            "duration": (
+                -int(start.timestamp())
+                if end is None
+                else int((end - start).total_seconds())
+            ),
+            "tags": [],
+            "at": toggl_datetime(datetime.now(timezone.utc)),
+        }
+        self.toggl_entries[entry["id"]] = entry
+        return entry
+
+    def touch_toggl_entry(self, entry: Dict):
+        entry["at"] = toggl_datetime(datetime.now(timezone.utc))
+
+
+def generate_dataset(
+    task_count: int,
+    tasks: Optional[List[Tuple[str, str]]] = None,
+    tracked_share: float = 0.5,
+    seed: int = 0,
+    now: Optional[datetime] = None,
+) -> Dataset:
+    """
+    Creates task_count reclaim tasks, (things id, name) pairs can be given
+    to match a generated things database. tracked_share of the tasks get a
+    scheduled event in the last two weeks and a toggl entry close to it
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    if tasks is None:
+        tasks = [
+            (f"things{index:06d}", f"{rng.choice(COURSES)} VL {index}")
+            for index in range(task_count)
+        ]
+    dataset = Dataset()
+    for things_id, name in tasks[:task_count]:
+        chunks = rng.choice([2, 4, 6, 8])
+        task = dataset.add_reclaim_task(
+            {
+                "title": name,
+                "notes": f"things_task:{things_id}",
+                "minChunkSize": chunks,
+                "maxChunkSize": chunks,
+                "timeChunksRequired": chunks,
+                "due": reclaim_datetime(now + timedelta(days=rng.randint(-7, 30))),
+            }
+        )
+        if rng.random() >= tracked_share:
+            continue
+        start = now - timedelta(days=rng.randint(0, 13), minutes=rng.randint(0, 600))
+        end = start + timedelta(minutes=chunks * 15)
+        dataset.add_reclaim_event(task, start, end)
+        shift = timedelta(minutes=rng.choice([0, 0, 5, -10, 20]))
+        dataset.add_toggl_entry(name, name.split(" ")[0], start + shift, end + shift)
+    return dataset
+
+
+# memoized getters holding config or clients of the things2reclaim modules,
+# which are loaded flat by each other and package-qualified by the tests
+CACHED_GETTERS = {
+    "utils": ["load_config"],
+    "reclaim_handler": ["get_client"],
+    "toggl_handler": [
+        "get_auth",
+        "get_http_client",
+        "get_workspaces",
+        "get_time_entries",
+        "get_workspace",
+        "get_project_dict",
+        "get_time_entry_editor",
+    ],
+    "task_scheduler_handler": ["get_api"],
+    "things_handler": ["get_course_names"],
+}
+
+
+def reset_client_caches():
+    for module_name, getter_names in CACHED_GETTERS.items():
+        for name in (module_name, f"things2reclaim.{module_name}"):
+            module = sys.modules.get(name)
+            if module is None:
+                continue
+            for getter_name in getter_names:
+                getattr(module, getter_name).cache_clear()
+
+
+Route = Tuple[str, "re.Pattern[str]", str, Callable[..., Tuple[int, Any]]]
+
+
+class FakeServices:
+    """
+    Serves a Dataset until stopped. The services live under
+    /reclaim, /toggl/api/v9 and /scheduler of url.
+    request_counts counts the answered requests per route name and
+    connection_count the connections the clients opened
+    """
+
+    def __init__(self, dataset: Dataset, faults: Faults = Faults(), seed: int = 0):
+        self.dataset = dataset
+        self.faults = faults
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_counts: Counter = Counter()
+        self.fault_counts: Counter = Counter()
+        self.connection_count = 0  # accepted tcp connections
+        self.tokens = faults.rate_limit or 0.0
+        self.last_refill = time.monotonic()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.routes: List[Route] = []
+        self._add_routes()
+
+    # lifecycle
+
+    def start(self) -> "FakeServices":
+        services = self
+
+        class Handler(_Handler):
+            fake_services = services
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self) -> "FakeServices":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        assert self.server is not None, "server is not started"
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def reclaim_url(self) -> str:
+        return f"{self.url}/reclaim"
+
+    @property
+    def toggl_url(self) -> str:
+        return f"{self.url}/toggl/api/v9/"
+
+    @property
+    def scheduler_url(self) -> str:
+        return f"{self.url}/scheduler"
+
+    def write_config(self, config_dir: Path, database_path: Path):
+        """
+        Writes the config files that point things2reclaim at the fakes,
+        use it with THINGS2RECLAIM_CONFIG_DIR=config_dir
+        """
+        config_dir.mkdir(parents=True, exist_ok=True)
+        (config_dir / ".reclaim.toml").write_text(
+            f'[reclaim_ai]\ntoken = "fake"\napi_url = "{self.reclaim_url}"\n'
+        )
+        (config_dir / ".toggl.toml").write_text(
+            f'[toggl_track]\ntoken = "fake"\napi_url = "{self.toggl_url}"\n'
+        )
+        (config_dir / ".things2reclaim.toml").write_text(
+            f'[database]\npath = "{database_path}"\n\n'
+            f'[task_scheduler]\nhost = "{self.scheduler_url}"\n'
+        )
+
+    def install(self, config_dir: Path, database_path: Path):
+        """
+        Points the things2reclaim modules of this process at the fakes
+        """
+        self.write_config(config_dir, database_path)
+        os.environ[CONFIG_DIR_VARIABLE] = str(config_dir)
+        reset_client_caches()
+
+    # faults
+
+    def _take_token(self) -> Optional[float]:
+        """
+        Returns None if the request may pass, else the seconds until it would
+        """
+        rate = self.faults.rate_limit
+        if rate is None:
+            return None
+        now = time.monotonic()
+        self.tokens = min(rate, self.tokens + (now - self.last_refill) * rate)
+        self.last_refill = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        return (1 - self.tokens) / rate
+
+    def inject_fault(self) -> Optional[Tuple[int, Any, Dict[str, str]]]:
+        if self.faults.latency:
+            time.sleep(self.faults.latency)
+        with self.lock:
+            wait = self._take_token()
+            if wait is not None:
+                return (
+                    429,
+                    {"error": "rate limited"},
+                    {"Retry-After": str(max(1, math.ceil(wait)))},
+                )
+            if self.faults.error_rate and self.rng.random() < self.faults.error_rate:
+                return 503, {"error": "injected failure"}, {}
+        return None
+
+    # routing
+
+    def dispatch(
+        self, method: str, path: str, query: Dict[str, str], body: Any
+    ) -> Tuple[int, Any, Dict[str, str]]:
+        for route_method, pattern, name, handler in self.routes:
+            if route_method != method:
+                continue
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            fault = self.inject_fault()
+            with self.lock:
+                self.request_counts[name] += 1
+                if fault is not None:
+                    self.fault_counts[fault[0]] += 1
+                    return fault
+                status, response = handler(*match.groups(), query=query, body=body)
+            return status, response, {}
+        return 404, {"error": f"no route for {method} {path}"}, {}
+
+    def _route(self, method: str, pattern: str, name: str):
+        def register(handler):
+            self.routes.append((method, re.compile(pattern), name, handler))
+            return handler
+
+        return register
+
+    def _add_routes(self):
+        data = self.dataset
+
+        # reclaim
+
+        @self._route("GET", r"/reclaim/api/tasks", "reclaim.search_tasks")
+        def search_tasks(query, body):
+            return 200, list(data.reclaim_tasks.values())
+
+        @self._route("POST", r"/reclaim/api/tasks", "reclaim.create_task")
+        def create_task(query, body):
+            return 200, data.add_reclaim_task(body or {})
+
+        @self._route("GET", r"/reclaim/api/tasks/(\d+)", "reclaim.get_task")
+        def get_task(task_id, query, body):
+            task = data.reclaim_tasks.get(int(task_id))
+            return (404, {"error": "not found"}) if task is None else (200, task)
+
+        @self._route("PUT", r"/reclaim/api/tasks/(\d+)", "reclaim.update_task")
+        @self._route("PATCH", r"/reclaim/api/tasks/(\d+)", "reclaim.patch_task")
+        def update_task(task_id, query, body):
+            task = data.reclaim_tasks.get(int(task_id))
+            if task is None:
+                return 404, {"error": "not found"}
+            task.update({k: v for k, v in (body or {}).items() if k != "id"})
+            return 200, task
+
+        @self._route(
+            "POST", r"/reclaim/api/planner/done/task/(\d+)", "reclaim.complete_task"
+        )
+        def complete_task(task_id, query, body):
+            task = data.reclaim_tasks.get(int(task_id))
+            if task is None:
+                return 404, {"error": "not found"}
+            task["status"] = "COMPLETE"
+            return 200, {"taskOrHabit": task}
+
+        @self._route("GET", r"/reclaim/api/events", "reclaim.events")
+        def events(query, body):
+            start = query.get("start", "0000")
+            end = query.get("end", "9999")
+            return 200, [
+                event
+                for event in data.reclaim_events.values()
+                if start <= event["start"][:10] < end
+            ]
+
+        @self._route(
+            "POST", r"/reclaim/api/planner/event/move/([\w-]+)", "reclaim.move_event"
+        )
+        def move_event(event_id, query, body):
+            event = data.reclaim_events.get(event_id)
+            if event is None:
+                return 404, {"error": "not found"}
+            event["start"] = query.get("start", event["start"])
+            event["end"] = query.get("end", event["end"])
+            return 200, {"events": [event]}
+
+        # toggl
+
+        toggl = r"/toggl/api/v9"
+
+        @self._route("GET", rf"{toggl}/workspaces", "toggl.workspaces")
+        def workspaces(query, body):
+            return 200, [
+                {
+                    "id": WORKSPACE_ID,
+                    "name": "Uni",
+                    "premium": False,
+                    "admin": True,
+                    "default_currency": "EUR",
+                    "only_admins_may_create_projects": False,
+                    "only_admins_see_billable_rates": False,
+                    "rounding": 0,
+                    "rounding_minutes": 0,
+                }
+            ]
+
+        @self._route("GET", rf"{toggl}/workspaces/\d+/projects", "toggl.projects")
+        def projects(query, body):
+            return 200, data.toggl_projects
+
+        @self._route("GET", rf"{toggl}/workspaces/\d+/tags", "toggl.tags")
+        def tags(query, body):
+            return 200, data.toggl_tags
+
+        @self._route("GET", rf"{toggl}/me/time_entries", "toggl.time_entries")
+        def time_entries(query, body):
+            entries = data.toggl_entries.values()
+            if "since" in query:
+                # like toggl: everything modified since, deleted entries included
+                since = toggl_datetime(
+                    datetime.fromtimestamp(int(query["since"]), timezone.utc)
+                )
+                entries = [entry for entry in entries if entry["at"] >= since]
+            else:
+                entries = [
+                    entry for entry in entries if not entry.get("server_deleted_at")
+                ]
+            if "start_date" in query:
+                entries = [
+                    entry
+                    for entry in entries
+                    if query["start_date"] <= entry["start"][:10] < query["end_date"]
+                ]
+            return 200, sorted(entries, key=lambda entry: entry["start"], reverse=True)
+
+        @self._route(
+            "GET", rf"{toggl}/me/time_entries/current", "toggl.current_time_entry"
+        )
+        def current_time_entry(query, body):
+            running = [e for e in data.toggl_entries.values() if e["stop"] is None]
+            return 200, running[0] if running else None
+
+        @self._route("GET", rf"{toggl}/me/time_entries/(\d+)", "toggl.time_entry")
+        def time_entry(entry_id, query, body):
+            entry = data.toggl_entries.get(int(entry_id))
+            if entry is None or entry.get("server_deleted_at"):
+                return 404, {"error": "not found"}
+            return 200, entry
+
+        @self._route(
+            "POST", rf"{toggl}/workspaces/\d+/time_entries", "toggl.create_time_entry"
+        )
+        def create_time_entry(query, body):
+            body = body or {}
+            entry = data.add_toggl_entry(
+                body.get("description", ""), "", datetime.now(timezone.utc), None
+            )
+            entry.update(
+                {k: v for k, v in body.items() if k in ("pid", "tags", "start")}
+            )
+            return 200, entry
+
+        @self._route(
+            "PATCH",
+            rf"{toggl}/workspaces/\d+/time_entries/(\d+)(?:/stop)?",
+            "toggl.stop_time_entry",
+        )
+        def stop_time_entry(entry_id, query, body):
+            entry = data.toggl_entries.get(int(entry_id))
+            if entry is None:
+                return 404, {"error": "not found"}
+            if entry["stop"] is None:
+                stop = datetime.now(timezone.utc)
+                entry["stop"] = toggl_datetime(stop)
+                start = datetime.fromisoformat(entry["start"])
+                entry["duration"] = int((stop - start).total_seconds())
+            entry.update(body or {})
+            data.touch_toggl_entry(entry)
+            return 200, entry
+
+        @self._route(
+            "PUT",
+            rf"{toggl}/workspaces/\d+/time_entries/(\d+)",
+            "toggl.update_time_entry",
+        )
+        def update_time_entry(entry_id, query, body):
+            entry = data.toggl_entries.get(int(entry_id))
+            if entry is None:
+                return 404, {"error": "not found"}
+            entry.update({k: v for k, v in (body or {}).items() if k != "id"})
+            data.touch_toggl_entry(entry)
+            return 200, entry
+
+        @self._route(
+            "DELETE",
+            rf"{toggl}/workspaces/\d+/time_entries/(\d+)",
+            "toggl.delete_time_entry",
+        )
+        def delete_time_entry(entry_id, query, body):
+            entry = data.toggl_entries.get(int(entry_id))
+            if entry is None or entry.get("server_deleted_at"):
+                return 404, {"error": "not found"}
+            data.touch_toggl_entry(entry)
+            entry["server_deleted_at"] = entry["at"]
+            return 200, None
+
+        # task scheduler
+
+        @self._route("GET", r"/scheduler/tasks", "scheduler.tasks")
+        def scheduler_tasks(query, body):
+            return 200, data.scheduler_tasks
+
+        @self._route("POST", r"/scheduler/tasks", "scheduler.create_task")
+        def scheduler_create_task(query, body):
+            task = {**(body or {}), "id": data.new_id()}
+            data.scheduler_tasks.append(task)
+            return 200, task
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive like the real services
+    # headers and body are separate writes, with nagle the body waits
+    # for the delayed ack of the client on kept-alive connections
+    disable_nagle_algorithm = True
+    fake_services: FakeServices
+
+    def setup(self):
+        super().setup()
+        with self.fake_services.lock:
+            self.fake_services.connection_count += 1
+
+    def _handle(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw_body) if raw_body else None
+        except ValueError:
+            body = None
+        status, response, headers = self.fake_services.dispatch(
+            self.command, url.path.rstrip("/"), query, body
+        )
+        payload = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,90 @@
+"""
+Benchmark of the toggl/reclaim reconciliation on synthetic time entries:
+groupby + linear nearest search vs. the sorted interval matcher
+"""
+import itertools
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from dateutil import tz
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "things2reclaim"))
+
+from reconciliation import Interval, reconcile  # noqa: E402
+
+ENTRY_COUNTS = [1_000, 5_000, 20_000]
+TASK_COUNT = 20
+
+
+def generate(entry_count: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=tz.tzutc())
+    toggl = []
+    reclaim = []
+    for _ in range(entry_count):
+        name = f"Course VL {rng.randrange(TASK_COUNT)}"
+        entry_start = start + timedelta(minutes=rng.randrange(90 * 24 * 60))
+        entry_end = entry_start + timedelta(minutes=rng.randrange(15, 180))
+        toggl.append(Interval(name, entry_start, entry_end, None))
+        shift = timedelta(minutes=rng.choice([0, 0, 5, -10, 30]))
+        reclaim.append(Interval(name, entry_start + shift, entry_end + shift, None))
+    rng.shuffle(reclaim)
+    return toggl, reclaim
+
+
+def groupby_nearest(toggl, reclaim):
+    # what sync_toggl_reclaim_tracking did: groupby on unsorted events
+    # splits the groups, later groups overwrite earlier ones
+    groups = {k: list(g) for k, g in itertools.groupby(reclaim, lambda r: r.name)}
+    return {
+        entry: min(groups[entry.name], key=lambda r: abs(r.start - entry.start))
+        for entry in toggl
+        if entry.name in groups
+    }
+
+
+def sorted_groupby_nearest(toggl, reclaim):
+    # correct grouping, but still a linear search per toggl entry
+    key = lambda r: r.name  # noqa: E731
+    groups = {k: list(g) for k, g in itertools.groupby(sorted(reclaim, key=key), key)}
+    return {
+        entry: min(groups[entry.name], key=lambda r: abs(r.start - entry.start))
+        for entry in toggl
+        if entry.name in groups
+    }
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<40} {(time.perf_counter() - start) * 1000:>10.1f} ms")
+    return result
+
+
+def main():
+    for entry_count in ENTRY_COUNTS:
+        toggl, reclaim = generate(entry_count)
+        print(f"{entry_count} entries per side")
+        unsorted = timed(
+            "groupby + nearest_time_entry", lambda: groupby_nearest(toggl, reclaim)
+        )
+        timed(
+            "sorted groupby + nearest_time_entry",
+            lambda: sorted_groupby_nearest(toggl, reclaim),
+        )
+        plan = timed("reconciliation.reconcile", lambda: reconcile(toggl, reclaim))
+        print(
+            f"  {len(plan.unchanged)} unchanged, {len(plan.adjusts)} adjusts, "
+            f"{len(plan.creates)} creates, {len(plan.deletes)} deletes"
+        )
+        print(
+            "  groupby + nearest_time_entry found a perfect match for "
+            f"{sum(1 for t, r in unsorted.items() if t.start == r.start)} entries"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the report aggregation on a year of stored time entries:
+loading every entry and summing in python vs. the per (name, day) sums
+of the time entry store
+"""
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "things2reclaim"))
+
+from database_handler import TimeEntryRecord, TimeEntryStore  # noqa: E402
+from time_report import TimeReport  # noqa: E402
+
+ENTRY_COUNTS = [5_000, 20_000, 50_000]
+TASK_COUNT = 200
+COURSES = ["Ana", "LinAlg", "DS", "EIDI", "GBS", "ERA", "DWT", "Theo", "GAD", "IN2"]
+YEAR = 365 * 24 * 60 * 60
+
+
+def fill(store: TimeEntryStore, entry_count: int, start: float, seed: int = 0):
+    rng = random.Random(seed)
+    records = []
+    for index in range(entry_count):
+        task = rng.randrange(TASK_COUNT)
+        name = f"{COURSES[task % len(COURSES)]} VL {task}"
+        entry_start = start + rng.uniform(0, YEAR)
+        entry_end = entry_start + rng.randrange(15, 180) * 60
+        data = {"id": index, "description": name, "tags": []}
+        records.append(
+            TimeEntryRecord(str(index), name, entry_start, entry_end, None, data)
+        )
+    store.replace_range("toggl", start, start + YEAR, records)
+
+
+def python_sums(store: TimeEntryStore, start: float):
+    durations = defaultdict(float)
+    for record in store.get_range("toggl", start, start + YEAR):
+        day = date.fromtimestamp(record.start).isoformat()
+        durations[(record.name, day)] += record.end - record.start
+    return sorted(
+        ((name, day, seconds) for (name, day), seconds in durations.items()),
+        key=lambda row: row[1],
+    )
+
+
+def main():
+    start = datetime(2024, 1, 1).timestamp()
+    estimates = {
+        f"{COURSES[task % len(COURSES)]} VL {task}": 2.0 for task in range(TASK_COUNT)
+    }
+    print(f"{'entries':>8} {'python (ms)':>12} {'sqlite (ms)':>12}")
+    for entry_count in ENTRY_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with TimeEntryStore(Path(tmp_dir) / "db.sqlite") as store:
+                fill(store, entry_count, start)
+                timings = []
+                for aggregate in (
+                    lambda: python_sums(store, start),
+                    lambda: store.get_daily_durations("toggl", start, start + YEAR),
+                ):
+                    begin = time.perf_counter()
+                    report = TimeReport(estimates, aggregate())
+                    report.to_dict()
+                    timings.append(time.perf_counter() - begin)
+        print(
+            f"{entry_count:>8} {timings[0] * 1000:>12.1f} {timings[1] * 1000:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
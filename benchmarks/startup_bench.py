@@ -0,0 +1,50 @@
+"""
+Startup benchmark: `main.py --help` has to print without any network access
+and without reading the config files
+"""
+import contextlib
+import io
+import runpy
+import socket
+import sys
+import time
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).parent.parent / "things2reclaim"
+
+connection_attempts = []
+
+
+def refuse_connection(*args, **kwargs):
+    connection_attempts.append(args)
+    raise OSError("network access during startup")
+
+
+def run_help() -> float:
+    sys.path.insert(0, str(PACKAGE_DIR))
+    sys.argv = ["main.py", "--help"]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            runpy.run_path(str(PACKAGE_DIR / "main.py"), run_name="__main__")
+        except SystemExit as e:
+            if e.code not in (0, None):
+                raise
+    return time.perf_counter() - start
+
+
+def main():
+    socket.socket.connect = refuse_connection
+    socket.create_connection = refuse_connection
+    socket.getaddrinfo = refuse_connection
+
+    elapsed = run_help()
+    print(f"main.py --help took {elapsed * 1000:.1f} ms")
+    assert not connection_attempts, (
+        f"{len(connection_attempts)} network calls during startup"
+    )
+    print("No network calls during startup")
+
+
+if __name__ == "__main__":
+    main()
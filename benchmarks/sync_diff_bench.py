@@ -0,0 +1,61 @@
+"""
+Benchmark of the upload bookkeeping with 10k synthetic things tasks:
+list membership vs. set diffing and per row commits vs. one executemany
+"""
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "things2reclaim"))
+
+import sync_diff  # noqa: E402
+from database_handler import UploadedTasksDB  # noqa: E402
+
+TASK_COUNT = 10_000
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<40} {(time.perf_counter() - start) * 1000:>10.1f} ms")
+    return result
+
+
+def main():
+    things_ids = [str(uuid.uuid4()) for _ in range(TASK_COUNT)]
+    # half of the tasks are already uploaded, some uploaded ones got deleted
+    uploaded_ids = things_ids[: TASK_COUNT // 2] + [
+        str(uuid.uuid4()) for _ in range(TASK_COUNT // 10)
+    ]
+    tasks = [{"uuid": things_id} for things_id in things_ids]
+
+    by_list = timed(
+        "list membership",
+        lambda: [task for task in tasks if task["uuid"] not in uploaded_ids],
+    )
+    by_set = timed(
+        "sync_diff.diff_ids",
+        lambda: sync_diff.select(
+            tasks,
+            sync_diff.diff_ids(things_ids, uploaded_ids).new,
+            lambda task: task["uuid"],
+        ),
+    )
+    assert by_list == by_set
+
+    new_ids = [task["uuid"] for task in by_set]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with UploadedTasksDB(Path(tmp_dir) / "per_row.db") as db:
+            timed(
+                "add_uploaded_task per row",
+                lambda: [db.add_uploaded_task(task_id) for task_id in new_ids],
+            )
+        with UploadedTasksDB(Path(tmp_dir) / "bulk.db") as db:
+            timed("add_uploaded_tasks", lambda: db.add_uploaded_tasks(new_ids))
+            timed("remove_uploaded_tasks", lambda: db.remove_uploaded_tasks(new_ids))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark of per task Things queries vs. the bulk read path
+on a generated Things database with 5k to-dos
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "things2reclaim"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from things_fixture import create_things_database  # noqa: E402
+
+TASK_COUNT = 5_000
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<40} {(time.perf_counter() - start) * 1000:>10.1f} ms")
+    return result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path = Path(tmp_dir) / "main.sqlite"
+        task_ids = create_things_database(database_path, TASK_COUNT)
+        os.environ["THINGSDB"] = str(database_path)
+
+        import things  # noqa: E402
+        import things_handler  # noqa: E402
+
+        def per_project():
+            tasks = []
+            for project in things_handler.extract_uni_projects():
+                tasks += things_handler.get_tasks_for_project(project)
+            return tasks
+
+        per_project_tasks = timed("things.tasks per project", per_project)
+        uni_tasks = timed("get_uni_tasks", things_handler.get_uni_tasks)
+        assert {task["uuid"] for task in per_project_tasks} == {
+            task["uuid"] for task in uni_tasks
+        }
+
+        per_id_tasks = timed(
+            "things.get per id", lambda: [things.get(task_id) for task_id in task_ids]
+        )
+        bulk_tasks = timed(
+            "get_tasks_bulk", lambda: things_handler.get_tasks_bulk(task_ids)
+        )
+        assert [task["tags"] for task in per_id_tasks] == [
+            task["tags"] for task in bulk_tasks
+        ]
+
+
+if __name__ == "__main__":
+    main()
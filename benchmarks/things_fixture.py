@@ -0,0 +1,122 @@
+"""
+Generates a SQLite file with the parts of the Things 3 schema that things.py reads
+"""
+import plistlib
+import random
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+SCHEMA = [
+    """CREATE TABLE TMTask (
+        uuid TEXT PRIMARY KEY,
+        type INTEGER,
+        trashed INTEGER,
+        title TEXT,
+        status INTEGER,
+        area TEXT,
+        project TEXT,
+        heading TEXT,
+        notes TEXT,
+        start INTEGER,
+        startDate INTEGER,
+        deadline INTEGER,
+        reminderTime INTEGER,
+        stopDate REAL,
+        creationDate REAL,
+        userModificationDate REAL,
+        "index" INTEGER,
+        todayIndex INTEGER,
+        rt1_recurrenceRule BLOB,
+        deadlineSuppressionDate INTEGER
+    )""",
+    'CREATE TABLE TMArea (uuid TEXT PRIMARY KEY, title TEXT, "index" INTEGER)',
+    'CREATE TABLE TMTag (uuid TEXT PRIMARY KEY, title TEXT, shortcut TEXT, "index" INTEGER)',
+    "CREATE TABLE TMTaskTag (tasks TEXT, tags TEXT)",
+    "CREATE TABLE TMAreaTag (areas TEXT, tags TEXT)",
+    """CREATE TABLE TMChecklistItem (
+        uuid TEXT PRIMARY KEY, task TEXT, title TEXT, status INTEGER,
+        stopDate REAL, creationDate REAL, userModificationDate REAL, "index" INTEGER
+    )""",
+    "CREATE TABLE Meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE INDEX index_TMTask_project ON TMTask(project)",
+    "CREATE INDEX index_TMTask_area ON TMTask(area)",
+    "CREATE INDEX index_TMTask_heading ON TMTask(heading)",
+    "CREATE INDEX index_TMTaskTag_tasks ON TMTaskTag(tasks)",
+]
+
+COURSES = ["Ana", "LinAlg", "DS", "EIDI", "GBS", "ERA", "DWT", "Theo", "GAD", "IN2"]
+ESTIMATES = ["30 min", "1 h", "1.5 h", "2 h", "45 min"]
+
+
+def things_date(year: int, month: int, day: int) -> int:
+    # YYYYYYYYYYYMMMMDDDDD0000000 in binary
+    return (year << 16) | (month << 12) | (day << 7)
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:22]
+
+
+def create_things_database(path: Path, task_count: int, seed: int = 0) -> List[str]:
+    """
+    Creates a Uni area with one project per course and task_count open to-dos
+    spread over the projects. Returns the uuids of the to-dos
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    with conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.execute(
+            "INSERT INTO Meta VALUES('databaseVersion', ?)",
+            (plistlib.dumps(26).decode(),),
+        )
+        area_id = new_id()
+        conn.execute("INSERT INTO TMArea VALUES(?, 'Uni', 0)", (area_id,))
+        tag_ids = {}
+        for index, estimate in enumerate(ESTIMATES):
+            tag_ids[estimate] = new_id()
+            conn.execute(
+                "INSERT INTO TMTag VALUES(?, ?, NULL, ?)",
+                (tag_ids[estimate], f"EstimatedTime: {estimate}", index),
+            )
+        now = time.time()
+        project_ids = []
+        for index, course in enumerate(COURSES):
+            project_ids.append(new_id())
+            conn.execute(
+                """INSERT INTO TMTask(uuid, type, trashed, title, status, area,
+                start, creationDate, userModificationDate, "index", todayIndex)
+                VALUES(?, 1, 0, ?, 0, ?, 1, ?, ?, ?, 0)""",
+                (project_ids[-1], course, area_id, now, now, index),
+            )
+        task_ids = []
+        rows = []
+        tag_rows = []
+        for index in range(task_count):
+            task_ids.append(new_id())
+            deadline = things_date(2024, rng.randint(1, 12), rng.randint(1, 28))
+            rows.append(
+                (
+                    task_ids[-1],
+                    f"VL {index}",
+                    rng.choice(project_ids),
+                    deadline,
+                    now,
+                    now,
+                    index,
+                )
+            )
+            tag_rows.append((task_ids[-1], tag_ids[rng.choice(ESTIMATES)]))
+        conn.executemany(
+            """INSERT INTO TMTask(uuid, type, trashed, title, status, project,
+            start, deadline, creationDate, userModificationDate, "index", todayIndex)
+            VALUES(?, 0, 0, ?, 0, ?, 1, ?, ?, ?, ?, 0)""",
+            rows,
+        )
+        conn.executemany("INSERT INTO TMTaskTag VALUES(?, ?)", tag_rows)
+    conn.close()
+    return task_ids
@@ -0,0 +1,100 @@
+"""
+Benchmark of the shared toggl session: requests vs. new connections of
+`tracking 90` and of a toggl call sequence over 90 days of time entries,
+once with the pooled session and once with a new session per call like
+toggl_python creates for every repository
+"""
+from datetime import datetime, timedelta, timezone
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "things2reclaim"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_services import COURSES, FakeServices, generate_dataset  # noqa: E402
+
+ENTRY_COUNT = 2_000
+DAYS = 90
+DETAIL_COUNT = 50  # time entries fetched one by one
+# getters holding a toggl session, cleared before every call for the baseline
+SESSION_GETTERS = [
+    "get_http_client",
+    "get_workspaces",
+    "get_time_entries",
+    "get_time_entry_editor",
+]
+
+
+def add_history(services: FakeServices, seed: int = 0):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    for index in range(ENTRY_COUNT):
+        course = rng.choice(COURSES)
+        start = now - timedelta(days=rng.uniform(0, DAYS - 1))
+        end = start + timedelta(minutes=rng.randrange(15, 180))
+        services.dataset.add_toggl_entry(f"{course} VL {index}", course, start, end)
+
+
+def reset_sessions():
+    import toggl_handler
+
+    for getter in SESSION_GETTERS:
+        getattr(toggl_handler, getter).cache_clear()
+
+
+def toggl_calls(new_session_per_call: bool):
+    import toggl_handler
+
+    def call(func, *args):
+        if new_session_per_call:
+            reset_sessions()
+        return func(*args)
+
+    entries = call(toggl_handler.get_time_entries_since, DAYS)
+    call(toggl_handler.get_current_time_entry)
+    call(toggl_handler.get_tags)
+    for entry in entries[:DETAIL_COUNT]:
+        call(toggl_handler.get_time_entry, entry.id)
+
+
+def measure(label: str, services: FakeServices, func):
+    reset_sessions()
+    services.request_counts.clear()
+    services.connection_count = 0
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    requests = sum(services.request_counts.values())
+    print(
+        f"{label:<36} {requests:>8} {services.connection_count:>11} "
+        f"{elapsed * 1000:>10.1f}"
+    )
+
+
+def run_tracking():
+    from typer.testing import CliRunner
+
+    import main
+
+    result = CliRunner().invoke(main.app, ["tracking", str(DAYS)])
+    if result.exit_code != 0:
+        print(f"tracking failed: {result.exception!r}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeServices(
+        generate_dataset(100, tracked_share=1.0)
+    ) as services:
+        add_history(services)
+        services.install(Path(tmp_dir) / "config", Path(tmp_dir) / "db.sqlite")
+        print(f"{'':<36} {'requests':>8} {'connections':>11} {'ms':>10}")
+        measure("tracking 90", services, run_tracking)
+        measure("toggl calls, session per call", services, lambda: toggl_calls(True))
+        measure("toggl calls, shared session", services, lambda: toggl_calls(False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import asyncio
+import time
+
+from things2reclaim import async_handler
+
+
+async def delayed(value, delay):
+    await asyncio.to_thread(time.sleep, delay)
+    return value
+
+
+def test_gather_overlaps_calls_and_keeps_order():
+    start = time.perf_counter()
+    results = async_handler.gather(delayed("slow", 0.2), delayed("fast", 0.1))
+    assert results == ["slow", "fast"]
+    assert time.perf_counter() - start < 0.3
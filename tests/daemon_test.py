@@ -0,0 +1,66 @@
+import threading
+import time
+
+from things2reclaim import daemon
+
+
+def wait_for_socket(socket_path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not socket_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_handle_captures_output(tmp_path):
+    server = daemon.Daemon(lambda: None, {"echo": print}, socket_path=tmp_path / "d")
+    assert server.handle("echo", {}) == {"ok": True, "output": "\n"}
+
+
+def test_handle_fails_on_prompt(tmp_path):
+    server = daemon.Daemon(lambda: None, {"ask": input}, socket_path=tmp_path / "d")
+    for response in (server.handle("ask", {}), server.handle("unknown", {})):
+        assert not response["ok"]
+        assert response["run_locally"]
+
+
+def test_failures_are_not_run_locally(tmp_path):
+    def write_then_fail():
+        print("Created task")
+        raise ValueError("connection lost")
+
+    server = daemon.Daemon(
+        lambda: None, {"fail": write_then_fail}, socket_path=tmp_path / "d"
+    )
+    assert server.handle("fail", {}) == {
+        "ok": False,
+        "run_locally": False,
+        "error": "connection lost",
+        "output": "Created task\n",
+    }
+
+
+def test_serve_answers_requests_between_cycles(tmp_path):
+    socket_path = tmp_path / "d.sock"
+    cycled = threading.Event()
+    server = daemon.Daemon(
+        cycled.set,
+        {"greet": lambda name: print(f"Hello {name}")},
+        interval=0.01,
+        jitter=0,
+        socket_path=socket_path,
+    )
+    responses = []
+
+    def client():
+        cycled.wait(5)
+        wait_for_socket(socket_path)
+        responses.append(daemon.send_request("greet", {"name": "Ana"}, socket_path))
+        server.stop()
+
+    client_thread = threading.Thread(target=client)
+    client_thread.start()
+    server.serve()
+    client_thread.join()
+
+    assert responses == [{"ok": True, "output": "Hello Ana\n"}]
+    assert not socket_path.exists()
+    assert daemon.send_request("greet", {"name": "Ana"}, socket_path) is None
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import sqlite3
+
+from pytest import fixture
+
+from things2reclaim.database_handler import (
+    MIGRATIONS,
+    STATUS_FAILED,
+    SyncState,
+    TimeEntryRecord,
+    TimeEntryStore,
+    UploadedTasksDB,
+)
+
+@fixture
+def db(tmp_path):
+    with UploadedTasksDB(tmp_path / "test.db") as db:
+        yield db
+
+@fixture
+def reclaim_tasks():
+    return [{"id": 1, "title": "Ana VL 1"}, {"id": 2, "title": "Ana VL 2"}]
+
+def test_empty_reclaim_cache(db):
+    assert db.get_cached_reclaim_tasks(max_age=300) is None
+
+def test_fresh_reclaim_cache(db, reclaim_tasks):
+    db.store_reclaim_tasks(reclaim_tasks)
+    assert db.get_cached_reclaim_tasks(max_age=300) == reclaim_tasks
+
+def test_expired_reclaim_cache(db, reclaim_tasks):
+    db.store_reclaim_tasks(reclaim_tasks)
+    assert db.get_cached_reclaim_tasks(max_age=-1) is None
+
+def test_invalidated_reclaim_cache(db, reclaim_tasks):
+    db.store_reclaim_tasks(reclaim_tasks)
+    db.invalidate_reclaim_tasks()
+    assert db.get_cached_reclaim_tasks(max_age=300) is None
+
+def test_bulk_add_uploaded_tasks(db):
+    db.add_uploaded_tasks(["a", "b", "c"])
+    assert db.get_all_uploaded_tasks() == ["a", "b", "c"]
+
+def test_bulk_remove_uploaded_tasks(db):
+    db.add_uploaded_tasks(["a", "b", "c"])
+    db.remove_uploaded_tasks(["a", "c"])
+    assert db.get_all_uploaded_tasks() == ["b"]
+
+def test_cached_value(db):
+    db.store_cached_value("toggl_tags", ["Vorlesung", "Übung"])
+    assert db.get_cached_value("toggl_tags", max_age=300) == ["Vorlesung", "Übung"]
+    assert db.get_cached_value("toggl_tags", max_age=-1) is None
+
+def test_tag_choice(db):
+    assert db.get_tag_choice("Ana VL 3") is None
+    db.store_tag_choice("Ana VL 3", "Vorlesung")
+    assert db.get_tag_choice("Ana VL 3") == "Vorlesung"
+
+def test_payloads_of_uploaded_tasks(db):
+    db.add_uploaded_tasks(["a", "b"])
+    db.store_payloads({"a": ("f1", {"title": "Ana VL 1"})})
+    assert db.get_fingerprints() == {"a": "f1", "b": None}
+    assert db.get_payload("a") == {"title": "Ana VL 1"}
+    assert db.get_payload("b") is None
+
+def test_payload_columns_are_added(tmp_path):
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute(
+        """CREATE TABLE uploaded_tasks (
+            id integer primary key,
+            things_task_id varchar(36) NOT NULL UNIQUE
+        )"""
+    )
+    conn.execute("INSERT INTO uploaded_tasks(things_task_id) VALUES('a')")
+    conn.commit()
+    conn.close()
+    with UploadedTasksDB(tmp_path / "old.db") as db:
+        assert db.get_fingerprints() == {"a": None}
+
+def test_schema_is_migrated_once(tmp_path):
+    with UploadedTasksDB(tmp_path / "test.db") as db:
+        conn = db.conn
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with UploadedTasksDB(tmp_path / "test.db") as db:
+        assert db.conn is conn
+
+def test_threads_get_own_connections(tmp_path):
+    with UploadedTasksDB(tmp_path / "test.db") as db:
+        conn = db.conn
+
+    def add_task(task_id):
+        with UploadedTasksDB(tmp_path / "test.db") as db:
+            db.add_uploaded_task(task_id)
+            return db.conn
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        connections = list(executor.map(add_task, map(str, range(8))))
+    assert all(thread_conn is not conn for thread_conn in connections)
+    with UploadedTasksDB(tmp_path / "test.db") as db:
+        assert sorted(db.get_all_uploaded_tasks()) == sorted(map(str, range(8)))
+
+def test_reclaim_task_id_mapping(db):
+    db.add_uploaded_tasks(["a", "b"], {"a": 11})
+    db.store_reclaim_task_ids({"b": 12})
+    assert db.get_reclaim_task_ids() == {"a": 11, "b": 12}
+
+def test_failed_status(db):
+    db.add_uploaded_tasks(["a", "b"])
+    db.set_status(["a"], STATUS_FAILED)
+    assert db.get_task_ids_with_status(STATUS_FAILED) == ["a"]
+    db.store_payloads({"a": ("f1", {})})
+    assert db.get_task_ids_with_status(STATUS_FAILED) == []
+
+def test_time_entry_store(tmp_path):
+    with TimeEntryStore(tmp_path / "test.db") as store:
+        store.upsert(
+            "toggl",
+            [
+                TimeEntryRecord("1", "Ana VL 1", 10.0, 20.0, None, {"id": 1}),
+                TimeEntryRecord("2", "Ana VL 2", 30.0, 40.0, None, {"id": 2}),
+                TimeEntryRecord("3", "Ana VL 1", 50.0, None, None, {"id": 3}),
+            ],
+        )
+        store.replace_range(
+            "toggl", 25.0, 60.0, [TimeEntryRecord("4", "DS VL 1", 35.0, 45.0, None, {})]
+        )
+        assert [record.id for record in store.get_range("toggl", 0, 100)] == ["1", "4"]
+        assert store.get_range("toggl", 0, 100, name="DS VL 1")[0].end == 45.0
+        assert store.get_range("reclaim", 0, 100) == []
+        day = date.fromtimestamp(0).isoformat()
+        assert store.get_daily_durations("toggl", 0, 100) == [
+            ("Ana VL 1", day, 10.0),
+            ("DS VL 1", day, 10.0),
+        ]
+
+        assert store.get_sync_state("toggl") is None
+        store.store_sync_state("toggl", SyncState(0.0, 100.0, 100.0))
+        assert store.get_sync_state("toggl") == SyncState(0.0, 100.0, 100.0)
+        store.clear_sync_states()
+        assert store.get_sync_state("toggl") is None
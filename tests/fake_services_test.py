@@ -0,0 +1,151 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from pytest import fixture, raises
+from reclaim_sdk.client import ReclaimClient
+
+from benchmarks.fake_services import (
+    FakeServices,
+    Faults,
+    generate_dataset,
+    reset_client_caches,
+)
+from things2reclaim import reclaim_handler, time_entry_sync, toggl_handler, worker_pool
+
+HOUR = timedelta(hours=1)
+
+
+@fixture
+def services(tmp_path, monkeypatch):
+    monkeypatch.delenv("THINGS2RECLAIM_CONFIG_DIR", raising=False)
+    with FakeServices(generate_dataset(20, tracked_share=1.0)) as services:
+        services.install(tmp_path / "config", tmp_path / "things2reclaim.db")
+        yield services
+    monkeypatch.delenv("THINGS2RECLAIM_CONFIG_DIR", raising=False)
+    reset_client_caches()
+
+
+def test_reclaim_tasks_round_trip(services):
+    tasks = reclaim_handler.get_reclaim_tasks()
+    assert len(tasks) == 20
+    assert len(reclaim_handler.ReclaimTaskIndex(tasks)) == 20
+
+    created = reclaim_handler.create_reaclaim_task_from_dict(
+        {"name": "Ana VL 99", "description": "things_task:new", "duration": 1.0}
+    )
+    assert created.id in services.dataset.reclaim_tasks
+    reclaim_handler.patch_reclaim_task(
+        created, {"title": "Ana VL 99"}, {"title": "Ana VL 100"}
+    )
+    assert services.dataset.reclaim_tasks[created.id]["title"] == "Ana VL 100"
+    reclaim_handler.finish_task(created)
+    assert services.dataset.reclaim_tasks[created.id]["status"] == "COMPLETE"
+    assert services.request_counts["reclaim.search_tasks"] == 1
+
+
+def test_live_reclaim_tasks_bypass_the_cache(services):
+    reclaim_handler.get_reclaim_tasks()
+    reclaim_handler.get_reclaim_tasks()
+    assert services.request_counts["reclaim.search_tasks"] == 1
+    assert len(reclaim_handler.get_reclaim_tasks(use_cache=False)) == 20
+    assert services.request_counts["reclaim.search_tasks"] == 2
+
+def test_toggl_time_entries(services):
+    entries = toggl_handler.get_time_entries_since(since_days=14)
+    assert len(entries) == 20
+    assert toggl_handler.get_current_time_entry() is None
+    assert set(toggl_handler.get_project_dict()) >= {"Ana", "DS"}
+
+
+def test_injected_errors_are_retried(services):
+    services.faults = Faults(error_rate=0.5)
+
+    def fetch():
+        reclaim_handler.invalidate_task_cache()
+        return len(reclaim_handler.get_reclaim_tasks())
+
+    for _ in range(4):
+        assert worker_pool.retry_with_backoff(fetch, retries=20, base_delay=0.001) == 20
+    assert services.fault_counts[503] > 0
+
+
+def test_rate_limit(services):
+    services.faults = Faults(rate_limit=1.0)
+    services.tokens = 0
+    with raises(Exception):
+        toggl_handler.get_tags()
+    assert services.fault_counts[429] == 1
+
+
+def test_iter_time_entries_streams_long_ranges_in_order(services):
+    now = datetime.now(timezone.utc)
+    for days in range(0, 200, 3):
+        start = now - timedelta(days=days, hours=1)
+        services.dataset.add_toggl_entry("Ana VL 1", "Ana", start, start + HOUR)
+    entries = list(
+        toggl_handler.iter_time_entries(
+            (now - timedelta(days=200)).date(),
+            (now + timedelta(days=1)).date(),
+            window_days=30,
+            concurrency=2,
+        )
+    )
+    starts = [toggl_handler.get_start_time(entry) for entry in entries]
+    assert len(entries) == len(services.dataset.toggl_entries)
+    assert starts == sorted(starts)
+    assert services.request_counts["toggl.time_entries"] == 7
+
+
+def test_get_windows():
+    windows = toggl_handler.get_windows(date(2024, 1, 1), date(2024, 3, 1), 30)
+    assert windows == [
+        (date(2024, 1, 1), date(2024, 1, 31)),
+        (date(2024, 1, 31), date(2024, 3, 1)),
+    ]
+
+
+def test_time_entry_sync_fetches_changes_only(services):
+    today = datetime.now().date()
+    from_date, to_date = today - timedelta(days=14), today + timedelta(days=1)
+    entries = time_entry_sync.get_time_entries(from_date, to_date)
+    assert len(entries) == 20
+
+    services.request_counts.clear()
+    assert time_entry_sync.get_time_entries(from_date, to_date) == entries
+    assert sum(services.request_counts.values()) == 1
+
+    # deleted in another toggl client
+    deleted = services.dataset.toggl_entries[entries[0].id]
+    services.dataset.touch_toggl_entry(deleted)
+    deleted["server_deleted_at"] = deleted["at"]
+    services.request_counts.clear()
+    entries = time_entry_sync.get_time_entries(from_date, to_date)
+    assert len(entries) == 19
+    assert sum(services.request_counts.values()) == 1
+
+    services.request_counts.clear()
+    time_entry_sync.get_time_entries(from_date - timedelta(days=7), to_date)
+    assert services.request_counts["toggl.time_entries"] == 2
+
+
+def test_reclaim_client_is_initialized_once(services):
+    client = reclaim_handler.get_client()
+    transport = client._transport
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: ReclaimClient(), range(32)))
+    assert all(other is client for other in clients)
+    assert client._transport is transport
+    assert client.headers["Authorization"].startswith("Bearer ")
+
+
+def test_time_entry_sync_stores_long_ranges_window_by_window(services):
+    now = datetime.now(timezone.utc)
+    for days in range(0, 200, 3):
+        start = now - timedelta(days=days, hours=1)
+        services.dataset.add_toggl_entry("Ana VL 1", "Ana", start, start + HOUR)
+    today = datetime.now().date()
+    entries = time_entry_sync.get_time_entries(
+        today - timedelta(days=200), today + timedelta(days=1)
+    )
+    assert len(entries) == len(services.dataset.toggl_entries)
+    assert services.request_counts["toggl.time_entries"] == 7
@@ -0,0 +1,64 @@
+import json
+import types
+
+from pytest import raises
+
+from things2reclaim import instrumentation
+
+
+def make_module():
+    module = types.ModuleType("fake_handler")
+
+    def outer():
+        return module.inner() + 1
+
+    def inner():
+        return 1
+
+    def failing():
+        raise ValueError("failed")
+
+    for func in (outer, inner, failing):
+        func.__module__ = module.__name__
+        setattr(module, func.__name__, func)
+    return module
+
+
+def test_nested_calls_of_a_layer_are_recorded_once():
+    registry = instrumentation.registry
+    registry.clear()
+    module = make_module()
+    original = module.outer
+    instrumentation.instrument_module(module, "fake")
+    try:
+        assert module.outer() == 2
+        assert module.inner() == 1
+        with raises(ValueError):
+            module.failing()
+    finally:
+        instrumentation.disable()
+    assert module.outer is original
+    metrics = registry.metrics
+    assert metrics[("fake", "outer")].count == 1
+    assert metrics[("fake", "inner")].count == 1
+    assert metrics[("fake", "failing")].errors == 1
+    registry.clear()
+
+
+def test_export_formats(tmp_path):
+    registry = instrumentation.Registry()
+    registry.record("reclaim", "get_reclaim_tasks", 0.02)
+    registry.record("reclaim", "get_reclaim_tasks", 3.0, error=True, nbytes=10)
+
+    metric = json.loads(registry.to_json("list"))["calls"][0]
+    assert metric["count"] == 2
+    assert metric["errors"] == 1
+    assert metric["bytes"] == 10
+    assert metric["buckets"]["0.025"] == 1
+    assert metric["buckets"]["+Inf"] == 2
+
+    text = registry.to_prometheus("list")
+    labels = 'layer="reclaim",call="get_reclaim_tasks",command="list"'
+    assert f'things2reclaim_call_duration_seconds_bucket{{{labels},le="5"}} 2' in text
+    assert f"things2reclaim_call_duration_seconds_count{{{labels}}} 2" in text
+    assert "# EOF" not in text and "# UNIT" not in text
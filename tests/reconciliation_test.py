@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from dateutil import tz
+from pytest import fixture
+
+from things2reclaim.reconciliation import Interval, reconcile
+
+@fixture
+def start_datetime():
+    return datetime(2023, 11, 13, 17, 54, 0, tzinfo=tz.gettz())
+
+def interval(name, start, hours=1.0):
+    return Interval(name, start, start + timedelta(hours=hours), None)
+
+def test_matching_entries_are_unchanged(start_datetime):
+    plan = reconcile([interval("A", start_datetime)], [interval("A", start_datetime)])
+    assert len(plan.unchanged) == 1
+    assert not plan.adjusts and not plan.creates and not plan.deletes
+
+def test_shifted_entry_is_adjusted(start_datetime):
+    toggl = interval("A", start_datetime)
+    reclaim = interval("A", start_datetime - timedelta(minutes=15))
+    plan = reconcile([toggl], [reclaim])
+    assert [(a.toggl, a.reclaim) for a in plan.adjusts] == [(toggl, reclaim)]
+    assert plan.adjusts[0].overlap == timedelta(minutes=45)
+
+def test_unsorted_reclaim_events_are_grouped(start_datetime):
+    days = [start_datetime + timedelta(days=day) for day in range(3)]
+    reclaim = [interval("A", days[2]), interval("B", days[0]), interval("A", days[0])]
+    toggl = [interval("A", day) for day in days[:1]] + [interval("A", days[2])]
+    plan = reconcile(toggl, reclaim)
+    assert len(plan.unchanged) == 2
+    assert [interval.name for interval in plan.deletes] == ["B"]
+
+def test_entries_without_counterpart(start_datetime):
+    plan = reconcile([interval("A", start_datetime)], [interval("B", start_datetime)])
+    assert [interval.name for interval in plan.creates] == ["A"]
+    assert [interval.name for interval in plan.deletes] == ["B"]
+
+def test_reclaim_event_is_matched_once(start_datetime):
+    toggl = [
+        interval("A", start_datetime),
+        interval("A", start_datetime + timedelta(minutes=5)),
+    ]
+    reclaim = [interval("A", start_datetime)]
+    plan = reconcile(toggl, reclaim)
+    assert len(plan.unchanged) == 1
+    assert plan.creates == [toggl[1]]
+
+def test_best_overlap_wins(start_datetime):
+    toggl = interval("A", start_datetime, hours=3)
+    before = interval("A", start_datetime - timedelta(minutes=10), hours=3)
+    after = interval("A", start_datetime + timedelta(minutes=5), hours=0.25)
+    plan = reconcile([toggl], [after, before])
+    assert plan.adjusts[0].reclaim == before
+    assert plan.deletes == [after]
+
+def test_max_start_distance(start_datetime):
+    toggl = interval("A", start_datetime)
+    reclaim = interval("A", start_datetime + timedelta(days=2))
+    plan = reconcile([toggl], [reclaim], max_start_distance=timedelta(hours=12))
+    assert plan.creates == [toggl]
+    assert plan.deletes == [reclaim]
@@ -0,0 +1,17 @@
+from things2reclaim import sync_diff
+
+def test_diff_ids():
+    diff = sync_diff.diff_ids(["a", "b", "c"], ["b", "c", "d"])
+    assert diff.new == {"a"}
+    assert diff.removed == {"d"}
+    assert diff.common == {"b", "c"}
+
+def test_diff_ids_with_duplicates():
+    diff = sync_diff.diff_ids(["a", "a"], [])
+    assert diff.new == {"a"}
+    assert diff.removed == set()
+
+def test_select_keeps_order():
+    tasks = [{"uuid": "c"}, {"uuid": "a"}, {"uuid": "b"}]
+    selected = sync_diff.select(tasks, {"a", "c"}, lambda task: task["uuid"])
+    assert selected == [{"uuid": "c"}, {"uuid": "a"}]
@@ -0,0 +1,23 @@
+from pytest import fixture
+
+from things2reclaim.tag_index import TagIndex
+
+@fixture
+def tag_index():
+    return TagIndex(["Vorlesung", "Übung", "Hausaufgabe", "Tutorium"])
+
+def test_abbreviation_is_expanded(tag_index):
+    assert tag_index.match("Ana VL 3") == {"Vorlesung"}
+
+def test_exact_match_ignores_case(tag_index):
+    assert tag_index.match("LinAlg übung 5") == {"Übung"}
+
+def test_fuzzy_match(tag_index):
+    assert tag_index.match("DS Hausaufgaben 2") == {"Hausaufgabe"}
+
+def test_no_match(tag_index):
+    assert tag_index.match("Ana 3") == set()
+
+def test_contains(tag_index):
+    assert "Tutorium" in tag_index
+    assert "Klausur" not in tag_index
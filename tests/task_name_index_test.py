@@ -0,0 +1,34 @@
+from pytest import fixture
+
+from things2reclaim.task_name_index import TaskNameIndex, resolve, tokenize
+
+@fixture
+def names():
+    return ["Ana VL 3", "Ana VL 13", "Ana Übung 3", "LinAlg VL 3", "✅ DS Hausaufgabe 2"]
+
+@fixture
+def index(names):
+    return TaskNameIndex(names)
+
+def test_tokenize_strips_emoji():
+    assert tokenize("✅ DS Hausaufgabe-2") == ["ds", "hausaufgabe", "2"]
+
+def test_numbers_have_to_match(index):
+    assert [name for name, _ in index.search("ana vl 3")][0] == "Ana VL 3"
+    assert "Ana VL 13" not in [name for name, _ in index.search("ana vl 3")]
+
+def test_course_prefix_ranks_first(index):
+    assert index.search("LinAlg VL3")[0][0] == "LinAlg VL 3"
+
+def test_emoji_is_ignored(index):
+    assert index.search("DS Hausaufgabe 2")[0] == ("✅ DS Hausaufgabe 2", 1.0)
+
+def test_persisted_index(index):
+    assert TaskNameIndex.from_dict(index.to_dict()).search("ana vl 13") == index.search(
+        "ana vl 13"
+    )
+
+def test_resolve_single_match(index, names):
+    candidates = {name: name for name in names}
+    assert resolve(index, "Hausaufgabe 2", candidates) == "✅ DS Hausaufgabe 2"
+    assert resolve(index, "Klausur", candidates) is None
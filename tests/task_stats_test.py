@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+from dateutil import tz
+from pytest import fixture
+
+from things2reclaim.task_stats import DeadlineStatus, TaskStats
+
+
+class FakeTask:
+    def __init__(self, name, due_date=None, duration=1.0, scheduled_start_date=None):
+        self.name = name
+        self.due_date = due_date
+        self.duration = duration
+        self.scheduled_start_date = scheduled_start_date
+
+
+@fixture
+def now():
+    return datetime(2024, 5, 6, 12, 0, 0, tzinfo=tz.tzutc())
+
+
+def test_tasks_are_bucketed_by_course_and_deadline(now):
+    tasks = [
+        FakeTask("Ana VL 1", now + timedelta(days=1)),
+        FakeTask("Ana VL 2", now - timedelta(days=1)),
+        FakeTask("DS Übung 1", now + timedelta(days=2), duration=2.0),
+        FakeTask("DS Übung 2"),
+    ]
+    stats = TaskStats(tasks, now)
+    assert stats.courses() == ["Ana", "DS"]
+    assert stats.total("Ana", DeadlineStatus.FINE).count == 1
+    assert stats.total("Ana", DeadlineStatus.OVERDUE).count == 1
+    assert stats.total("DS", DeadlineStatus.NONE).count == 1
+    assert stats.total("DS").duration == 3.0
+    assert stats.total().count == 4
+
+
+def test_tasks_are_bucketed_by_the_longest_course(now):
+    tasks = [
+        FakeTask("Lineare Algebra VL 1"),
+        FakeTask("Lineare Algebra II VL 1"),
+        FakeTask("Lineare Optimierung Übung 1"),
+    ]
+    stats = TaskStats(tasks, now, ["Lineare Algebra", "Lineare Algebra II"])
+    assert stats.courses() == ["Lineare", "Lineare Algebra", "Lineare Algebra II"]
+    assert stats.total("Lineare Algebra").count == 1
+    assert stats.total("Lineare Algebra II").count == 1
+
+
+def test_last_scheduled_and_unscheduled(now):
+    tasks = [
+        FakeTask("Ana VL 1", scheduled_start_date=now + timedelta(days=3)),
+        FakeTask("Ana VL 2", scheduled_start_date=now + timedelta(days=1)),
+        FakeTask("Ana VL 3", duration=None),
+    ]
+    stats = TaskStats(tasks, now)
+    assert stats.total().last_scheduled == now + timedelta(days=3)
+    assert stats.total(scheduled=False).count == 1
+    assert stats.total().duration == 2.0
+
+
+def test_to_dict(now):
+    stats = TaskStats([FakeTask("Ana VL 1", now, scheduled_start_date=now)], now)
+    assert stats.to_dict()["buckets"] == [
+        {
+            "course": "Ana",
+            "deadline_status": "fine",
+            "scheduled": True,
+            "count": 1,
+            "duration": 1.0,
+            "last_scheduled": now.isoformat(),
+        }
+    ]
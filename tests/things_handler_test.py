@@ -0,0 +1,73 @@
+import sqlite3
+import time
+
+from pytest import fixture
+from things.database import Database
+
+from benchmarks.things_fixture import create_things_database
+from things2reclaim import things_handler
+
+@fixture
+def things_db(monkeypatch):
+    """
+    Stand-in for the things database where a task is completed
+    after it was polled a given number of times
+    """
+    polls_until_completed = {}
+
+    def get(task_id):
+        polls_until_completed[task_id] -= 1
+        status = "completed" if polls_until_completed[task_id] <= 0 else "incomplete"
+        return {"uuid": task_id, "status": status}
+
+    monkeypatch.setattr(things_handler.things, "get", get)
+    return polls_until_completed
+
+def test_wait_for_completion(things_db):
+    things_db.update({"a": 1, "b": 3})
+    start = time.monotonic()
+    assert things_handler.wait_for_completion(["a", "b"], initial_delay=0.01) == set()
+    assert time.monotonic() - start < 1
+
+def test_wait_for_completion_timeout(things_db):
+    things_db.update({"a": 1, "b": 1000})
+    assert things_handler.wait_for_completion(
+        ["a", "b"], timeout=0.05, initial_delay=0.01
+    ) == {"b"}
+
+@fixture
+def uni_task_ids(tmp_path, monkeypatch):
+    database_path = tmp_path / "main.sqlite"
+    task_ids = create_things_database(database_path, task_count=50)
+    monkeypatch.setattr(
+        things_handler, "get_database", lambda: Database(filepath=database_path)
+    )
+    return task_ids
+
+def test_get_uni_tasks(uni_task_ids):
+    tasks = things_handler.get_uni_tasks()
+    assert {task["uuid"] for task in tasks} == set(uni_task_ids)
+    assert all(len(things_handler.get_task_tags(task)) == 1 for task in tasks)
+
+def test_get_tasks_bulk(uni_task_ids, monkeypatch):
+    monkeypatch.setattr(things_handler, "MAX_QUERY_PARAMETERS", 7)
+    task_ids = list(reversed(uni_task_ids)) + ["unknown"]
+    tasks = things_handler.get_tasks_bulk(task_ids)
+    assert [task["uuid"] for task in tasks] == task_ids[:-1]
+
+def test_get_uni_tasks_modified_since(uni_task_ids):
+    assert len(things_handler.get_uni_tasks_modified_since(0)) == len(uni_task_ids)
+    assert things_handler.get_uni_tasks_modified_since(time.time() + 60) == []
+
+def test_database_signature_changes_on_write(uni_task_ids, tmp_path):
+    signature = things_handler.get_database_signature()
+    assert things_handler.wait_for_database_change(signature, timeout=0) == signature
+    time.sleep(0.01)
+    conn = sqlite3.connect(tmp_path / "main.sqlite")
+    with conn:
+        conn.execute(
+            "UPDATE TMTask SET title = 'VL 0 (edited)' WHERE uuid = ?",
+            (uni_task_ids[0],),
+        )
+    conn.close()
+    assert things_handler.wait_for_database_change(signature, timeout=1) != signature
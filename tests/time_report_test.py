@@ -0,0 +1,56 @@
+from things2reclaim.time_report import TimeReport
+
+
+def make_report():
+    estimates = {"Ana VL 1": 2.0, "Ana VL 2": 1.0, "DS Übung 1": 4.0}
+    daily_durations = [
+        ("Ana VL 1", "2024-05-06", 3600.0),
+        ("DS Übung 1", "2024-05-06", 1800.0),
+        ("Ana VL 1", "2024-05-07", 7200.0),
+        ("Ana Tutorium", "2024-05-07", 3600.0),
+        ("Lunch", "2024-05-07", 1800.0),
+    ]
+    return TimeReport(estimates, daily_durations, ["Ana", "DS"])
+
+
+def test_tracked_time_per_task_and_course():
+    report = make_report()
+    assert report.courses() == ["Ana", "DS"]
+    assert report.tasks["Ana VL 1"].tracked == 3.0
+    assert report.tasks["Ana VL 1"].ratio == 1.5
+    assert report.tasks["Ana VL 1"].remaining == 0.0
+    assert report.tasks["Ana Tutorium"].ratio is None
+    assert "Lunch" not in report.tasks
+
+    ana = report.total("Ana")
+    assert (ana.estimate, ana.tracked) == (3.0, 4.0)
+    assert report.total().estimate == 7.0
+    assert report.total("DS").remaining == 3.5
+
+
+def test_burn_down_counts_estimated_tasks_only():
+    report = make_report()
+    assert report.burn_down("Ana") == [("2024-05-06", 2.0), ("2024-05-07", 0.0)]
+    assert report.burn_down() == [("2024-05-06", 5.5), ("2024-05-07", 3.5)]
+
+
+def test_to_dict():
+    course = make_report().to_dict()["courses"][1]
+    assert course["course"] == "DS"
+    assert course["ratio"] == 0.125
+    assert course["burn_down"] == [{"day": "2024-05-06", "remaining": 3.5}]
+    assert [task["name"] for task in course["tasks"]] == ["DS Übung 1"]
+
+
+def test_multi_word_courses():
+    report = TimeReport(
+        {"Lineare Algebra VL 1": 2.0},
+        [
+            ("Lineare Algebra VL 1", "2024-05-06", 3600.0),
+            ("Lineare Algebra Tutorium", "2024-05-06", 3600.0),
+            ("Lineare Optimierung VL 1", "2024-05-06", 3600.0),
+        ],
+        ["Lineare Algebra"],
+    )
+    assert report.courses() == ["Lineare Algebra"]
+    assert report.total("Lineare Algebra").tracked == 2.0
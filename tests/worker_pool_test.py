@@ -0,0 +1,65 @@
+import httpx
+from pytest import raises
+
+from things2reclaim import worker_pool
+
+def http_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.app.reclaim.ai/api/tasks")
+    response = httpx.Response(status_code, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+def flaky(failures):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return len(calls)
+
+    return func
+
+def test_retry_on_rate_limit():
+    func = flaky([http_error(429), http_error(503)])
+    assert worker_pool.retry_with_backoff(func, retries=3, base_delay=0) == 3
+
+def test_no_retry_on_client_error():
+    func = flaky([http_error(404)])
+    with raises(httpx.HTTPStatusError):
+        worker_pool.retry_with_backoff(func, retries=3, base_delay=0)
+
+def test_retry_on_wrapped_error():
+    def func():
+        try:
+            raise http_error(500)
+        except httpx.HTTPStatusError:
+            raise ValueError("invalid record")
+
+    assert not worker_pool.is_retryable(ValueError())
+    with raises(ValueError) as exc_info:
+        func()
+    assert worker_pool.is_retryable(exc_info.value)
+
+def test_run_concurrently_collects_errors():
+    def func(item):
+        if item % 2:
+            raise ValueError(item)
+        return item * 10
+
+    results = list(worker_pool.run_concurrently(func, range(6), concurrency=3))
+    assert sorted(r.result for r in results if r.error is None) == [0, 20, 40]
+    assert sorted(r.item for r in results if r.error is not None) == [1, 3, 5]
+
+def test_creates_are_not_retried_after_the_request_was_sent():
+    request = httpx.Request("POST", "https://api.app.reclaim.ai/api/tasks")
+    assert worker_pool.is_retryable_create(http_error(429))
+    assert worker_pool.is_retryable_create(httpx.ConnectError("refused"))
+    assert not worker_pool.is_retryable_create(http_error(503))
+    assert not worker_pool.is_retryable_create(
+        httpx.ReadTimeout("timeout", request=request)
+    )
+    func = flaky([httpx.ReadTimeout("timeout", request=request)])
+    with raises(httpx.ReadTimeout):
+        worker_pool.retry_with_backoff(
+            func, base_delay=0, retryable=worker_pool.is_retryable_create
+        )
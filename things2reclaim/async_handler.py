@@ -0,0 +1,51 @@
+import asyncio
+from datetime import date
+from typing import Any, Awaitable, List, Optional
+
+from reclaim_sdk.models.task import ReclaimTask
+from reclaim_sdk.models.task_event import ReclaimTaskEvent
+from toggl_python.entities import TimeEntry
+
+import reclaim_handler
+import time_entry_sync
+import toggl_handler
+
+
+def gather(*calls: Awaitable) -> List[Any]:
+    """
+    Runs the calls concurrently from synchronous code,
+    returns their results in the given order
+    """
+
+    async def run():
+        return await asyncio.gather(*calls)
+
+    return asyncio.run(run())
+
+
+# the sdks are synchronous, every call runs on a worker thread and the
+# clients share their connection pools between the threads
+
+
+async def get_reclaim_tasks(use_cache: bool = True) -> List[ReclaimTask]:
+    return await asyncio.to_thread(reclaim_handler.get_reclaim_tasks, use_cache)
+
+
+async def get_reclaim_task_fuzzy(task_name: str) -> Optional[ReclaimTask]:
+    return await asyncio.to_thread(reclaim_handler.get_reclaim_task_fuzzy, task_name)
+
+
+async def get_current_time_entry() -> Optional[TimeEntry]:
+    return await asyncio.to_thread(toggl_handler.get_current_time_entry)
+
+
+async def get_stored_time_entries(from_date: date, to_date: date) -> List[TimeEntry]:
+    return await asyncio.to_thread(
+        time_entry_sync.get_time_entries, from_date, to_date
+    )
+
+
+async def get_stored_task_events(
+    from_date: date, to_date: date
+) -> List[ReclaimTaskEvent]:
+    return await asyncio.to_thread(time_entry_sync.get_task_events, from_date, to_date)
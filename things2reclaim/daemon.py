@@ -0,0 +1,184 @@
+from contextlib import redirect_stdout
+import io
+import json
+import os
+from pathlib import Path
+import random
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import utils
+
+DEFAULT_INTERVAL = 300  # seconds between two sync cycles
+DEFAULT_JITTER = 30  # maximal random offset of a cycle in seconds
+REQUEST_TIMEOUT = 30  # a request waits for a running sync cycle
+
+# set inside the daemon process so commands aren't forwarded to itself
+serving = False
+
+
+def get_daemon_config() -> Dict[str, Any]:
+    return utils.load_config(".things2reclaim.toml").get("daemon", {})
+
+
+def get_socket_path() -> Path:
+    socket_path = get_daemon_config().get("socket")
+    if socket_path is None:
+        return Path(tempfile.gettempdir()) / "things2reclaim.sock"
+    return utils.get_project_root() / socket_path
+
+
+def get_interval() -> float:
+    return get_daemon_config().get("interval", DEFAULT_INTERVAL)
+
+
+def get_jitter() -> float:
+    return get_daemon_config().get("jitter", DEFAULT_JITTER)
+
+
+def next_delay(interval: float, jitter: float) -> float:
+    return max(0.0, interval + random.uniform(-jitter, jitter))
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.daemon.handle(request["command"], request["args"])
+        except (ValueError, KeyError) as e:
+            response = {"ok": False, "error": f"Invalid request: {e}"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, daemon: "Daemon"):
+        self.daemon = daemon
+        super().__init__(str(socket_path), _RequestHandler)
+
+
+class Daemon:
+    """
+    Runs cycle every interval seconds (+- jitter) and answers the handlers
+    over a unix socket in between. Cycles and requests never run at the
+    same time, so both can use the same warm clients and caches
+    """
+
+    def __init__(
+        self,
+        cycle: Callable[[], None],
+        handlers: Dict[str, Callable[..., Any]],
+        interval: float = DEFAULT_INTERVAL,
+        jitter: float = DEFAULT_JITTER,
+        socket_path: Optional[Path] = None,
+    ):
+        self.cycle = cycle
+        self.handlers = {"ping": lambda: None, **handlers}
+        self.interval = interval
+        self.jitter = jitter
+        self.socket_path = socket_path or get_socket_path()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def handle(self, command: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Runs the handler of the command. A failed response has "run_locally"
+        set when the client should run the command itself: the command is
+        unknown or needed a prompt. Any other failure may come after writes
+        to reclaim, toggl or things, so it must not be run a second time
+        """
+        handler = self.handlers.get(command)
+        if handler is None:
+            return {
+                "ok": False,
+                "run_locally": True,
+                "error": f"Unknown command {command}",
+                "output": "",
+            }
+        output = io.StringIO()
+        with self.lock:
+            # prompts can't be answered through the socket, they fail on
+            # the empty stdin and the client runs the command itself
+            stdin = sys.stdin
+            sys.stdin = io.StringIO()
+            try:
+                with redirect_stdout(output):
+                    handler(**args)
+            except EOFError as e:
+                return {
+                    "ok": False,
+                    "run_locally": True,
+                    "error": f"Prompt needs a terminal: {e}",
+                    "output": output.getvalue(),
+                }
+            except (Exception, SystemExit) as e:
+                return {
+                    "ok": False,
+                    "run_locally": False,
+                    "error": str(e) or type(e).__name__,
+                    "output": output.getvalue(),
+                }
+            finally:
+                sys.stdin = stdin
+        return {"ok": True, "output": output.getvalue()}
+
+    def stop(self, *_):
+        self.stopped.set()
+
+    def serve(self):
+        global serving
+        if send_request("ping", {}, self.socket_path) is not None:
+            raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+        self.socket_path.unlink(missing_ok=True)
+        server = _Server(self.socket_path, self)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        previous_handlers = {
+            signum: signal.signal(signum, self.stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        serving = True
+        server_thread.start()
+        utils.pinfo(f"Listening on {self.socket_path}")
+        try:
+            while not self.stopped.is_set():
+                with self.lock:
+                    try:
+                        self.cycle()
+                    except Exception as e:  # keep serving, retry next cycle
+                        utils.perror(f"Sync cycle failed: {e}")
+                self.stopped.wait(next_delay(self.interval, self.jitter))
+        finally:
+            server.shutdown()
+            server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            serving = False
+            utils.pinfo("Daemon stopped")
+
+
+def send_request(
+    command: str, args: Dict[str, Any], socket_path: Optional[Path] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Sends a command to the daemon. Returns None if no daemon is running
+    """
+    socket_path = socket_path or get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(REQUEST_TIMEOUT)
+            client.connect(str(socket_path))
+            request = {"command": command, "args": args}
+            client.sendall(json.dumps(request).encode() + b"\n")
+            with client.makefile("rb") as response:
+                return json.loads(response.readline())
+    except (OSError, ValueError):
+        return None
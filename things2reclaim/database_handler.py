@@ -1,46 +1,503 @@
+import atexit
+import json
+from pathlib import Path
 import sqlite3
-from typing import List
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+
+STATUS_SYNCED = "synced"  # reclaim has the last pushed payload
+STATUS_FAILED = "failed"  # pushing the last change failed, retried by update
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_tables(cursor: sqlite3.Cursor):
+    # also brings databases created before the schema was versioned up to date
+    sql_statements = [
+        """CREATE TABLE IF NOT EXISTS uploaded_tasks (
+            id integer primary key,
+            things_task_id varchar(36) NOT NULL UNIQUE
+        )
+        """,
+        """CREATE TABLE IF NOT EXISTS reclaim_task_cache (
+            id integer primary key,
+            data text NOT NULL
+        )
+        """,
+        """CREATE TABLE IF NOT EXISTS cache_state (
+            name varchar(64) primary key,
+            updated_at real NOT NULL
+        )
+        """,
+        """CREATE TABLE IF NOT EXISTS value_cache (
+            name varchar(64) primary key,
+            data text NOT NULL,
+            updated_at real NOT NULL
+        )
+        """,
+        """CREATE TABLE IF NOT EXISTS tag_choices (
+            description text primary key,
+            tag text NOT NULL
+        )
+        """,
+    ]
+    for statement in sql_statements:
+        cursor.execute(statement)
+    _add_column(cursor, "uploaded_tasks", "fingerprint", "text")
+    _add_column(cursor, "uploaded_tasks", "payload", "text")
+
+
+def _add_mapping_columns(cursor: sqlite3.Cursor):
+    _add_column(cursor, "uploaded_tasks", "reclaim_task_id", "integer")
+    _add_column(
+        cursor, "uploaded_tasks", "status", f"text NOT NULL DEFAULT '{STATUS_SYNCED}'"
+    )
+    _add_column(cursor, "uploaded_tasks", "created_at", "real")
+    _add_column(cursor, "uploaded_tasks", "updated_at", "real")
+    cursor.execute(
+        """CREATE UNIQUE INDEX IF NOT EXISTS uploaded_tasks_reclaim_task_id
+        ON uploaded_tasks(reclaim_task_id)"""
+    )
+    cursor.execute(
+        """CREATE INDEX IF NOT EXISTS uploaded_tasks_status
+        ON uploaded_tasks(status)"""
+    )
+
+
+def _create_time_entry_tables(cursor: sqlite3.Cursor):
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS time_entries (
+            source varchar(16) NOT NULL,
+            id text NOT NULL,
+            name text NOT NULL,
+            start real NOT NULL,
+            end real,
+            updated_at real,
+            data text NOT NULL,
+            PRIMARY KEY (source, id)
+        )
+        """
+    )
+    cursor.execute(
+        """CREATE INDEX IF NOT EXISTS time_entries_name_start
+        ON time_entries(source, name, start)"""
+    )
+    cursor.execute(
+        """CREATE INDEX IF NOT EXISTS time_entries_start
+        ON time_entries(source, start)"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS time_entry_sync (
+            source varchar(16) primary key,
+            covered_from real NOT NULL,
+            covered_to real NOT NULL,
+            synced_at real NOT NULL
+        )
+        """
+    )
+
+
+# the schema version of a database is the number of migrations applied to it
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _create_tables,
+    _add_mapping_columns,
+    _create_time_entry_tables,
+]
+
+
+def migrate(conn: sqlite3.Connection):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for next_version in range(version + 1, len(MIGRATIONS) + 1):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            MIGRATIONS[next_version - 1](cursor)
+            cursor.execute(f"PRAGMA user_version = {next_version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+# worker threads write concurrently, so every thread gets its own connection,
+# sqlite locks the file between them. A thread's connections are closed when
+# the thread ends and its locals are freed
+_local = threading.local()
+_migrate_lock = threading.Lock()
+
+
+def get_connection(filename) -> sqlite3.Connection:
+    """
+    One connection per database file and thread, opened and migrated on
+    first use and reused by the thread's later UploadedTasksDB and
+    TimeEntryStore
+    """
+    path = str(Path(filename).resolve())
+    connections: Dict[str, sqlite3.Connection] = vars(_local).setdefault(
+        "connections", {}
+    )
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        with _migrate_lock:
+            migrate(conn)
+        connections[path] = conn
+    return conn
+
+
+@atexit.register
+def close_connections():
+    """
+    Closes the connections of the calling thread
+    """
+    connections = vars(_local).pop("connections", {})
+    for conn in connections.values():
+        conn.close()
 
 
 class UploadedTasksDB:
     def __init__(self, filename):
-        self.conn: sqlite3.Connection = sqlite3.connect(filename)
-        self.__create_tables()
+        self.conn: sqlite3.Connection = get_connection(filename)
 
     def __enter__(self):
         return self
 
     def __exit__(self, *exc):
-        self.conn.close()
-
-    def __create_tables(self):
-        sql_statements = [
-            """CREATE TABLE IF NOT EXISTS uploaded_tasks (
-                id integer primary key,
-                things_task_id varchar(36) NOT NULL UNIQUE
-            )
-            """
-        ]
-        cursor = self.conn.cursor()
-        for statement in sql_statements:
-            cursor.execute(statement)
-
-        self.conn.commit()
+        # the connection stays open for the next UploadedTasksDB
+        pass
 
     def add_uploaded_task(self, task_id: str):
-        insert_statement = "INSERT INTO uploaded_tasks(things_task_id) VALUES(?)"
-        cursor = self.conn.cursor()
-        cursor.execute(insert_statement, [task_id])
-        self.conn.commit()
+        self.add_uploaded_tasks([task_id])
+
+    def add_uploaded_tasks(
+        self, task_ids: Iterable[str], reclaim_task_ids: Optional[Dict[str, int]] = None
+    ):
+        insert_statement = """INSERT INTO uploaded_tasks(
+            things_task_id, reclaim_task_id, created_at, updated_at
+        ) VALUES(?, ?, ?, ?)"""
+        reclaim_task_ids = reclaim_task_ids or {}
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                insert_statement,
+                [
+                    (task_id, reclaim_task_ids.get(task_id), now, now)
+                    for task_id in task_ids
+                ],
+            )
 
     def get_all_uploaded_tasks(self) -> List[str]:
         cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM uploaded_tasks")
+        cursor.execute("SELECT things_task_id FROM uploaded_tasks")
         rows = cursor.fetchall()
-        return [things_id for (_, things_id) in rows]
+        return [things_id for (things_id,) in rows]
 
     def remove_uploaded_task(self, task_id: str):
         delete_statement = "DELETE FROM uploaded_tasks WHERE things_task_id = ?"
         cursor = self.conn.cursor()
         cursor.execute(delete_statement, (task_id,))
         self.conn.commit()
+
+    def remove_uploaded_tasks(self, task_ids: Iterable[str]):
+        delete_statement = "DELETE FROM uploaded_tasks WHERE things_task_id = ?"
+        with self.conn:
+            self.conn.executemany(delete_statement, [(task_id,) for task_id in task_ids])
+
+    def get_reclaim_task_ids(self) -> Dict[str, int]:
+        """
+        Reclaim task id per uploaded things task, tasks uploaded before
+        the ids were stored are missing
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """SELECT things_task_id, reclaim_task_id FROM uploaded_tasks
+            WHERE reclaim_task_id IS NOT NULL"""
+        )
+        return dict(cursor.fetchall())
+
+    def store_reclaim_task_ids(self, reclaim_task_ids: Dict[str, int]):
+        with self.conn:
+            self.conn.executemany(
+                """UPDATE uploaded_tasks SET reclaim_task_id = ?, updated_at = ?
+                WHERE things_task_id = ?""",
+                [
+                    (reclaim_task_id, time.time(), task_id)
+                    for task_id, reclaim_task_id in reclaim_task_ids.items()
+                ],
+            )
+
+    def set_status(self, task_ids: Iterable[str], status: str):
+        with self.conn:
+            self.conn.executemany(
+                """UPDATE uploaded_tasks SET status = ?, updated_at = ?
+                WHERE things_task_id = ?""",
+                [(status, time.time(), task_id) for task_id in task_ids],
+            )
+
+    def get_task_ids_with_status(self, status: str) -> List[str]:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT things_task_id FROM uploaded_tasks WHERE status = ?", (status,)
+        )
+        return [task_id for (task_id,) in cursor.fetchall()]
+
+    def get_fingerprints(self) -> Dict[str, Optional[str]]:
+        """
+        Fingerprint of the last payload sent to reclaim per uploaded task,
+        None for tasks uploaded before payloads were stored
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT things_task_id, fingerprint FROM uploaded_tasks")
+        return dict(cursor.fetchall())
+
+    def get_payload(self, task_id: str) -> Optional[Dict]:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT payload FROM uploaded_tasks WHERE things_task_id = ?", (task_id,)
+        )
+        row = cursor.fetchone()
+        return None if row is None or row[0] is None else json.loads(row[0])
+
+    def store_payloads(self, payloads: Dict[str, Tuple[str, Dict]]):
+        """
+        Stores the (fingerprint, payload) pairs reclaim received
+        and marks the tasks as synced
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                """UPDATE uploaded_tasks
+                SET fingerprint = ?, payload = ?, status = ?, updated_at = ?
+                WHERE things_task_id = ?""",
+                [
+                    (fingerprint, json.dumps(payload), STATUS_SYNCED, now, task_id)
+                    for task_id, (fingerprint, payload) in payloads.items()
+                ],
+            )
+
+    def get_cached_reclaim_tasks(self, max_age: float) -> Optional[List[Dict]]:
+        """
+        Returns the cached reclaim task data or None if the cache
+        is missing or older than max_age seconds
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT updated_at FROM cache_state WHERE name = ?", ("reclaim_tasks",)
+        )
+        row = cursor.fetchone()
+        if row is None or time.time() - row[0] > max_age:
+            return None
+        cursor.execute("SELECT data FROM reclaim_task_cache ORDER BY id")
+        return [json.loads(data) for (data,) in cursor.fetchall()]
+
+    def store_reclaim_tasks(self, tasks: List[Dict]):
+        with self.conn:
+            self.conn.execute("DELETE FROM reclaim_task_cache")
+            self.conn.executemany(
+                "INSERT INTO reclaim_task_cache(data) VALUES(?)",
+                [(json.dumps(task, default=str),) for task in tasks],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache_state(name, updated_at) VALUES(?, ?)",
+                ("reclaim_tasks", time.time()),
+            )
+
+    def invalidate_reclaim_tasks(self):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM cache_state WHERE name = ?", ("reclaim_tasks",)
+            )
+            self.conn.execute("DELETE FROM reclaim_task_cache")
+
+    def get_cached_value(self, name: str, max_age: float) -> Optional[Any]:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT data, updated_at FROM value_cache WHERE name = ?", (name,)
+        )
+        row = cursor.fetchone()
+        if row is None or time.time() - row[1] > max_age:
+            return None
+        return json.loads(row[0])
+
+    def store_cached_value(self, name: str, value: Any):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO value_cache(name, data, updated_at) VALUES(?, ?, ?)",
+                (name, json.dumps(value, default=str), time.time()),
+            )
+
+    def get_tag_choice(self, description: str) -> Optional[str]:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT tag FROM tag_choices WHERE description = ?", (description,)
+        )
+        row = cursor.fetchone()
+        return None if row is None else row[0]
+
+    def store_tag_choice(self, description: str, tag: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tag_choices(description, tag) VALUES(?, ?)",
+                (description, tag),
+            )
+
+
+class TimeEntryRecord(NamedTuple):
+    id: str
+    name: str  # clean time entry name
+    start: float  # unix timestamps
+    end: Optional[float]  # None while running
+    updated_at: Optional[float]
+    data: Dict  # the api record
+
+
+class SyncState(NamedTuple):
+    covered_from: float  # all entries starting in [covered_from, covered_to)
+    covered_to: float  # were stored at synced_at
+    synced_at: float
+
+
+class TimeEntryStore:
+    """
+    Local copy of the toggl time entries and reclaim task events,
+    keyed by (source, id) and indexed by (source, name, start)
+    """
+
+    # the threads syncing both sources write one at a time instead of
+    # waiting on each other's locked database file
+    write_lock = threading.Lock()
+
+    def __init__(self, filename):
+        self.conn: sqlite3.Connection = get_connection(filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def _insert(self, source: str, records: Iterable[TimeEntryRecord]):
+        self.conn.executemany(
+            """INSERT OR REPLACE INTO time_entries(
+                source, id, name, start, end, updated_at, data
+            ) VALUES(?, ?, ?, ?, ?, ?, ?)""",
+            (
+                (
+                    source,
+                    record.id,
+                    record.name,
+                    record.start,
+                    record.end,
+                    record.updated_at,
+                    json.dumps(record.data, default=str),
+                )
+                for record in records
+            ),
+        )
+
+    def upsert(self, source: str, records: Iterable[TimeEntryRecord]):
+        with self.write_lock, self.conn:
+            self._insert(source, records)
+
+    def delete(self, source: str, ids: Iterable[str]):
+        with self.write_lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM time_entries WHERE source = ? AND id = ?",
+                [(source, entry_id) for entry_id in ids],
+            )
+
+    def replace_range(
+        self,
+        source: str,
+        start: float,
+        end: float,
+        records: Iterable[TimeEntryRecord],
+    ):
+        """
+        Replaces the entries starting in [start, end) with a fresh fetch,
+        so entries deleted remotely disappear too
+        """
+        with self.write_lock, self.conn:
+            self.conn.execute(
+                """DELETE FROM time_entries
+                WHERE source = ? AND start >= ? AND start < ?""",
+                (source, start, end),
+            )
+            self._insert(source, records)
+
+    def get_range(
+        self, source: str, start: float, end: float, name: Optional[str] = None
+    ) -> List[TimeEntryRecord]:
+        """
+        Entries starting in [start, end) in start order, optionally of one name
+        """
+        query = """SELECT id, name, start, end, updated_at, data FROM time_entries
+            WHERE source = ? AND start >= ? AND start < ?"""
+        parameters: Tuple = (source, start, end)
+        if name is not None:
+            query += " AND name = ?"
+            parameters += (name,)
+        cursor = self.conn.cursor()
+        cursor.execute(query + " ORDER BY start", parameters)
+        return [
+            TimeEntryRecord(entry_id, name, start, end, updated_at, json.loads(data))
+            for entry_id, name, start, end, updated_at, data in cursor.fetchall()
+        ]
+
+    def get_daily_durations(
+        self, source: str, start: float, end: float
+    ) -> List[Tuple[str, str, float]]:
+        """
+        Seconds tracked per (name, local day) on the stopped entries starting
+        in [start, end), summed by sqlite instead of loading the entries
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """SELECT name, date(start, 'unixepoch', 'localtime') AS day,
+                SUM(end - start)
+            FROM time_entries
+            WHERE source = ? AND start >= ? AND start < ? AND end IS NOT NULL
+            GROUP BY name, day
+            ORDER BY day, name""",
+            (source, start, end),
+        )
+        return cursor.fetchall()
+
+    def get_sync_state(self, source: str) -> Optional[SyncState]:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """SELECT covered_from, covered_to, synced_at FROM time_entry_sync
+            WHERE source = ?""",
+            (source,),
+        )
+        row = cursor.fetchone()
+        return None if row is None else SyncState(*row)
+
+    def clear_sync_states(self):
+        with self.write_lock, self.conn:
+            self.conn.execute("DELETE FROM time_entry_sync")
+
+    def store_sync_state(self, source: str, state: SyncState):
+        with self.write_lock, self.conn:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO time_entry_sync(
+                    source, covered_from, covered_to, synced_at
+                ) VALUES(?, ?, ?, ?)""",
+                (source, *state),
+            )
@@ -0,0 +1,255 @@
+from bisect import bisect_left
+from functools import wraps
+import inspect
+import json
+import threading
+import time
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from rich.table import Table
+
+# upper bounds of the latency histogram in seconds, the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRIC_PREFIX = "things2reclaim_call"
+
+MetricKey = Tuple[str, str]  # (layer, call)
+
+
+class Metric:
+    """
+    Count, errors, bytes and a latency histogram of one call
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0  # seconds
+        self.max = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, duration: float, error: bool = False, nbytes: int = 0):
+        self.count += 1
+        self.errors += error
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.bytes += nbytes
+        self.buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+
+    def cumulative_buckets(self) -> List[Tuple[str, int]]:
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+        counts = []
+        running = 0
+        for count in self.buckets:
+            running += count
+            counts.append(running)
+        return list(zip(bounds, counts))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total": self.total,
+            "max": self.max,
+            "bytes": self.bytes,
+            "buckets": dict(self.cumulative_buckets()),
+        }
+
+
+class Registry:
+    """
+    Metrics of all instrumented calls, safe to record from worker threads
+    """
+
+    def __init__(self):
+        self.metrics: Dict[MetricKey, Metric] = {}
+        self.lock = threading.Lock()
+
+    def record(
+        self, layer: str, call: str, duration: float, error: bool = False, nbytes: int = 0
+    ):
+        with self.lock:
+            metric = self.metrics.get((layer, call))
+            if metric is None:
+                metric = self.metrics[(layer, call)] = Metric()
+            metric.add(duration, error, nbytes)
+
+    def clear(self):
+        with self.lock:
+            self.metrics.clear()
+
+    def sorted_metrics(self) -> List[Tuple[MetricKey, Metric]]:
+        with self.lock:
+            return sorted(self.metrics.items(), key=lambda item: -item[1].total)
+
+    def summary_table(self) -> Table:
+        table = Table("Layer", "Call", "Count", "Errors", "Total", "Mean", "Max", "Bytes")
+        for (layer, call), metric in self.sorted_metrics():
+            table.add_row(
+                layer,
+                call,
+                str(metric.count),
+                str(metric.errors),
+                f"{metric.total:.3f}s",
+                f"{metric.total / metric.count * 1000:.1f}ms",
+                f"{metric.max * 1000:.1f}ms",
+                str(metric.bytes) if metric.bytes else "",
+            )
+        return table
+
+    def to_json(self, command: Optional[str] = None) -> str:
+        return json.dumps(
+            {
+                "command": command,
+                "time": time.time(),
+                "calls": [
+                    {"layer": layer, "call": call, **metric.to_dict()}
+                    for (layer, call), metric in self.sorted_metrics()
+                ],
+            },
+            indent=2,
+        )
+
+    def to_prometheus(self, command: Optional[str] = None) -> str:
+        """
+        Prometheus text format, e.g. for the node exporter textfile collector
+        """
+        lines = [f"# TYPE {METRIC_PREFIX}_duration_seconds histogram"]
+        errors = [f"# TYPE {METRIC_PREFIX}_errors_total counter"]
+        nbytes = [f"# TYPE {METRIC_PREFIX}_bytes_total counter"]
+        for (layer, call), metric in self.sorted_metrics():
+            labels = f'layer="{layer}",call="{call}"'
+            if command is not None:
+                labels += f',command="{command}"'
+            for bound, count in metric.cumulative_buckets():
+                lines.append(
+                    f'{METRIC_PREFIX}_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                    f"{count}"
+                )
+            lines.append(
+                f"{METRIC_PREFIX}_duration_seconds_sum{{{labels}}} {metric.total}"
+            )
+            lines.append(
+                f"{METRIC_PREFIX}_duration_seconds_count{{{labels}}} {metric.count}"
+            )
+            errors.append(f"{METRIC_PREFIX}_errors_total{{{labels}}} {metric.errors}")
+            nbytes.append(f"{METRIC_PREFIX}_bytes_total{{{labels}}} {metric.bytes}")
+        return "\n".join(lines + errors + nbytes) + "\n"
+
+
+registry = Registry()
+_active_layers = threading.local()
+_wrapped: List[Tuple[Any, str, Any]] = []  # (owner, attribute, original)
+
+
+def timed(layer: str, call: str, func: Callable) -> Callable:
+    """
+    Records every call of func. Calls made while the same layer is
+    already running are part of the outer call and not recorded again
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        active = getattr(_active_layers, "layers", None)
+        if active is None:
+            active = _active_layers.layers = set()
+        if layer in active:
+            return func(*args, **kwargs)
+        active.add(layer)
+        start = time.perf_counter()
+        error = True
+        try:
+            result = func(*args, **kwargs)
+            error = False
+            return result
+        finally:
+            active.discard(layer)
+            registry.record(layer, call, time.perf_counter() - start, error)
+
+    return wrapper
+
+
+def _replace(owner: Any, attribute: str, replacement: Any):
+    _wrapped.append((owner, attribute, owner.__dict__[attribute]))
+    setattr(owner, attribute, replacement)
+
+
+def instrument_module(module: ModuleType, layer: str):
+    """
+    Wraps the public functions defined in module, cached getters are skipped
+    """
+    for name, func in list(vars(module).items()):
+        if (
+            not name.startswith("_")
+            and inspect.isfunction(func)
+            and func.__module__ == module.__name__
+        ):
+            _replace(module, name, timed(layer, name, func))
+
+
+def instrument_class(cls: type, layer: str):
+    for name, func in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.isfunction(func):
+            _replace(cls, name, timed(layer, name, func))
+
+
+def instrument_http():
+    """
+    Records the requests of all httpx clients by host, with the bytes
+    sent and received
+    """
+    send = httpx.Client.send
+
+    @wraps(send)
+    def instrumented_send(client, request, *args, **kwargs):
+        start = time.perf_counter()
+        response = None
+        try:
+            response = send(client, request, *args, **kwargs)
+            return response
+        finally:
+            registry.record(
+                "http",
+                request.url.host,
+                time.perf_counter() - start,
+                response is None or response.is_error,
+                len(request.content)
+                + (response.num_bytes_downloaded if response is not None else 0),
+            )
+
+    _replace(httpx.Client, "send", instrumented_send)
+
+
+def enable(
+    modules: Iterable[Tuple[ModuleType, str]], classes: Iterable[Tuple[type, str]]
+):
+    """
+    Instruments the (module, layer) and (class, layer) pairs and httpx
+    """
+    if _wrapped:
+        return
+    for module, layer in modules:
+        instrument_module(module, layer)
+    for cls, layer in classes:
+        instrument_class(cls, layer)
+    instrument_http()
+
+
+def disable():
+    while _wrapped:
+        owner, attribute, original = _wrapped.pop()
+        setattr(owner, attribute, original)
+
+
+def export(path, command: Optional[str] = None):
+    """
+    Writes the metrics as JSON for .json files, else as Prometheus text
+    """
+    if str(path).endswith(".json"):
+        content = registry.to_json(command)
+    else:
+        content = registry.to_prometheus(command)
+    with open(path, "w") as metrics_file:
+        metrics_file.write(content)
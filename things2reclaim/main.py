@@ -1,13 +1,13 @@
 #!/opt/homebrew/Caskroom/miniconda/base/envs/things-automation/bin/python3
 
-import sqlite3
-from datetime import datetime
-from typing import Dict, List, Optional, Union
-import tomllib
-import itertools
+from datetime import datetime, timedelta
+import json
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 import time
 
 from dateutil import tz
+from reclaim_sdk.exceptions import RecordNotFound
 from rich import print as rprint
 from rich.console import Console
 from rich.prompt import Confirm
@@ -16,25 +16,93 @@ from rich.text import Text
 from typing_extensions import Annotated
 import typer
 
+import async_handler
+import daemon
+import instrumentation
 import reclaim_handler
+import reconciliation
 from deadline_status import DeadlineStatus
+import sync_diff
 import things_handler
+import time_entry_sync
 import toggl_handler
 import task_scheduler_handler
+from task_stats import TaskStats
+from time_report import TimeReport
 import utils
-from database_handler import UploadedTasksDB
+import worker_pool
+import database_handler
+from database_handler import TimeEntryStore, UploadedTasksDB
 
-CONFIG_PATH = utils.get_project_root() / "things2reclaim/config/.things2reclaim.toml"
-
-_config = {}
-with open(CONFIG_PATH, "rb") as f:
-    _config = tomllib.load(f)
-
-DATABASE_PATH = utils.get_project_root() / _config["database"]["path"]
+# value_cache entry with the time of the last complete update run
+UPDATE_WATERMARK = "things_update_watermark"
 
 app = typer.Typer(add_completion=False, no_args_is_help=True)
 console = Console()
 
+
+@app.callback()
+def main_options(
+    ctx: typer.Context,
+    refresh: Annotated[
+        bool,
+        typer.Option(help="Ignore the local cache of reclaim tasks and time entries"),
+    ] = False,
+    profile: Annotated[
+        bool, typer.Option(help="Print the time spent per service call")
+    ] = False,
+    metrics_file: Annotated[
+        Optional[Path],
+        typer.Option(help="Write the call metrics as JSON (*.json) or Prometheus text"),
+    ] = None,
+):
+    if profile or metrics_file is not None:
+        enable_instrumentation(ctx, profile, metrics_file)
+    if refresh:
+        reclaim_handler.invalidate_task_cache()
+        time_entry_sync.invalidate()
+
+
+def enable_instrumentation(
+    ctx: typer.Context, profile: bool, metrics_file: Optional[Path]
+):
+    instrumentation.enable(
+        [
+            (reclaim_handler, "reclaim"),
+            (toggl_handler, "toggl"),
+            (things_handler, "things"),
+            (task_scheduler_handler, "task_scheduler"),
+        ],
+        [(UploadedTasksDB, "sqlite"), (TimeEntryStore, "sqlite")],
+    )
+
+    def report():
+        if profile:
+            console.print(instrumentation.registry.summary_table())
+        if metrics_file is not None:
+            instrumentation.export(metrics_file, ctx.invoked_subcommand)
+
+    ctx.call_on_close(report)
+
+
+def forward_to_daemon(command: str, **args) -> bool:
+    """
+    Lets a running daemon answer the command. Returns False if the
+    command has to run in this process. A command that failed in the
+    daemon is not run again, it may already have changed something
+    """
+    if daemon.serving:
+        return False
+    response = daemon.send_request(command, args)
+    if response is None or response.get("run_locally"):
+        return False
+    print(response.get("output", ""), end="")
+    if not response["ok"]:
+        utils.perror(f"{command} failed in the daemon: {response['error']}")
+        raise typer.Exit(code=1)
+    return True
+
+
 def generate_params_dict(things_task):
     tags = things_handler.get_task_tags(things_task)
     estimated_time = tags.get("EstimatedTime")
@@ -65,13 +133,34 @@ def generate_params_dict(things_task):
     return params
 
 
-def things_to_reclaim(things_task):
-    params = generate_params_dict(things_task)
-    reclaim_handler.create_reaclaim_task_from_dict(params)
+def get_fingerprinted_payload(things_task) -> Tuple[str, Dict]:
+    payload = reclaim_handler.get_task_payload(generate_params_dict(things_task))
+    return reclaim_handler.get_payload_fingerprint(payload), payload
 
-def things_to_task(things_task):
+
+class UploadedTask(NamedTuple):
+    reclaim_task: reclaim_handler.ReclaimTask
+    params: Dict
+    payload: Dict
+    fingerprint: str
+
+
+def things_to_reclaim(things_task, invalidate_cache: bool = True) -> UploadedTask:
+    """
+    Creates the reclaim task, the params and payload are returned with it,
+    so they are not generated again to store them
+    """
     params = generate_params_dict(things_task)
-    task_scheduler_handler.create_task_from_dict(params)
+    payload = reclaim_handler.get_task_payload(params)
+    reclaim_task = reclaim_handler.create_reaclaim_task_from_dict(
+        params, invalidate_cache
+    )
+    return UploadedTask(
+        reclaim_task,
+        params,
+        payload,
+        reclaim_handler.get_payload_fingerprint(payload),
+    )
 
 
 def finish_task(task: Union[reclaim_handler.ReclaimTask, str]):
@@ -85,7 +174,7 @@ def finish_task(task: Union[reclaim_handler.ReclaimTask, str]):
         reclaim_handler.finish_task(task)
 
     things_handler.complete(things_id)
-    with UploadedTasksDB(DATABASE_PATH) as db:
+    with UploadedTasksDB(utils.get_database_path()) as db:
         db.remove_uploaded_task(things_id)
 
 
@@ -94,21 +183,25 @@ def initialize_uploaded_database(verbose: bool = False):
     """
     Initializes the uploaded tasks database
     """
-    reclaim_things_uuids = reclaim_handler.get_reclaim_things_ids()
-    added_tasks = 0
-    with UploadedTasksDB(DATABASE_PATH) as db:
-        for task_id in reclaim_things_uuids:
-            try:
-                db.add_uploaded_task(task_id)
-                added_tasks += 1
-            except sqlite3.IntegrityError as e:
-                if verbose:
-                    print(
-                        f"Task with ID {
-                            task_id} already in database | Exception: {e}"
-                    )
-                else:
-                    continue
+    reclaim_index = reclaim_handler.ReclaimTaskIndex(
+        reclaim_handler.get_reclaim_tasks(use_cache=False)
+    )
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        diff = sync_diff.diff_ids(
+            reclaim_index.things_ids(), db.get_all_uploaded_tasks()
+        )
+        if verbose:
+            for task_id in diff.common:
+                print(f"Task with ID {task_id} already in database")
+        db.add_uploaded_tasks(
+            diff.new,
+            {
+                task_id: reclaim_index.by_things_id[task_id].id
+                for task_id in diff.new
+                if task_id not in reclaim_index.duplicates
+            },
+        )
+    added_tasks = len(diff.new)
 
     if added_tasks == 0:
         print("uploaded_tasks table is already initialized")
@@ -120,27 +213,84 @@ def initialize_uploaded_database(verbose: bool = False):
 
 
 @app.command("upload")
-def upload_things_to_reclaim(dry_run: bool = False):
+def upload_things_to_reclaim(
+    dry_run: bool = False,
+    concurrency: Annotated[
+        int, typer.Option(help="Number of tasks saved in parallel")
+    ] = 1,
+    rate_limit: Annotated[
+        float, typer.Option(help="Maximum reclaim requests per second")
+    ] = 5.0,
+):
     """
     Upload things tasks to reclaim
     """
     tasks = things_handler.get_all_things_tasks()
-    with UploadedTasksDB(DATABASE_PATH) as db:
-        uploaded_task_ids = db.get_all_uploaded_tasks()
-        tasks_to_upload = [
-            task for task in tasks if task["uuid"] not in uploaded_task_ids
-        ]
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        diff = sync_diff.diff_ids(
+            (task["uuid"] for task in tasks), db.get_all_uploaded_tasks()
+        )
+        tasks_to_upload = sync_diff.select(tasks, diff.new, lambda task: task["uuid"])
         if not tasks_to_upload:
             print("No new tasks were found")
-        else:
+        elif dry_run:
             for task in tasks_to_upload:
                 print(f"Creating task {things_handler.full_name(task)} in Reclaim")
-                if not dry_run:
-                    things_to_reclaim(task)
-                    db.add_uploaded_task(task["uuid"])
             print(
                 f"Uploaded {len(tasks_to_upload)} task{'s' if len(tasks_to_upload) > 1 else ''}"
             )
+        else:
+            reclaim_handler.get_client()
+            results = []
+            uploaded_payloads = {}
+            reclaim_task_ids = {}
+            start = time.perf_counter()
+            try:
+                for result in worker_pool.run_concurrently(
+                    lambda task: things_to_reclaim(task, invalidate_cache=False),
+                    tasks_to_upload,
+                    concurrency=concurrency,
+                    rate_limiter=worker_pool.RateLimiter(rate_limit),
+                    retryable=worker_pool.is_retryable_create,
+                ):
+                    results.append(result)
+                    task_name = things_handler.full_name(result.item)
+                    if result.error is None:
+                        print(f"Created task {task_name} in Reclaim")
+                        uploaded = result.result
+                        uploaded_payloads[result.item["uuid"]] = (
+                            uploaded.fingerprint,
+                            uploaded.payload,
+                        )
+                        reclaim_task_ids[result.item["uuid"]] = (
+                            uploaded.reclaim_task.id
+                        )
+                    else:
+                        utils.perror(f"Could not create {task_name}: {result.error}")
+            finally:
+                # the database is only written from this thread
+                db.add_uploaded_tasks(uploaded_payloads.keys(), reclaim_task_ids)
+                db.store_payloads(uploaded_payloads)
+                if results:
+                    reclaim_handler.invalidate_task_cache()
+            print_upload_report(results, time.perf_counter() - start)
+
+
+def print_upload_report(results: List[worker_pool.TaskResult], elapsed: float):
+    table = Table("Task", "Latency", "Status", title="Upload report")
+    for result in sorted(results, key=lambda r: r.latency, reverse=True):
+        status = Text("ok", style="green") if result.error is None else Text(
+            "failed", style="bold red"
+        )
+        table.add_row(
+            things_handler.full_name(result.item), f"{result.latency:.2f}s", status
+        )
+    console.print(table)
+    uploaded = sum(1 for result in results if result.error is None)
+    print(
+        f"Uploaded {uploaded} of {len(results)} task{'s' if len(results) > 1 else ''} "
+        f"in {elapsed:.2f}s ({uploaded / elapsed if elapsed else 0:.2f} tasks/s)"
+    )
 
 
 @app.command("list")
@@ -148,6 +298,8 @@ def list_reclaim_tasks(subject: Annotated[Optional[str], typer.Argument()] = Non
     """
     List all current tasks
     """
+    if forward_to_daemon("list", subject=subject):
+        return
     reclaim_tasks = reclaim_handler.get_reclaim_tasks()
     if subject is not None:
         reclaim_tasks = reclaim_handler.filter_for_subject(subject, reclaim_tasks)
@@ -175,19 +327,17 @@ def list_reclaim_tasks(subject: Annotated[Optional[str], typer.Argument()] = Non
 def start_task(
     task_name_parts: Annotated[List[str], typer.Argument(help="Task to start")]
 ):
+    if forward_to_daemon("start", task_name_parts=task_name_parts):
+        return
     task_name = (" ").join(task_name_parts)
-    tasks: Dict[str, reclaim_handler.ReclaimTask] = {
-        task.name: task for task in reclaim_handler.get_reclaim_tasks()
-    }
-    if task_name not in tasks.keys():
-        task = utils.get_closest_match(task_name, tasks)
-        if task is None:
-            utils.perror(f"No task with name {task_name} found")
-            return
-    else:
-        task = tasks[task_name]
+    task, current_task = async_handler.gather(
+        async_handler.get_reclaim_task_fuzzy(task_name),
+        async_handler.get_current_time_entry(),
+    )
+    if task is None:
+        utils.perror(f"No task with name {task_name} found")
+        return
 
-    current_task = toggl_handler.get_current_time_entry()
     if current_task is not None:
         utils.perror("Toggl Track is already running")
         return
@@ -197,8 +347,24 @@ def start_task(
 
 
 @app.command("stop")
-def stop_task():
-    current_task = toggl_handler.get_current_time_entry()
+def stop_task(
+    finished: Annotated[
+        Optional[bool],
+        typer.Option(
+            "--finished/--unfinished", help="Skip the question if the task is finished"
+        ),
+    ] = None
+):
+    if not daemon.serving and daemon.send_request("ping", {}) is not None:
+        if finished is None:
+            finished = Confirm.ask("Is task finished?", default=False)
+        if forward_to_daemon("stop", finished=finished):
+            return
+    # the last event of the task is moved, so the tasks are fetched live
+    current_task, reclaim_tasks = async_handler.gather(
+        async_handler.get_current_time_entry(),
+        async_handler.get_reclaim_tasks(use_cache=False),
+    )
     if current_task is None:
         utils.perror("No task is currently tracked in toggl")
         return
@@ -209,16 +375,12 @@ def stop_task():
         utils.perror("Current toggl task has no name")
         return
 
-    reclaim_dict = {task.name: task for task in reclaim_handler.get_reclaim_tasks()}
-
-    if current_task_name in reclaim_dict.keys():
-        reclaim_task = reclaim_dict[current_task_name]
-    else:
-        reclaim_task = utils.get_closest_match(current_task_name, reclaim_dict)
-
-        if reclaim_task is None:
-            utils.perror(f"{current_task_name} not found in reclaim")
-            return
+    reclaim_task = reclaim_handler.get_reclaim_task_fuzzy(
+        current_task_name, reclaim_tasks
+    )
+    if reclaim_task is None:
+        utils.perror(f"{current_task_name} not found in reclaim")
+        return
 
     stopped_task = toggl_handler.stop_task(current_task)
     if stopped_task is None:
@@ -227,11 +389,15 @@ def stop_task():
     start_time = toggl_handler.get_start_time(stopped_task)
     stop_time = toggl_handler.get_stop_time(stopped_task)
 
-    is_task_finished = Confirm.ask("Is task finished?", default=False)
+    is_task_finished = (
+        finished
+        if finished is not None
+        else Confirm.ask("Is task finished?", default=False)
+    )
 
     try:
         reclaim_handler.log_work_for_task(reclaim_task, start_time, stop_time)
-    except ValueError:
+    except (ValueError, RecordNotFound):
         utils.pwarning("Work could not be logged in reclaim!")
 
     if is_task_finished:
@@ -242,72 +408,75 @@ def stop_task():
 
 
 @app.command("stats")
-def show_task_stats():
+def show_task_stats(
+    json_output: Annotated[
+        bool, typer.Option("--json", help="Print the aggregates as JSON")
+    ] = False
+):
     """
     Show task stats
     """
-    current_date = datetime.now(tz.tzutc())
-    reclaim_tasks = reclaim_handler.get_reclaim_tasks()
-
-    tasks_fine = reclaim_handler.filter_for_deadline_status(
-        current_date, DeadlineStatus.FINE, reclaim_tasks
+    stats = TaskStats(
+        reclaim_handler.get_reclaim_tasks(),
+        datetime.now(tz.tzutc()),
+        things_handler.get_course_names(),
     )
-    tasks_overdue = reclaim_handler.filter_for_deadline_status(
-        current_date, DeadlineStatus.OVERDUE, reclaim_tasks
-    )
-
-    fine_per_course = ["Fine"]
-    overdue_per_course = ["Overdue"]
-    course_names = things_handler.get_course_names()
-    for course_name in course_names:
-        fine_per_course.append(
-            str(len(reclaim_handler.filter_for_subject(course_name, tasks_fine)))
-        )
-        overdue_per_course.append(
-            str(len(reclaim_handler.filter_for_subject(course_name, tasks_overdue)))
-        )
+    if json_output:
+        print(json.dumps(stats.to_dict(), indent=2))
+        return
 
+    course_names = stats.courses()
     table = Table(*(["Status"] + course_names))
-    table.add_row(*fine_per_course)
-    table.add_row(*overdue_per_course)
+    for label, deadline_status in (
+        ("Fine", DeadlineStatus.FINE),
+        ("Overdue", DeadlineStatus.OVERDUE),
+    ):
+        table.add_row(
+            label,
+            *[
+                str(stats.total(course_name, deadline_status).count)
+                for course_name in course_names
+            ],
+        )
 
     console.print(table)
 
 
 @app.command("time")
-def print_time_needed(subject: Annotated[Optional[str], typer.Argument()] = None):
+def print_time_needed(
+    subject: Annotated[Optional[str], typer.Argument()] = None,
+    json_output: Annotated[
+        bool, typer.Option("--json", help="Print the aggregates as JSON")
+    ] = False,
+):
     """
     Print sum of time needed for all reclaim tasks
     """
     tasks = reclaim_handler.get_reclaim_tasks()
     if subject is not None:
         tasks = reclaim_handler.filter_for_subject(subject, tasks)
-    time_needed = 0
+    stats = TaskStats(
+        tasks, datetime.now(tz.tzutc()), things_handler.get_course_names()
+    )
+    if json_output:
+        print(json.dumps(stats.to_dict(), indent=2))
+        return
 
-    for task in tasks:
-        task_duration = task.duration
-        if task_duration:
-            time_needed += task_duration
+    total = stats.total()
+    if total.count == 0:
+        print("No tasks found")
+        return
 
-    print(f"Time needed to complete {len(tasks)} Tasks: {time_needed} hrs")
+    print(f"Time needed to complete {total.count} Tasks: {total.duration} hrs")
     print(
         f"Average time needed to complete a Task: {
-          time_needed/len(tasks):.2f} hrs"
+          total.duration/total.count:.2f} hrs"
     )
 
-    # sort unscheduled tasks to the end of the list
-    tasks.sort(
-        key=lambda x: (
-            x.scheduled_start_date
-            if x.scheduled_start_date is not None
-            else datetime.max.replace(tzinfo=tz.tzutc())
-        )
-    )
-
-    last_task_date = tasks[-1].scheduled_start_date
-    if last_task_date is None:  # last task on todo list is not scheduled
+    if stats.total(scheduled=False).count:  # not all tasks on todo list are scheduled
         print("Too many tasks on todo list. Not all are scheduled.")
     else:
+        last_task_date = total.last_scheduled
         today = datetime.now(tz.tzutc())
         print(
             f"""Last task is scheduled for {last_task_date.strftime('%d.%m.%Y')}
@@ -315,10 +484,101 @@ def print_time_needed(subject: Annotated[Optional[str], typer.Argument()] = None
         )
 
 
+def get_estimates(things_tasks: List[Dict]) -> Dict[str, float]:
+    """
+    EstimatedTime in hours per task name, tasks without a valid tag are skipped
+    """
+    estimates = {}
+    for things_task in things_tasks:
+        estimated_time = things_handler.get_task_tags(things_task).get("EstimatedTime")
+        if estimated_time is None:
+            continue
+        try:
+            estimates[things_handler.full_name(things_task)] = (
+                utils.calculate_time_on_unit(estimated_time)
+            )
+        except ValueError:
+            utils.pwarning(
+                f"Invalid EstimatedTime of {things_handler.full_name(things_task)}"
+            )
+    return estimates
+
+
+def format_hours(hours: Optional[float]) -> str:
+    return "-" if hours is None else f"{hours:.1f}"
+
+
+@app.command("report")
+def show_time_report(
+    since_days: Annotated[int, typer.Argument()] = 30,
+    subject: Annotated[
+        Optional[str], typer.Option(help="Show the tasks of one course")
+    ] = None,
+    burn_down: Annotated[
+        bool, typer.Option(help="Show the remaining estimate per tracked day")
+    ] = False,
+    json_output: Annotated[
+        bool, typer.Option("--json", help="Print the report as JSON")
+    ] = False,
+):
+    """
+    Compare the estimated with the tracked time per course and task
+    """
+    today = datetime.now(tz.tzlocal()).date()
+    from_date = today - timedelta(days=since_days)
+    report = TimeReport(
+        get_estimates(
+            things_handler.get_uni_tasks_completed_since(
+                time_entry_sync.midnight(from_date)
+            )
+        ),
+        time_entry_sync.get_daily_durations(from_date, today + timedelta(days=1)),
+        things_handler.get_course_names(),
+    )
+    if json_output:
+        print(json.dumps(report.to_dict(), indent=2))
+        return
+
+    if subject is None:
+        first_column = "Course"
+        rows = [(course, report.total(course)) for course in report.courses()]
+    else:
+        first_column = "Task"
+        rows = [(name, report.tasks[name]) for name in report.task_names(subject)]
+    if not rows:
+        print("No tasks found")
+        return
+    table = Table(
+        first_column,
+        "Estimated (h)",
+        "Tracked (h)",
+        "Ratio",
+        "Remaining (h)",
+        title=f"Tracked time since {from_date.strftime('%d.%m.%Y')}",
+    )
+    for name, progress in rows + [("Total", report.total(subject))]:
+        table.add_row(
+            name,
+            format_hours(progress.estimate),
+            format_hours(progress.tracked),
+            "-" if progress.ratio is None else f"{progress.ratio:.2f}",
+            format_hours(progress.remaining),
+        )
+    console.print(table)
+
+    if burn_down:
+        table = Table("Day", "Remaining (h)", title="Burn-down")
+        for day, remaining in report.burn_down(subject):
+            table.add_row(day, format_hours(remaining))
+        console.print(table)
+
+
 @app.command("remove")
 def remove_task(
-        task_name_parts: Annotated[List[str], typer.Argument(help="Task to start")]
+        task_name_parts: Annotated[List[str], typer.Argument(help="Task to remove")]
         ):
+    if forward_to_daemon("remove", task_name_parts=task_name_parts):
+        return
     task_name = (" ").join(task_name_parts)
     task = reclaim_handler.get_reclaim_task_fuzzy(task_name)
     if task is None:
@@ -332,12 +592,119 @@ def remove_task(
     utils.pinfo("Removed task")
 
 
+@app.command("update")
+def update_changed_tasks(dry_run: bool = False):
+    """
+    Push edits of uploaded things tasks to reclaim
+    """
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        watermark = db.get_cached_value(UPDATE_WATERMARK, float("inf")) or 0.0
+        started_at = time.time()
+        fingerprints = db.get_fingerprints()
+        new_payloads = {}
+        changed_tasks = []
+        # retried by the next update, the watermark moves past them
+        failed_ids = []
+        # only tasks edited since the last update or failed before are read
+        tasks = {
+            task["uuid"]: task
+            for task in things_handler.get_uni_tasks_modified_since(watermark)
+            + things_handler.get_tasks_bulk(
+                db.get_task_ids_with_status(database_handler.STATUS_FAILED)
+            )
+        }
+        for task in tasks.values():
+            if task["uuid"] not in fingerprints:
+                continue
+            try:
+                fingerprint, payload = get_fingerprinted_payload(task)
+            except ValueError as e:
+                failed_ids.append(task["uuid"])
+                utils.pwarning(f"{things_handler.full_name(task)} is skipped: {e}")
+                continue
+            if fingerprints[task["uuid"]] is None:
+                # uploaded before payloads were stored, take it as the baseline
+                new_payloads[task["uuid"]] = (fingerprint, payload)
+            elif fingerprints[task["uuid"]] != fingerprint:
+                changed_tasks.append((task, fingerprint, payload))
+
+        if not changed_tasks:
+            print("No changed tasks were found")
+        reclaim_task_ids = reclaim_handler.resolve_reclaim_task_ids(
+            task["uuid"] for task, _, _ in changed_tasks
+        )
+        try:
+            for task, fingerprint, payload in changed_tasks:
+                task_name = things_handler.full_name(task)
+                if task["uuid"] not in reclaim_task_ids:
+                    failed_ids.append(task["uuid"])
+                    utils.pwarning(f"{task_name} not found in reclaim")
+                    continue
+                print(f"Updating task {task_name} in Reclaim")
+                if dry_run:
+                    continue
+                try:
+                    reclaim_handler.patch_reclaim_task(
+                        reclaim_handler.get_task_stub(
+                            reclaim_task_ids[task["uuid"]], task_name
+                        ),
+                        db.get_payload(task["uuid"]) or {},
+                        payload,
+                    )
+                except Exception as e:
+                    failed_ids.append(task["uuid"])
+                    utils.perror(f"Could not update {task_name}: {e}")
+                    continue
+                new_payloads[task["uuid"]] = (fingerprint, payload)
+        finally:
+            if not dry_run:
+                db.store_payloads(new_payloads)
+                db.set_status(failed_ids, database_handler.STATUS_FAILED)
+                db.store_cached_value(UPDATE_WATERMARK, started_at)
+                if changed_tasks:
+                    reclaim_handler.invalidate_task_cache()
+
+
+def push_things_changes():
+    upload_things_to_reclaim()
+    update_changed_tasks()
+    removeDeletedTasks()
+
+
+@app.command("watch")
+def watch_things(
+    debounce: Annotated[
+        float, typer.Option(help="Seconds to wait for more edits after a change")
+    ] = 2.0,
+):
+    """
+    Push things edits to reclaim whenever the things database changes
+    """
+    signature = things_handler.get_database_signature()
+    push_things_changes()
+    utils.pinfo("Watching the things database")
+    try:
+        while True:
+            things_handler.wait_for_database_change(signature)
+            time.sleep(debounce)
+            signature = things_handler.get_database_signature()
+            push_things_changes()
+    except KeyboardInterrupt:
+        utils.pinfo("Stopped watching")
+
+
 @app.command("finished")
 def remove_finished_tasks_from_things(dry_run: bool = False):
     """
     Complete finished reclaim tasks in things
     """
-    reclaim_things_uuids = reclaim_handler.get_reclaim_things_ids()
+    reclaim_things_uuids = set(
+        reclaim_handler.get_reclaim_things_ids(
+            reclaim_handler.ReclaimTaskIndex(
+                reclaim_handler.get_reclaim_tasks(use_cache=False)
+            )
+        )
+    )
     tasks_to_be_removed = [
         task
         for task in things_handler.get_all_uploaded_things_tasks()
@@ -358,46 +725,122 @@ def remove_finished_tasks_from_things(dry_run: bool = False):
 
 
 @app.command("tracking")
-def sync_toggl_reclaim_tracking(since_days: Annotated[int, typer.Argument()] = 0):
-    toggl_time_entries = toggl_handler.get_time_entries_since(
-        since_days=since_days
-    )  # end date is inclusive
-    if toggl_time_entries is None:
+def sync_toggl_reclaim_tracking(
+    since_days: Annotated[int, typer.Argument()] = 0,
+    apply: Annotated[
+        bool, typer.Option(help="Move the reclaim events to the toggl times")
+    ] = False,
+    dry_run: Annotated[
+        bool, typer.Option(help="Only show what --apply would change")
+    ] = False,
+    concurrency: Annotated[
+        int, typer.Option(help="Number of events saved in parallel")
+    ] = 4,
+    rate_limit: Annotated[
+        float, typer.Option(help="Maximum reclaim requests per second")
+    ] = 5.0,
+):
+    today = datetime.now(tz.tzlocal()).date()
+    from_date = today - timedelta(days=since_days)
+    to_date = today + timedelta(days=1)
+    # both are read from the local store, only changes are fetched
+    time_entries, reclaim_time_entries = async_handler.gather(
+        async_handler.get_stored_time_entries(from_date, to_date),
+        async_handler.get_stored_task_events(from_date, to_date),
+    )
+    toggl_intervals = list(reconciliation.toggl_intervals(time_entries))
+    if not toggl_intervals:
         utils.pwarning(f"No tasks tracked in Toggl since {since_days} days")
         return
-    reclaim_time_entries = reclaim_handler.get_task_events_since(
-        since_days=since_days
-    )  # end date is inclusive
-    reclaim_time_entries_dict = {
-        utils.get_clean_time_entry_name(k): list(g)
-        for k, g in itertools.groupby(reclaim_time_entries, lambda r: r.name)
-    }
-    non_existent_time_entries = [
-        time_entry
-        for time_entry in toggl_time_entries
-        if time_entry.description not in reclaim_time_entries_dict.keys()
+    plan = reconciliation.reconcile(
+        toggl_intervals,
+        (reconciliation.reclaim_interval(event) for event in reclaim_time_entries),
+    )
+    if not apply and not dry_run:
+        print_reconciliation_plan(plan)
+        return
+
+    adjustments = [
+        adjustment
+        for adjustment in plan.adjusts
+        if not utils.is_matching_time_entry(
+            adjustment.toggl.item, adjustment.reclaim.item, verbose=False
+        )
     ]
-    # add all existing mismatched_time_entries
-    time_entries_to_adjust: Dict[
-        toggl_handler.TimeEntry, reclaim_handler.ReclaimTaskEvent
-    ] = {}
-    for toggl_time_entry in toggl_time_entries:
-        if toggl_time_entry.description in reclaim_time_entries_dict.keys():
-            nearest_entry = utils.nearest_time_entry(
-                reclaim_time_entries_dict.get(toggl_time_entry.description),
-                toggl_time_entry,
-            )  # pyright: ignore
-            if toggl_time_entry in time_entries_to_adjust:
-                time_entries_to_adjust[toggl_time_entry] = utils.nearest_time_entry(
-                    [time_entries_to_adjust[toggl_time_entry], nearest_entry],
-                    toggl_time_entry,
-                )  # pyright: ignore
-            elif nearest_entry is not None:
-                time_entries_to_adjust[toggl_time_entry] = nearest_entry
-
-    rprint(non_existent_time_entries)
-    rprint(time_entries_to_adjust)
-    return
+    if not adjustments:
+        utils.pinfo("All tracked reclaim events match toggl")
+        return
+    print_adjustment_diff(adjustments)
+    if dry_run:
+        return
+    apply_adjustments(adjustments, concurrency, rate_limit)
+
+
+def format_interval(interval: reconciliation.Interval) -> str:
+    local_zone = tz.gettz()
+    return (
+        f"{interval.start.astimezone(local_zone).strftime('%d.%m. %H:%M')} - "
+        f"{interval.end.astimezone(local_zone).strftime('%H:%M')}"
+    )
+
+
+def print_reconciliation_plan(plan: reconciliation.ReconciliationPlan):
+    table = Table("Action", "Name", "Toggl", "Reclaim", title="Tracking plan")
+    for interval in plan.creates:
+        table.add_row("create", interval.name, format_interval(interval), "")
+    for adjustment in plan.adjusts:
+        table.add_row(
+            "adjust",
+            adjustment.toggl.name,
+            format_interval(adjustment.toggl),
+            format_interval(adjustment.reclaim),
+        )
+    for interval in plan.deletes:
+        table.add_row("delete", interval.name, "", format_interval(interval))
+    console.print(table)
+    print(f"{len(plan.unchanged)} time entries are already in sync")
+
+
+def print_adjustment_diff(adjustments: List[reconciliation.Adjustment]):
+    for adjustment in adjustments:
+        rprint(f"[bold]{adjustment.reclaim.name}[/bold]")
+        rprint(f"[red]- {format_interval(adjustment.reclaim)}[/red]")
+        rprint(f"[green]+ {format_interval(adjustment.toggl)}[/green]")
+
+
+def apply_adjustments(
+    adjustments: List[reconciliation.Adjustment], concurrency: int, rate_limit: float
+):
+    reclaim_handler.get_client()
+    adjusted = 0
+    adjusted_events = []
+    start = time.perf_counter()
+    try:
+        for result in worker_pool.run_concurrently(
+            lambda adjustment: reclaim_handler.adjust_time_entry(
+                adjustment.reclaim.item,
+                adjustment.toggl.start,
+                adjustment.toggl.end,
+                invalidate_cache=False,
+            ),
+            adjustments,
+            concurrency=concurrency,
+            rate_limiter=worker_pool.RateLimiter(rate_limit),
+        ):
+            if result.error is None:
+                adjusted += 1
+                adjusted_events.append(result.item.reclaim.item)
+            else:
+                utils.perror(
+                    f"Could not adjust {result.item.reclaim.name}: {result.error}"
+                )
+    finally:
+        reclaim_handler.invalidate_task_cache()
+        time_entry_sync.store_task_events(adjusted_events)
+    print(
+        f"Adjusted {adjusted} of {len(adjustments)} reclaim events "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
 
 
 @app.command("current")
@@ -417,27 +860,41 @@ def removeDeletedTasks(dry_run: bool = False):
     """
     Removes all tasks from reclaim that were deleted in things
     """
-    with UploadedTasksDB(DATABASE_PATH) as db:
+    with UploadedTasksDB(utils.get_database_path()) as db:
         uploaded_task_ids = db.get_all_uploaded_tasks()
     things_task_ids = [task["uuid"] for task in things_handler.get_all_things_tasks()]
-    ids_to_be_removed = [
-        id 
-        for id in uploaded_task_ids
-        if id not in things_task_ids
-    ]
+    ids_to_be_removed = sync_diff.select(
+        uploaded_task_ids,
+        sync_diff.diff_ids(things_task_ids, uploaded_task_ids).removed,
+        lambda task_id: task_id,
+    )
     if len(ids_to_be_removed) == 0:
         utils.pinfo("No deleted tasks found")
     else:
         utils.pinfo(f"Delting {len(ids_to_be_removed)} removed tasks in reclaim")
-        with UploadedTasksDB(DATABASE_PATH) as db:
-            for task_id in ids_to_be_removed:
-                reclaim_task = reclaim_handler.get_by_things_id(task_id)
-                if reclaim_task is None:
-                    continue
-                utils.pinfo(f"Removing {reclaim_task.name}")
-                if not dry_run:
-                    reclaim_handler.finish_task(reclaim_task)
-                    db.remove_uploaded_task(task_id)
+        reclaim_task_ids = reclaim_handler.resolve_reclaim_task_ids(ids_to_be_removed)
+        removed_ids = []
+        with UploadedTasksDB(utils.get_database_path()) as db:
+            try:
+                for task_id in ids_to_be_removed:
+                    if task_id not in reclaim_task_ids:
+                        continue
+                    reclaim_task_id = reclaim_task_ids[task_id]
+                    payload = db.get_payload(task_id) or {}
+                    reclaim_task = reclaim_handler.get_task_stub(
+                        reclaim_task_id,
+                        payload.get("title") or f"reclaim task {reclaim_task_id}",
+                    )
+                    utils.pinfo(f"Removing {reclaim_task.name}")
+                    if dry_run:
+                        continue
+                    try:
+                        reclaim_handler.finish_task(reclaim_task)
+                    except RecordNotFound:
+                        utils.pwarning(f"{reclaim_task.name} was already removed")
+                    removed_ids.append(task_id)
+            finally:
+                db.remove_uploaded_tasks(removed_ids)
 
 
 @app.command("sync")
@@ -450,27 +907,108 @@ def sync_things_and_reclaim(dry_run: bool = False):
     utils.pinfo("Pulling from Reclaim")
     removed_tasks = remove_finished_tasks_from_things(dry_run)
     rprint("---------------------------------------------")
-    time_to_wait = 2 * removed_tasks
-    if time_to_wait > 0:
-        rprint(f"Waiting {time_to_wait}s for things to mark tasks as completed")
-        time.sleep(
-            time_to_wait
-        )  # wait for os.system call in things_handler.complete to take effect
+    if removed_tasks and not dry_run:
+        rprint(f"Waiting for things to mark {removed_tasks} tasks as completed")
+        # things_handler.complete goes through the asynchronous things url scheme
+        not_completed = things_handler.wait_for_completion()
+        if not_completed:
+            utils.pwarning(
+                f"{len(not_completed)} tasks are not yet completed in things"
+            )
     utils.pinfo("Pushing to Reclaim")
     upload_things_to_reclaim(dry_run)
+    update_changed_tasks(dry_run)
     rprint("---------------------------------------------")
 
+def run_sync_cycle(last_signature: Optional[Tuple]) -> Tuple:
+    """
+    One finished -> upload -> update -> removeDeleted cycle of the daemon.
+    Pushing to reclaim is skipped while the things database is unchanged
+    since the last cycle.
+    Returns the signature of the things database the cycle has seen
+    """
+    removed_tasks = remove_finished_tasks_from_things()
+    if removed_tasks:
+        things_handler.wait_for_completion()
+    signature = things_handler.get_database_signature()
+    if signature == last_signature:
+        return signature
+    push_things_changes()
+    return signature
+
+
+@app.command("serve")
+def serve(
+    interval: Annotated[
+        Optional[float], typer.Option(help="Seconds between two sync cycles")
+    ] = None,
+    jitter: Annotated[
+        Optional[float], typer.Option(help="Maximal random offset of a cycle")
+    ] = None,
+):
+    """
+    Sync periodically and answer list, start, stop and remove from a warm process
+    """
+    signature = None
+
+    def cycle():
+        nonlocal signature
+        utils.pinfo(f"Sync cycle at {datetime.now().strftime('%H:%M:%S')}")
+        signature = run_sync_cycle(signature)
+
+    daemon.Daemon(
+        cycle,
+        {
+            "list": list_reclaim_tasks,
+            "start": start_task,
+            "stop": stop_task,
+            "remove": remove_task,
+        },
+        interval=interval if interval is not None else daemon.get_interval(),
+        jitter=jitter if jitter is not None else daemon.get_jitter(),
+    ).serve()
+
+
 @app.command("upload_to_scheduler")
-def upload_to_scheduler(dry_run: bool = False):
+def upload_to_scheduler(
+    dry_run: bool = False,
+    concurrency: Annotated[
+        int, typer.Option(help="Number of tasks created in parallel")
+    ] = 4,
+):
     """
-    Upload things tasks to task-scheduler
+    Upload new things tasks to task-scheduler
     """
-    tasks = things_handler.get_all_things_tasks()
-    for task in tasks:
-        print(f"Creating task {things_handler.full_name(task)} in Task Scheduler")
-        if not dry_run:
-            things_to_task(task)
-    print(f"Uploaded {len(tasks)} task{'s' if len(tasks) > 1 else ''}")    
+    payloads = []
+    for task in things_handler.get_all_things_tasks():
+        try:
+            payloads.append(
+                task_scheduler_handler.param_dict_to_task(generate_params_dict(task))
+            )
+        except ValueError as e:
+            utils.pwarning(f"{things_handler.full_name(task)} is skipped: {e}")
+    new_payloads, changed_payloads = task_scheduler_handler.diff_tasks(
+        payloads, task_scheduler_handler.get_tasks_by_things_id()
+    )
+    for payload in changed_payloads:
+        # the task scheduler api has no update endpoint
+        utils.pwarning(f"{payload['name']} changed since it was uploaded")
+    if not new_payloads:
+        print("No new tasks were found")
+        return
+    if dry_run:
+        for payload in new_payloads:
+            print(f"Creating task {payload['name']} in Task Scheduler")
+        return
+    uploaded = 0
+    for result in task_scheduler_handler.upload_tasks(new_payloads, concurrency):
+        if result.error is None:
+            print(f"Created task {result.item['name']} in Task Scheduler")
+            uploaded += 1
+        else:
+            utils.perror(f"Could not create {result.item['name']}: {result.error}")
+    print(f"Uploaded {uploaded} task{'s' if uploaded != 1 else ''}")
+
 
 if __name__ == "__main__":
     app()
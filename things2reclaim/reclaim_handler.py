@@ -1,34 +1,63 @@
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Pattern, Optional
+from functools import cache
+import hashlib
+import json
+from typing import Iterable, List, Dict, Pattern, Optional
 import re
 
 import emoji
-import tomllib
 from dateutil import tz
-from reclaim_sdk.client import ReclaimClient
+from reclaim_sdk.client import ReclaimAPICall, ReclaimClient
 from reclaim_sdk.models.task import ReclaimTask
 from reclaim_sdk.models.task_event import ReclaimTaskEvent
 
+from database_handler import UploadedTasksDB
 from deadline_status import DeadlineStatus
+from task_name_index import TaskNameIndex
+import task_name_index
 import utils
 
-CONFIG_PATH = utils.get_project_root() / "things2reclaim/config/.reclaim.toml"
+CONFIG_FILE = ".reclaim.toml"
 
-_config = {}
+THINGS_ID_PATTERN = "things_task:[a-zA-z0-9]+"
 
-with open(CONFIG_PATH, "rb") as f:
-    _config = tomllib.load(f)
+things_id_pattern: Pattern[str] = re.compile(THINGS_ID_PATTERN)
 
-RECLAIM_TOKEN = _config["reclaim_ai"]["token"]
 
-THINGS_ID_PATTERN = "things_task:[a-zA-z0-9]+"
+class InitializedClient(ReclaimClient):
+    """
+    ReclaimClient that is set up once by get_client. ReclaimAPICall calls
+    ReclaimClient() for every request, which would run httpx.Client.__init__
+    on the singleton again and reset its connection pool and headers while
+    other threads have requests in flight
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
 
-things_id_pattern: Pattern[str] = re.compile(THINGS_ID_PATTERN)
 
-ReclaimClient(token=RECLAIM_TOKEN)
+@cache
+def get_client() -> ReclaimClient:
+    """
+    Sets up the client every api call of the sdk uses as its singleton
+    """
+    config = utils.load_config(CONFIG_FILE)["reclaim_ai"]
+    client = object.__new__(InitializedClient)
+    client._api_url = config.get("api_url", ReclaimClient._api_url)
+    ReclaimClient.__init__(client, token=config["token"])
+    ReclaimClient._instance = client
+    return client
+
+
+def get_cache_ttl() -> float:
+    """
+    Seconds the locally cached task list is served without asking reclaim
+    """
+    return utils.load_config(".things2reclaim.toml")["database"].get("cache_ttl", 300)
 
 
 def get_reclaim_task(name: str) -> Optional[ReclaimTask]:
+    get_client()
     res = ReclaimTask.search(title=name)
     if not res:
         return None
@@ -36,18 +65,54 @@ def get_reclaim_task(name: str) -> Optional[ReclaimTask]:
         return res[0]
 
 
-def get_reclaim_task_fuzzy(task_name: str) -> Optional[ReclaimTask]:
-    tasks: Dict[str, ReclaimTask] = {
-        task.name: task for task in get_reclaim_tasks()
-    }
-    if task_name not in tasks.keys():
-        return utils.get_closest_match(task_name, tasks)
-    else:
-        return tasks[task_name]
+def get_reclaim_task_fuzzy(
+    task_name: str, tasks: Optional[List[ReclaimTask]] = None
+) -> Optional[ReclaimTask]:
+    if tasks is None:
+        tasks = get_reclaim_tasks()
+    candidates: Dict[str, ReclaimTask] = {task.name: task for task in tasks}
+    return task_name_index.resolve(
+        get_task_name_index(list(candidates.keys())), task_name, candidates
+    )
+
+
+def get_task_name_index(names: List[str]) -> TaskNameIndex:
+    """
+    Loads the name index stored next to the task cache
+    and rebuilds it when the task names changed
+    """
+    signature = hashlib.sha1("\n".join(names).encode()).hexdigest()
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        cached_index = db.get_cached_value("reclaim_task_name_index", float("inf"))
+        if cached_index is not None and cached_index["signature"] == signature:
+            return TaskNameIndex.from_dict(cached_index)
+        index = TaskNameIndex(names)
+        db.store_cached_value(
+            "reclaim_task_name_index", {**index.to_dict(), "signature": signature}
+        )
+    return index
+
+
+def get_reclaim_tasks(use_cache: bool = True) -> List[ReclaimTask]:
+    """
+    The task list, served from the local cache for read-only commands.
+    Commands that write to reclaim pass use_cache=False to act on live tasks
+    """
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        cached_tasks = (
+            db.get_cached_reclaim_tasks(get_cache_ttl()) if use_cache else None
+        )
+        if cached_tasks is not None:
+            return [ReclaimTask(data=data) for data in cached_tasks]
+        get_client()
+        tasks = ReclaimTask.search()
+        db.store_reclaim_tasks([task._data for task in tasks])
+    return tasks
 
 
-def get_reclaim_tasks() -> List[ReclaimTask]:
-    return ReclaimTask.search()
+def invalidate_task_cache():
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        db.invalidate_reclaim_tasks()
 
 
 def get_reclaim_task_names(tasks: Optional[List[ReclaimTask]] = None):
@@ -97,19 +162,62 @@ def get_task_events_since(since_days: int = 0) -> List[ReclaimTaskEvent]:
     date_now = datetime.now(tz.tzlocal()).date()
     date_since = date_now - timedelta(days=since_days)
     date_end = date_now + timedelta(days=1)  # end date is exclusive
+    get_client()
     events = ReclaimTaskEvent.search(date_since, date_end)
     return [event for event in events if is_task_time_entry(event.name)]
 
 
 def get_events_date_range(from_date: date, to_date: date):
+    get_client()
     return ReclaimTaskEvent.search(from_date, to_date)
 
 
-def create_reaclaim_task_from_dict(params: Dict):
-    new_task = ReclaimTask()
+def create_reaclaim_task_from_dict(params: Dict, invalidate_cache: bool = True):
+    get_client()
+    # the default data dict of ReclaimTask is shared between instances
+    new_task = ReclaimTask(data={})
     for key, value in params.items():
         setattr(new_task, key, value)
     new_task.save()
+    if invalidate_cache:
+        invalidate_task_cache()
+    return new_task
+
+
+def get_task_payload(params: Dict) -> Dict:
+    """
+    The fields reclaim receives for the task params
+    """
+    task = ReclaimTask(data={})
+    for key, value in params.items():
+        setattr(task, key, value)
+    return task._data
+
+
+def get_payload_fingerprint(payload: Dict) -> str:
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def patch_reclaim_task(
+    task: ReclaimTask, old_payload: Dict, new_payload: Dict
+) -> Optional[ReclaimTask]:
+    """
+    Sends only the fields that differ between the payloads,
+    fields missing in new_payload are cleared.
+    Returns None if nothing had to be sent
+    """
+    changes = {
+        key: new_payload.get(key)
+        for key in old_payload.keys() | new_payload.keys()
+        if old_payload.get(key) != new_payload.get(key)
+    }
+    if not changes:
+        return None
+    get_client()
+    with ReclaimAPICall(task) as client:
+        response = client.patch(f"{ReclaimTask._endpoint}/{task.id}", json=changes)
+        response.raise_for_status()
+    return ReclaimTask(data=response.json())
 
 
 def log_work_for_task(task: ReclaimTask, start: datetime, end: datetime):
@@ -126,7 +234,12 @@ def log_work_for_task(task: ReclaimTask, start: datetime, end: datetime):
     adjust_time_entry(last_event, start, end)
 
 
-def adjust_time_entry(time_entry: ReclaimTaskEvent, start: datetime, end: datetime):
+def adjust_time_entry(
+    time_entry: ReclaimTaskEvent,
+    start: datetime,
+    end: datetime,
+    invalidate_cache: bool = True,
+):
     utc = tz.tzutc()
     if start.tzinfo is None:
         raise ValueError("start is not timezone aware")
@@ -134,23 +247,56 @@ def adjust_time_entry(time_entry: ReclaimTaskEvent, start: datetime, end: dateti
     if end.tzinfo is None:
         raise ValueError("end is not timezone aware")
 
+    get_client()
     time_entry.start = start.astimezone(utc)
     time_entry.end = end.astimezone(utc)
     time_entry.save()
+    if invalidate_cache:
+        invalidate_task_cache()
 
 
 def finish_task(task: ReclaimTask):
+    get_client()
     task.mark_complete()
+    invalidate_task_cache()
 
 
-def get_by_things_id(id: str):
-    tasks = [task for task in ReclaimTask.search() if get_things_id(task) == id]
-    if len(tasks) == 0:
-        return None
-    elif len(tasks) == 1:
-        return tasks[0]
-    else:
-        raise ValueError("multiple reclaims tasks are mapped to the same things id")
+def get_task_stub(reclaim_task_id: int, name: Optional[str] = None) -> ReclaimTask:
+    """
+    Task with only the id (and name) set, enough for calls addressing the
+    task by id without fetching it from reclaim first
+    """
+    return ReclaimTask(data={"id": reclaim_task_id, "title": name})
+
+
+def resolve_reclaim_task_ids(
+    things_ids: Iterable[str], index: Optional["ReclaimTaskIndex"] = None
+) -> Dict[str, int]:
+    """
+    Maps uploaded things ids to reclaim task ids through the local database.
+    Reclaim is only listed for ids uploaded before the mapping was stored,
+    the ids found there are stored for the next time
+    """
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        known_ids = db.get_reclaim_task_ids()
+        mapping = {}
+        missing_ids = []
+        for things_id in things_ids:
+            if things_id in known_ids:
+                mapping[things_id] = known_ids[things_id]
+            else:
+                missing_ids.append(things_id)
+        if missing_ids:
+            if index is None:
+                index = ReclaimTaskIndex()
+            found_ids = {}
+            for things_id in missing_ids:
+                task = index.get(things_id)
+                if task is not None:
+                    found_ids[things_id] = task.id
+            db.store_reclaim_task_ids(found_ids)
+            mapping.update(found_ids)
+    return mapping
 
 
 def get_things_id(task: ReclaimTask):
@@ -164,5 +310,46 @@ def get_things_id(task: ReclaimTask):
     return things_id_tag.split(":")[1]
 
 
-def get_reclaim_things_ids() -> List[str]:
-    return [get_things_id(task) for task in ReclaimTask.search()]
+def get_reclaim_things_ids(index: Optional["ReclaimTaskIndex"] = None) -> List[str]:
+    if index is None:
+        index = ReclaimTaskIndex()
+    return index.things_ids()
+
+
+class ReclaimTaskIndex:
+    """
+    Snapshot of the reclaim tasks fetched with a single search,
+    keyed by the things id stored in the task description
+    """
+
+    def __init__(self, tasks: Optional[List[ReclaimTask]] = None):
+        if tasks is None:
+            tasks = get_reclaim_tasks()
+        self.tasks: List[ReclaimTask] = tasks
+        self.by_things_id: Dict[str, ReclaimTask] = {}
+        self.duplicates: Dict[str, List[ReclaimTask]] = {}
+        for task in tasks:
+            self.add(task)
+
+    def __len__(self):
+        return len(self.by_things_id)
+
+    def __contains__(self, things_id: str):
+        return things_id in self.by_things_id
+
+    def add(self, task: ReclaimTask):
+        things_id = get_things_id(task)
+        if things_id in self.duplicates:
+            self.duplicates[things_id].append(task)
+        elif things_id in self.by_things_id:
+            self.duplicates[things_id] = [self.by_things_id[things_id], task]
+        else:
+            self.by_things_id[things_id] = task
+
+    def get(self, things_id: str) -> Optional[ReclaimTask]:
+        if things_id in self.duplicates:
+            raise ValueError("multiple reclaims tasks are mapped to the same things id")
+        return self.by_things_id.get(things_id)
+
+    def things_ids(self) -> List[str]:
+        return list(self.by_things_id.keys())
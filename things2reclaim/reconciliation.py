@@ -0,0 +1,182 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from reclaim_sdk.models.task_event import ReclaimTaskEvent
+from toggl_python import TimeEntry
+
+import utils
+
+
+class Interval(NamedTuple):
+    name: str  # clean time entry name
+    start: datetime
+    end: datetime
+    item: Any  # TimeEntry or ReclaimTaskEvent
+
+
+class Adjustment(NamedTuple):
+    toggl: Interval
+    reclaim: Interval
+    overlap: timedelta
+
+
+class ReconciliationPlan(NamedTuple):
+    creates: List[Interval]  # toggl entries without a reclaim event
+    adjusts: List[Adjustment]  # reclaim events that have to be moved to the toggl entry
+    unchanged: List[Adjustment]  # reclaim events that already match the toggl entry
+    deletes: List[Interval]  # reclaim events without a toggl entry
+
+
+def toggl_interval(time_entry: TimeEntry) -> Interval:
+    return Interval(
+        utils.get_clean_time_entry_name(time_entry.description or ""),
+        utils.get_start_time(time_entry),
+        utils.get_stop_time(time_entry),
+        time_entry,
+    )
+
+
+def toggl_intervals(time_entries: Iterable[TimeEntry]) -> Iterator[Interval]:
+    """
+    Intervals of the stopped time entries, running ones can't be reconciled yet
+    """
+    for time_entry in time_entries:
+        if time_entry.stop is not None:
+            yield toggl_interval(time_entry)
+
+
+def reclaim_interval(event: ReclaimTaskEvent) -> Interval:
+    return Interval(
+        utils.get_clean_time_entry_name(event.name), event.start, event.end, event
+    )
+
+
+def group_by_name(intervals: Iterable[Interval]) -> Dict[str, List[Interval]]:
+    groups: Dict[str, List[Interval]] = defaultdict(list)
+    for interval in intervals:
+        groups[interval.name].append(interval)
+    for group in groups.values():
+        group.sort(key=lambda interval: interval.start)
+    return groups
+
+
+class _FreeSlots:
+    """
+    Finds the nearest unmatched index left or right of a position in
+    near constant time (union-find with path halving)
+    """
+
+    def __init__(self, size: int):
+        self.right = list(range(size + 1))  # size is the sentinel for "none"
+        self.left = list(range(size + 1))  # shifted by one, 0 is the sentinel
+
+    @staticmethod
+    def _find(parents: List[int], index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def next_right(self, index: int) -> int:
+        return self._find(self.right, index)
+
+    def next_left(self, index: int) -> int:
+        return self._find(self.left, index + 1) - 1
+
+    def take(self, index: int):
+        self.right[index] = index + 1
+        self.left[index + 1] = index
+
+
+def overlap(a: Interval, b: Interval) -> timedelta:
+    return max(timedelta(0), min(a.end, b.end) - max(a.start, b.start))
+
+
+def _score(toggl: Interval, reclaim: Interval):
+    # more overlap first, nearer start second
+    return (-overlap(toggl, reclaim), abs(reclaim.start - toggl.start))
+
+
+def match_group(
+    toggl_group: List[Interval],
+    reclaim_group: List[Interval],
+    max_start_distance: Optional[timedelta] = None,
+) -> Tuple[List[Adjustment], List[Interval], List[Interval]]:
+    """
+    Matches two start sorted lists of the same name one to one.
+    Every toggl entry takes the unmatched reclaim event with the best
+    overlap among its nearest unmatched neighbours by start time.
+    Returns the matches and the unmatched entries of both sides
+    """
+    reclaim_starts = [interval.start for interval in reclaim_group]
+    free = _FreeSlots(len(reclaim_group))
+    matches: List[Adjustment] = []
+    unmatched_toggl: List[Interval] = []
+    for toggl in toggl_group:
+        position = bisect_left(reclaim_starts, toggl.start)
+        candidates = [
+            index
+            for index in (free.next_left(position - 1), free.next_right(position))
+            if 0 <= index < len(reclaim_group)
+        ]
+        if max_start_distance is not None:
+            candidates = [
+                index
+                for index in candidates
+                if abs(reclaim_starts[index] - toggl.start) <= max_start_distance
+            ]
+        if not candidates:
+            unmatched_toggl.append(toggl)
+            continue
+        best = min(candidates, key=lambda index: _score(toggl, reclaim_group[index]))
+        free.take(best)
+        reclaim = reclaim_group[best]
+        matches.append(Adjustment(toggl, reclaim, overlap(toggl, reclaim)))
+
+    matched = {id(adjustment.reclaim) for adjustment in matches}
+    unmatched_reclaim = [
+        interval for interval in reclaim_group if id(interval) not in matched
+    ]
+    return matches, unmatched_toggl, unmatched_reclaim
+
+
+def is_same_time(adjustment: Adjustment) -> bool:
+    return (
+        adjustment.toggl.start == adjustment.reclaim.start
+        and adjustment.toggl.end == adjustment.reclaim.end
+    )
+
+
+def reconcile(
+    toggl_intervals: Iterable[Interval],
+    reclaim_intervals: Iterable[Interval],
+    max_start_distance: Optional[timedelta] = None,
+) -> ReconciliationPlan:
+    """
+    Plans which reclaim events have to be created, moved or deleted
+    so that reclaim mirrors the time tracked in toggl
+    """
+    toggl_groups = group_by_name(toggl_intervals)
+    reclaim_groups = group_by_name(reclaim_intervals)
+    plan = ReconciliationPlan([], [], [], [])
+    for name in toggl_groups.keys() | reclaim_groups.keys():
+        matches, unmatched_toggl, unmatched_reclaim = match_group(
+            toggl_groups.get(name, []),
+            reclaim_groups.get(name, []),
+            max_start_distance,
+        )
+        for adjustment in matches:
+            if is_same_time(adjustment):
+                plan.unchanged.append(adjustment)
+            else:
+                plan.adjusts.append(adjustment)
+        plan.creates.extend(unmatched_toggl)
+        plan.deletes.extend(unmatched_reclaim)
+
+    plan.creates.sort(key=lambda interval: interval.start)
+    plan.adjusts.sort(key=lambda adjustment: adjustment.toggl.start)
+    plan.unchanged.sort(key=lambda adjustment: adjustment.toggl.start)
+    plan.deletes.sort(key=lambda interval: interval.start)
+    return plan
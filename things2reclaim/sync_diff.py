@@ -0,0 +1,28 @@
+from typing import Callable, Iterable, List, NamedTuple, Set, TypeVar
+
+T = TypeVar("T")
+
+
+class SyncDiff(NamedTuple):
+    new: Set[str]  # only in source
+    removed: Set[str]  # only in target
+    common: Set[str]  # in both
+
+
+def diff_ids(source_ids: Iterable[str], target_ids: Iterable[str]) -> SyncDiff:
+    """
+    Compares the ids of the side that is synced from (source)
+    with the ids of the side that is synced to (target) in linear time
+    """
+    source = set(source_ids)
+    target = set(target_ids)
+    return SyncDiff(
+        new=source - target, removed=target - source, common=source & target
+    )
+
+
+def select(items: Iterable[T], ids: Set[str], key: Callable[[T], str]) -> List[T]:
+    """
+    Returns the items whose key is in ids, keeping their order
+    """
+    return [item for item in items if key(item) in ids]
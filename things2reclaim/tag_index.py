@@ -0,0 +1,63 @@
+from collections import defaultdict
+import difflib
+from typing import Dict, Iterable, List, Set
+
+# abbreviations used in task names and the words used in tag names
+EXPANSIONS = {"vl": "vorlesung"}
+# same cutoff as difflib.get_close_matches
+MATCH_CUTOFF = 0.6
+
+
+def normalize(word: str) -> str:
+    word = word.lower()
+    return EXPANSIONS.get(word, word)
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TagIndex:
+    """
+    Precomputed lookup of tag names by lowercase/expanded key and by trigram,
+    so matching a description only scores the tags sharing a trigram with it
+    """
+
+    def __init__(self, tag_names: Iterable[str]):
+        self.tag_names: List[str] = list(tag_names)
+        self.by_key: Dict[str, List[str]] = defaultdict(list)
+        self.by_trigram: Dict[str, Set[str]] = defaultdict(set)
+        self.word_matches: Dict[str, Set[str]] = {}
+        for tag_name in self.tag_names:
+            key = normalize(tag_name)
+            self.by_key[key].append(tag_name)
+            for trigram in trigrams(key):
+                self.by_trigram[trigram].add(key)
+
+    def __contains__(self, tag_name: str):
+        return tag_name in self.by_key.get(normalize(tag_name), [])
+
+    def match_word(self, word: str) -> Set[str]:
+        key = normalize(word)
+        if key in self.by_key:
+            return set(self.by_key[key])
+        if key not in self.word_matches:
+            self.word_matches[key] = self._fuzzy_match(key)
+        return self.word_matches[key]
+
+    def _fuzzy_match(self, key: str) -> Set[str]:
+        candidates: Set[str] = set()
+        for trigram in trigrams(key):
+            candidates.update(self.by_trigram.get(trigram, ()))
+        matches = set()
+        for candidate in candidates:
+            if difflib.SequenceMatcher(None, key, candidate).ratio() >= MATCH_CUTOFF:
+                matches.update(self.by_key[candidate])
+        return matches
+
+    def match(self, description: str) -> Set[str]:
+        possible_tags = set()
+        for word in description.split():
+            possible_tags.update(self.match_word(word))
+        return possible_tags
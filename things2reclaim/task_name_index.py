@@ -0,0 +1,114 @@
+from collections import Counter, defaultdict
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+import emoji
+from better_rich_prompts.prompt import ListPrompt
+
+T = TypeVar("T")
+
+# minimal dice similarity of the trigrams of query and task name
+MATCH_CUTOFF = 0.5
+# a query number missing in the task name ("VL 3" vs "VL 13") halves the score
+NUMBER_MISMATCH_FACTOR = 0.5
+# same course prefix ("Ana", "LinAlg", ...) as the query
+PREFIX_BONUS = 0.1
+
+non_word_pattern = re.compile(r"[\W_]+")
+
+
+def normalize(name: str) -> str:
+    name = emoji.replace_emoji(name, "").lower()
+    return " ".join(non_word_pattern.sub(" ", name).split())
+
+
+def tokenize(name: str) -> List[str]:
+    return normalize(name).split()
+
+
+def trigrams(normalized_name: str) -> Set[str]:
+    padded = f"  {normalized_name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TaskNameIndex:
+    """
+    Inverted trigram index over task names. Only names sharing a trigram
+    with the query are scored, numbers and the course prefix are weighted
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.names: List[str] = list(dict.fromkeys(names))
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self.gram_counts: List[int] = []
+        self.tokens: List[List[str]] = []
+        for name_id, name in enumerate(self.names):
+            normalized_name = normalize(name)
+            grams = trigrams(normalized_name)
+            self.gram_counts.append(len(grams))
+            self.tokens.append(normalized_name.split())
+            for gram in grams:
+                self.postings[gram].append(name_id)
+
+    def to_dict(self) -> Dict:
+        return {
+            "names": self.names,
+            "postings": self.postings,
+            "gram_counts": self.gram_counts,
+            "tokens": self.tokens,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TaskNameIndex":
+        index = cls([])
+        index.names = data["names"]
+        index.postings = defaultdict(list, data["postings"])
+        index.gram_counts = data["gram_counts"]
+        index.tokens = data["tokens"]
+        return index
+
+    def search(
+        self, query: str, limit: int = 5, cutoff: float = MATCH_CUTOFF
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns up to limit (name, score) pairs, best match first
+        """
+        normalized_query = normalize(query)
+        query_grams = trigrams(normalized_query)
+        shared_grams: Counter = Counter()
+        for gram in query_grams:
+            shared_grams.update(self.postings.get(gram, ()))
+        query_tokens = normalized_query.split()
+        query_prefix = query_tokens[0] if query_tokens else None
+        query_numbers = {token for token in query_tokens if token.isdigit()}
+        scored = []
+        for name_id, shared in shared_grams.items():
+            score = 2 * shared / (len(query_grams) + self.gram_counts[name_id])
+            if score + PREFIX_BONUS < cutoff:
+                # can't reach the cutoff, skip the token checks
+                continue
+            name_tokens = self.tokens[name_id]
+            if query_numbers and not query_numbers.issubset(name_tokens):
+                score *= NUMBER_MISMATCH_FACTOR
+            if name_tokens and name_tokens[0] == query_prefix:
+                score += PREFIX_BONUS
+            score = min(score, 1.0)
+            if score >= cutoff:
+                scored.append((self.names[name_id], score))
+        scored.sort(key=lambda match: match[1], reverse=True)
+        return scored[:limit]
+
+
+def resolve(index: TaskNameIndex, query: str, candidates: Dict[str, T]) -> Optional[T]:
+    """
+    Returns the candidate named query, the single fuzzy match
+    or the one the user selects from the ranked matches
+    """
+    if query in candidates:
+        return candidates[query]
+    matches = [name for name, _ in index.search(query) if name in candidates]
+    if not matches:
+        return None
+    if len(matches) == 1:
+        return candidates[matches[0]]
+    return candidates[ListPrompt.ask("Select a candidate", matches)]
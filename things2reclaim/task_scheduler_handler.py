@@ -1,40 +1,94 @@
-from typing import Dict, List
+from functools import cache
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 from task_scheduler_client.configuration import Configuration
 from task_scheduler_client.api.default_api import DefaultApi
 from task_scheduler_client.api_client import ApiClient
 from task_scheduler_client.models.task import Task
 
-client = ApiClient(Configuration(host="http://localhost:8000"))
-api = DefaultApi(client)
+import utils
+import worker_pool
+
+TASK_SCHEDULER_HOST = "http://localhost:8000"
+# reclaim param names that are called differently in the task scheduler
+KEY_MAPPING = {"min_work_duration": "min_time", "max_work_duration": "max_work", "duration": "estimated_time", "due_date": "deadline", "description": "things_id"}
+REMOVED_KEYS = {"tags"}
+THINGS_ID_PREFIX = "things_task:"
+
+def get_host() -> str:
+    config = utils.load_config(".things2reclaim.toml")
+    return config.get("task_scheduler", {}).get("host", TASK_SCHEDULER_HOST)
+
+@cache
+def get_api() -> DefaultApi:
+    return DefaultApi(ApiClient(Configuration(host=get_host())))
 
 def get_tasks() -> List[Task]:
-    return api.get_tasks_tasks_get()
+    return get_api().get_tasks_tasks_get()
 
-def remap_dict_keys(params: Dict):
-    key_mapping = {"min_work_duration": "min_time", "max_work_duration": "max_work", "duration": "estimated_time", "due_date": "deadline", "description": "things_id"}
-    return {key_mapping.get(k,k): v for k, v in params.items()}
+def param_dict_to_task(params: Dict) -> Dict:
+    """
+    Renames, drops and strips the reclaim params in a single pass
+    """
+    task = {}
+    for key, value in params.items():
+        if key in REMOVED_KEYS:
+            continue
+        key = KEY_MAPPING.get(key, key)
+        if key == "things_id":
+            value = value.removeprefix(THINGS_ID_PREFIX)
+        task[key] = value
+    return task
 
-def remove_keys(params: Dict):
-    keys_to_remove = {"tags"}
-    return {k: v for k, v in params.items() if k not in keys_to_remove}
+def get_tasks_by_things_id() -> Dict[str, Task]:
+    return {task.things_id: task for task in get_tasks() if task.things_id}
 
-def change_value(params: Dict):
-    keys_to_change = {"things_id": "things_task:"}
-    return {k: (v if k not in keys_to_change else v.removeprefix(keys_to_change[k])) for k, v in params.items()}
+def is_changed(task: Task, payload: Dict) -> bool:
+    """
+    Compares the fields set in payload, fields only set by the scheduler are ignored
+    """
+    current = task.to_dict()
+    new_task = Task.from_dict(payload)
+    if new_task is None:
+        raise ValueError
+    return any(current.get(key) != value for key, value in new_task.to_dict().items())
 
-def param_dict_to_task(params: Dict):
-    remapped_keys = remap_dict_keys(params)
-    stripped_keys = remove_keys(remapped_keys)
-    return change_value(stripped_keys)
+def diff_tasks(payloads: Iterable[Dict], tasks: Dict[str, Task]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Splits the payloads into new ones and changed ones by things id,
+    unchanged tasks are dropped
+    """
+    new = []
+    changed = []
+    for payload in payloads:
+        task = tasks.get(payload["things_id"])
+        if task is None:
+            new.append(payload)
+        elif is_changed(task, payload):
+            changed.append(payload)
+    return new, changed
 
 def create_task(task: Task):
-    api.create_task_tasks_post(task)
+    get_api().create_task_tasks_post(task)
 
-def create_task_from_dict(params: Dict):
-    params = param_dict_to_task(params)
-    task = Task.from_dict(params)
+def create_task_from_payload(payload: Dict) -> Task:
+    task = Task.from_dict(payload)
     if task is None:
         raise ValueError
-    api.create_task_tasks_post(task)
+    return get_api().create_task_tasks_post(task)
+
+def create_task_from_dict(params: Dict):
+    create_task_from_payload(param_dict_to_task(params))
+
+def upload_tasks(payloads: List[Dict], concurrency: int = 4) -> Iterator[worker_pool.TaskResult]:
+    """
+    Creates the tasks of the payloads concurrently, yields in completion order.
+    A create is only retried when it can't have reached the server
+    """
+    return worker_pool.run_concurrently(
+        create_task_from_payload,
+        payloads,
+        concurrency=concurrency,
+        retryable=worker_pool.is_retryable_create,
+    )
 
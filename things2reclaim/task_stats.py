@@ -0,0 +1,150 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from reclaim_sdk.models.task import ReclaimTask
+
+from deadline_status import DeadlineStatus
+
+
+class BucketKey(NamedTuple):
+    course: str
+    deadline_status: DeadlineStatus
+    scheduled: bool
+
+
+class Bucket:
+    """
+    Running totals of the tasks sharing a BucketKey
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # hours
+        self.last_scheduled: Optional[datetime] = None
+
+    def add(self, duration: float, scheduled_start: Optional[datetime]):
+        self.count += 1
+        self.duration += duration
+        if scheduled_start is not None and (
+            self.last_scheduled is None or scheduled_start > self.last_scheduled
+        ):
+            self.last_scheduled = scheduled_start
+
+    def merge(self, other: "Bucket"):
+        self.count += other.count
+        self.duration += other.duration
+        if other.last_scheduled is not None and (
+            self.last_scheduled is None or other.last_scheduled > self.last_scheduled
+        ):
+            self.last_scheduled = other.last_scheduled
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "duration": self.duration,
+            "last_scheduled": (
+                self.last_scheduled.isoformat() if self.last_scheduled else None
+            ),
+        }
+
+
+def get_course(task_name: str, courses: Iterable[str] = ()) -> str:
+    """
+    The longest of the courses the task name starts with, without a
+    matching course the first word of the name
+    """
+    course = max(
+        (
+            course
+            for course in courses
+            if task_name == course or task_name.startswith(course + " ")
+        ),
+        key=len,
+        default=None,
+    )
+    return course if course is not None else task_name.split(" ")[0]
+
+
+def get_deadline_status(
+    due_date: Optional[datetime], cur_date: datetime
+) -> DeadlineStatus:
+    if due_date is None:
+        return DeadlineStatus.NONE
+    if due_date >= cur_date:
+        return DeadlineStatus.FINE
+    return DeadlineStatus.OVERDUE
+
+
+class TaskStats:
+    """
+    Tasks bucketed by course x deadline status x scheduled in a single pass.
+    Queries merge the matching buckets instead of filtering the tasks again
+    """
+
+    def __init__(
+        self,
+        tasks: Iterable[ReclaimTask],
+        cur_date: datetime,
+        courses: Iterable[str] = (),
+    ):
+        """
+        courses: known course names, tasks are bucketed by the longest one
+        their name starts with
+        """
+        courses = list(courses)
+        self.cur_date = cur_date
+        self.buckets: Dict[BucketKey, Bucket] = {}
+        for task in tasks:
+            key = BucketKey(
+                get_course(task.name, courses),
+                get_deadline_status(task.due_date, cur_date),
+                task.scheduled_start_date is not None,
+            )
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = Bucket()
+            bucket.add(task.duration or 0, task.scheduled_start_date)
+
+    def courses(self) -> List[str]:
+        return sorted({key.course for key in self.buckets})
+
+    def total(
+        self,
+        course: Optional[str] = None,
+        deadline_status: Optional[DeadlineStatus] = None,
+        scheduled: Optional[bool] = None,
+    ) -> Bucket:
+        """
+        Merges all buckets matching the given fields, None matches everything
+        """
+        total = Bucket()
+        for key, bucket in self.buckets.items():
+            if (
+                (course is None or key.course == course)
+                and (deadline_status is None or key.deadline_status == deadline_status)
+                and (scheduled is None or key.scheduled == scheduled)
+            ):
+                total.merge(bucket)
+        return total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "date": self.cur_date.isoformat(),
+            "total": self.total().to_dict(),
+            "buckets": [
+                {
+                    "course": key.course,
+                    "deadline_status": key.deadline_status.name.lower(),
+                    "scheduled": key.scheduled,
+                    **bucket.to_dict(),
+                }
+                for key, bucket in sorted(
+                    self.buckets.items(),
+                    key=lambda item: (
+                        item[0].course,
+                        item[0].deadline_status.value,
+                        not item[0].scheduled,
+                    ),
+                )
+            ],
+        }
@@ -1,39 +1,215 @@
-from typing import Dict, List
-import tomllib
+from functools import cache
+from pathlib import Path
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 import things
+from things.database import Database, make_tasks_sql_query
 
 from database_handler import UploadedTasksDB
+from task_name_index import TaskNameIndex
+import task_name_index
 import utils
 
-_config = {}
-CONFIG_PATH = utils.get_project_root() / "things2reclaim/config/.things2reclaim.toml"
-with open(CONFIG_PATH, "rb") as f:
-    _config = tomllib.load(f)
-
-
-DATABASE_PATH = utils.get_project_root() / _config["database"]["path"]
+UNI_AREA_TITLE = "Uni"
+# ascii unit separator, joins the tag titles of a task in bulk queries
+TAG_SEPARATOR = "\x1f"
+# stay below the sqlite limit of host parameters per statement
+MAX_QUERY_PARAMETERS = 900
+
+UNI_TASKS_PREDICATE = """
+    TASK.type = 0
+    AND TASK.status = 0
+    AND NOT IFNULL(TASK.trashed, 0)
+    AND TASK.rt1_recurrenceRule IS NULL
+    AND NOT IFNULL(PROJECT.trashed, 0)
+    AND NOT IFNULL(PROJECT_OF_HEADING.trashed, 0)
+    AND COALESCE(TASK.project, PROJECT_OF_HEADING.uuid) IN (
+        SELECT uuid FROM TMTask
+        WHERE type = 1 AND status = 0 AND NOT trashed
+        AND area IN (SELECT uuid FROM TMArea WHERE title = ?)
+    )
+"""
+
+# open uni to-dos and the ones completed since a unix timestamp,
+# also of completed projects
+UNI_TASKS_COMPLETED_SINCE_PREDICATE = """
+    TASK.type = 0
+    AND (TASK.status = 0 OR (TASK.status = 3 AND TASK.stopDate >= ?))
+    AND NOT IFNULL(TASK.trashed, 0)
+    AND TASK.rt1_recurrenceRule IS NULL
+    AND NOT IFNULL(PROJECT.trashed, 0)
+    AND NOT IFNULL(PROJECT_OF_HEADING.trashed, 0)
+    AND COALESCE(TASK.project, PROJECT_OF_HEADING.uuid) IN (
+        SELECT uuid FROM TMTask
+        WHERE type = 1 AND NOT trashed
+        AND area IN (SELECT uuid FROM TMArea WHERE title = ?)
+    )
+"""
 
 
 def extract_uni_projects():
-    uni_area = next(area for area in things.areas() if area["title"] == "Uni")
+    uni_area = next(area for area in things.areas() if area["title"] == UNI_AREA_TITLE)
     return things.projects(area=uni_area["uuid"])
 
 
+@cache
+def get_database() -> Database:
+    return Database()
+
+
+def query_tasks(where_predicate: str, parameters: Sequence = ()) -> List[Dict]:
+    """
+    Runs a things.py task query and fetches the tag titles of all tasks
+    in the same statement instead of one query per task
+    """
+    sql_query = f"""
+        SELECT TASKS.*, TASK_TAGS.tag_titles
+        FROM ({make_tasks_sql_query(where_predicate)}) AS TASKS
+        LEFT OUTER JOIN (
+            SELECT TASK_TAG.tasks AS task, group_concat(TAG.title, char(31)) AS tag_titles
+            FROM TMTaskTag AS TASK_TAG
+            JOIN TMTag AS TAG ON TAG.uuid = TASK_TAG.tags
+            GROUP BY TASK_TAG.tasks
+        ) AS TASK_TAGS ON TASK_TAGS.task = TASKS.uuid
+        ORDER BY TASKS."index"
+        """
+    tasks = get_database().execute_query(sql_query, parameters)
+    for task in tasks:
+        tag_titles = task.pop("tag_titles")
+        if tag_titles:
+            task["tags"] = tag_titles.split(TAG_SEPARATOR)
+    return tasks
+
+
+def get_uni_tasks_modified_since(timestamp: float) -> List[Dict]:
+    """
+    Fetches the open uni to-dos edited after the unix timestamp
+    """
+    return query_tasks(
+        f"{UNI_TASKS_PREDICATE} AND TASK.userModificationDate > ?",
+        (UNI_AREA_TITLE, timestamp),
+    )
+
+
+def get_uni_tasks_completed_since(timestamp: float) -> List[Dict]:
+    """
+    Fetches the open uni to-dos and the ones completed after the unix timestamp
+    """
+    return query_tasks(
+        UNI_TASKS_COMPLETED_SINCE_PREDICATE, (timestamp, UNI_AREA_TITLE)
+    )
+
+
+def get_tasks_bulk(task_ids: Iterable[str]) -> List[Dict]:
+    """
+    Fetches the given tasks with one query per MAX_QUERY_PARAMETERS ids.
+    Unknown ids are skipped, the order of task_ids is kept
+    """
+    task_ids = list(task_ids)
+    tasks_by_id = {}
+    for offset in range(0, len(task_ids), MAX_QUERY_PARAMETERS):
+        chunk = task_ids[offset : offset + MAX_QUERY_PARAMETERS]
+        placeholders = ", ".join(["?"] * len(chunk))
+        for task in query_tasks(f"TASK.uuid IN ({placeholders})", chunk):
+            tasks_by_id[task["uuid"]] = task
+    return [tasks_by_id[task_id] for task_id in task_ids if task_id in tasks_by_id]
+
+
+def get_uni_tasks() -> List[Dict]:
+    """
+    Fetches the open to-dos of all open projects in the Uni area with one query
+    """
+    return query_tasks(UNI_TASKS_PREDICATE, (UNI_AREA_TITLE,))
+
+
 def get_task(task_id: str):
     return things.get(task_id)
 
 
 def get_task_by_name(task_name: str):
-    tasks = {task["name"] : task for task in get_all_things_tasks()}
-    if task_name not in tasks.keys():
-        return utils.get_closest_match(task_name, tasks)
-    else:
-        return tasks[task_name]
+    tasks = {full_name(task): task for task in get_all_things_tasks()}
+    return task_name_index.resolve(TaskNameIndex(tasks.keys()), task_name, tasks)
+
+
+# ids passed to complete that were not yet seen as completed in the things database
+pending_completions: Set[str] = set()
 
 
 def complete(task_id: str):
     things.complete(task_id)
+    pending_completions.add(task_id)
+
+
+def is_completed(task_id: str) -> bool:
+    task = things.get(task_id)
+    # a task that vanished from the database can't be completed anymore
+    return task is None or task.get("status") in ("completed", "canceled")
+
+
+def wait_for_completion(
+    task_ids: Optional[Iterable[str]] = None,
+    timeout: float = 30.0,
+    initial_delay: float = 0.05,
+    max_delay: float = 1.0,
+) -> Set[str]:
+    """
+    things.complete goes through the asynchronous url scheme.
+    Polls the things database with exponential backoff until the given tasks
+    (default: everything passed to complete) are completed or timeout seconds passed.
+    Returns the ids that are still not completed
+    """
+    checked = set(pending_completions if task_ids is None else task_ids)
+    pending = checked
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while pending:
+        pending = {task_id for task_id in pending if not is_completed(task_id)}
+        remaining = deadline - time.monotonic()
+        if not pending or remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+    pending_completions.difference_update(checked - pending)
+    return pending
+
+
+def get_database_signature() -> Tuple[Optional[Tuple[int, int]], ...]:
+    """
+    (mtime, size) of the things database and its write-ahead log.
+    Things writes to the log first, so the signature changes on every edit
+    even before the log is checkpointed into the database
+    """
+    database_path = Path(get_database().filepath)
+    signature = []
+    for path in (database_path, database_path.with_name(f"{database_path.name}-wal")):
+        try:
+            stat = path.stat()
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def wait_for_database_change(
+    signature: Tuple, timeout: Optional[float] = None, interval: float = 1.0
+) -> Tuple:
+    """
+    Polls the database signature until it differs from signature
+    or timeout seconds passed. Returns the latest signature
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        current = get_database_signature()
+        if current != signature:
+            return current
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return current
+            time.sleep(min(interval, remaining))
+        else:
+            time.sleep(interval)
 
 
 def get_tasks_for_project(project) -> Dict | List[Dict]:
@@ -45,19 +221,12 @@ def is_equal_fullname(things_task: Dict, name: str):
 
 
 def get_all_things_tasks() -> List:
-    tasks = []
-    projects = extract_uni_projects()
-    for project in projects:
-        tasks += get_tasks_for_project(project)
-    return tasks
+    return get_uni_tasks()
 
 
 def get_all_uploaded_things_tasks() -> List:
-    tasks = []
-    with UploadedTasksDB(DATABASE_PATH) as db:
-        for task_id in db.get_all_uploaded_tasks():
-            tasks.append(get_task(task_id))
-    return tasks
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        return get_tasks_bulk(db.get_all_uploaded_tasks())
 
 
 def get_task_tags(things_task: Dict) -> Dict[str, str]:
@@ -68,6 +237,7 @@ def full_name(things_task) -> str:
     return f"{things_task['project_title']} {things_task['title']}"
 
 
-def get_course_names():
+@cache
+def get_course_names() -> List[str]:
     projects = extract_uni_projects()
     return [course["title"] for course in projects]
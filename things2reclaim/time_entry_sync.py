@@ -0,0 +1,219 @@
+from datetime import date, datetime, time, timedelta
+import time as clock
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from dateutil import tz
+from reclaim_sdk.models.task_event import ReclaimTaskEvent
+from toggl_python.entities import TimeEntry
+
+from database_handler import SyncState, TimeEntryRecord, TimeEntryStore
+import reclaim_handler
+import toggl_handler
+import utils
+
+TOGGL = "toggl"
+RECLAIM = "reclaim"
+# toggl answers modified since queries for the last three months
+MAX_SINCE_AGE = 89 * 24 * 60 * 60
+# seconds a modified since query reaches back before the last sync
+SINCE_OVERLAP = 60
+# reclaim can't be asked for changed events, so the events from the day
+# before the last sync on are fetched again
+RECLAIM_REFETCH_DAYS = 1
+
+Range = Tuple[float, float]  # [start, end) as unix timestamps
+# [start, end) days and the records starting in them
+Window = Tuple[date, date, Iterable[TimeEntryRecord]]
+
+
+def midnight(day: date) -> float:
+    return datetime.combine(day, time.min, tz.tzlocal()).timestamp()
+
+
+def local_date(timestamp: float) -> date:
+    return datetime.fromtimestamp(timestamp, tz.tzlocal()).date()
+
+
+def toggl_record(time_entry: TimeEntry) -> TimeEntryRecord:
+    return TimeEntryRecord(
+        str(time_entry.id),
+        utils.get_clean_time_entry_name(time_entry.description or ""),
+        utils.get_start_time(time_entry).timestamp(),
+        (
+            None
+            if time_entry.stop is None
+            else utils.get_stop_time(time_entry).timestamp()
+        ),
+        None if time_entry.at is None else time_entry.at.timestamp(),
+        time_entry.model_dump(mode="json"),
+    )
+
+
+def reclaim_record(event: ReclaimTaskEvent) -> TimeEntryRecord:
+    return TimeEntryRecord(
+        str(event.id),
+        utils.get_clean_time_entry_name(event.name),
+        event.start.timestamp(),
+        event.end.timestamp(),
+        None,
+        event._data,
+    )
+
+
+def plan_fetches(
+    state: Optional[SyncState], start: float, end: float, fresh_until: float
+) -> Tuple[List[Range], SyncState]:
+    """
+    Returns the ranges to fetch so that [start, end) is covered and
+    nothing after fresh_until is served from the store, and the new state
+    """
+    now = clock.time()
+    if state is None:
+        return [(start, end)], SyncState(start, end, now)
+    covered_from = min(start, state.covered_from)
+    covered_to = max(end, state.covered_to)
+    ranges = []
+    if start < state.covered_from:
+        ranges.append((start, state.covered_from))
+    # also fills a gap between the stored range and a later start
+    refetch_from = max(fresh_until, state.covered_from)
+    if refetch_from < covered_to:
+        ranges.append((refetch_from, covered_to))
+    return ranges, SyncState(covered_from, covered_to, now)
+
+
+def fetch_ranges(
+    store: TimeEntryStore,
+    source: str,
+    ranges: List[Range],
+    fetch: Callable[[date, date], Iterable[Window]],
+):
+    """
+    Replaces the stored entries window by window as they arrive,
+    so only the windows in flight are held in memory
+    """
+    for start, end in ranges:
+        # the apis filter by day, whole days are fetched and replaced
+        from_date = local_date(start)
+        to_date = local_date(end - 1) + timedelta(days=1)
+        for window_start, window_end, records in fetch(from_date, to_date):
+            store.replace_range(
+                source, midnight(window_start), midnight(window_end), records
+            )
+
+
+def fetch_toggl(from_date: date, to_date: date) -> Iterator[Window]:
+    for window_start, window_end, entries in toggl_handler.iter_time_entry_windows(
+        from_date, to_date
+    ):
+        yield window_start, window_end, map(toggl_record, entries)
+
+
+def fetch_reclaim(from_date: date, to_date: date) -> Iterator[Window]:
+    # reclaim answers a range with a single request
+    yield from_date, to_date, (
+        reclaim_record(event)
+        for event in reclaim_handler.get_events_date_range(from_date, to_date)
+        if reclaim_handler.is_task_time_entry(event.name)
+    )
+
+
+def sync_toggl(store: TimeEntryStore, from_date: date, to_date: date):
+    """
+    Applies the entries modified since the last sync and fetches
+    the days that were never stored
+    """
+    now = clock.time()
+    # time entries don't start in the future
+    start, end = midnight(from_date), min(midnight(to_date), now)
+    state = store.get_sync_state(TOGGL)
+    if state is not None and now - state.synced_at > MAX_SINCE_AGE:
+        state = None
+    fresh_until = now
+    if state is not None:
+        changes = toggl_handler.get_modified_time_entries(
+            state.synced_at - SINCE_OVERLAP
+        )
+        store.delete(
+            TOGGL,
+            [str(entry["id"]) for entry in changes if entry.get("server_deleted_at")],
+        )
+        store.upsert(
+            TOGGL,
+            [
+                toggl_record(TimeEntry(**entry))
+                for entry in changes
+                if not entry.get("server_deleted_at")
+            ],
+        )
+        state = state._replace(covered_to=max(state.covered_to, now))
+        fresh_until = state.covered_to
+    ranges, state = plan_fetches(state, start, end, fresh_until)
+    fetch_ranges(store, TOGGL, ranges, fetch_toggl)
+    store.store_sync_state(TOGGL, state)
+
+
+def sync_reclaim(store: TimeEntryStore, from_date: date, to_date: date):
+    """
+    Fetches the days that were never stored and the ones since the last sync
+    """
+    state = store.get_sync_state(RECLAIM)
+    fresh_until = float("inf")
+    if state is not None:
+        fresh_until = min(
+            state.covered_to,
+            midnight(
+                local_date(state.synced_at) - timedelta(days=RECLAIM_REFETCH_DAYS)
+            ),
+        )
+    ranges, state = plan_fetches(
+        state, midnight(from_date), midnight(to_date), fresh_until
+    )
+    fetch_ranges(store, RECLAIM, ranges, fetch_reclaim)
+    store.store_sync_state(RECLAIM, state)
+
+
+def get_time_entries(from_date: date, to_date: date) -> List[TimeEntry]:
+    """
+    Toggl time entries started in [from_date, to_date) in start order
+    """
+    with TimeEntryStore(utils.get_database_path()) as store:
+        sync_toggl(store, from_date, to_date)
+        records = store.get_range(TOGGL, midnight(from_date), midnight(to_date))
+    return [TimeEntry(**record.data) for record in records]
+
+
+def get_task_events(from_date: date, to_date: date) -> List[ReclaimTaskEvent]:
+    """
+    Reclaim task events started in [from_date, to_date) in start order
+    """
+    with TimeEntryStore(utils.get_database_path()) as store:
+        sync_reclaim(store, from_date, to_date)
+        records = store.get_range(RECLAIM, midnight(from_date), midnight(to_date))
+    return [ReclaimTaskEvent(record.data) for record in records]
+
+
+def get_daily_durations(
+    from_date: date, to_date: date
+) -> List[Tuple[str, str, float]]:
+    """
+    Seconds tracked in toggl per (clean name, ISO day) in [from_date, to_date)
+    """
+    with TimeEntryStore(utils.get_database_path()) as store:
+        sync_toggl(store, from_date, to_date)
+        return store.get_daily_durations(TOGGL, midnight(from_date), midnight(to_date))
+
+
+def store_task_events(events: Iterable[ReclaimTaskEvent]):
+    """
+    Updates events changed by this process, so they are not served stale
+    until the days are fetched again
+    """
+    with TimeEntryStore(utils.get_database_path()) as store:
+        store.upsert(RECLAIM, map(reclaim_record, events))
+
+
+def invalidate():
+    with TimeEntryStore(utils.get_database_path()) as store:
+        store.clear_sync_states()
+
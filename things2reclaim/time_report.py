@@ -0,0 +1,138 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from task_stats import get_course
+
+
+class Progress:
+    """
+    Estimated and tracked hours of a task or the sum of several tasks
+    """
+
+    def __init__(self, estimate: float = 0.0, tracked: float = 0.0):
+        self.estimate = estimate  # hours
+        self.tracked = tracked  # hours
+
+    def merge(self, other: "Progress"):
+        self.estimate += other.estimate
+        self.tracked += other.tracked
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """
+        Tracked per estimated hour, None without an estimate
+        """
+        return self.tracked / self.estimate if self.estimate else None
+
+    @property
+    def remaining(self) -> float:
+        return max(self.estimate - self.tracked, 0.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "estimate": self.estimate,
+            "tracked": self.tracked,
+            "ratio": self.ratio,
+            "remaining": self.remaining,
+        }
+
+
+class TimeReport:
+    """
+    Estimated vs. tracked hours per task and course. The tracked time comes
+    pre-aggregated per (task name, day), so the report only folds one row per
+    task and day instead of every time entry. Time entries of neither an
+    estimated task nor a known course, like a lunch break, are ignored
+    """
+
+    def __init__(
+        self,
+        estimates: Dict[str, float],
+        daily_durations: Iterable[Tuple[str, str, float]],
+        courses: Iterable[str] = (),
+    ):
+        """
+        estimates: hours per task name
+        daily_durations: (task name, ISO day, seconds) in day order
+        courses: names of the courses whose unestimated tasks are reported
+        """
+        courses = list(courses)
+        known_courses = set(courses)
+        self.tasks: Dict[str, Progress] = {
+            name: Progress(estimate) for name, estimate in estimates.items()
+        }
+        self.task_courses: Dict[str, str] = {
+            name: get_course(name, courses) for name in estimates
+        }
+        # hours tracked on estimated tasks per course and day, for the burn-down
+        self.daily: Dict[str, Dict[str, float]] = {}
+        for name, day, seconds in daily_durations:
+            course = self.task_courses.get(name)
+            if course is None:
+                course = get_course(name, courses)
+                if course not in known_courses:
+                    continue
+                self.task_courses[name] = course
+            hours = seconds / 3600
+            task = self.tasks.get(name)
+            if task is None:
+                task = self.tasks[name] = Progress()
+            task.tracked += hours
+            if name in estimates:
+                course_days = self.daily.setdefault(course, {})
+                course_days[day] = course_days.get(day, 0.0) + hours
+
+    def courses(self) -> List[str]:
+        return sorted(set(self.task_courses.values()))
+
+    def task_names(self, course: Optional[str] = None) -> List[str]:
+        return sorted(
+            name
+            for name in self.tasks
+            if course is None or self.task_courses[name] == course
+        )
+
+    def total(self, course: Optional[str] = None) -> Progress:
+        """
+        Merges the tasks of the course, None merges all tasks
+        """
+        total = Progress()
+        for name in self.task_names(course):
+            total.merge(self.tasks[name])
+        return total
+
+    def burn_down(self, course: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Estimated hours left after every tracked day of the course,
+        only time tracked on estimated tasks burns the estimate down
+        """
+        estimate = sum(self.tasks[name].estimate for name in self.task_names(course))
+        days: Dict[str, float] = {}
+        for course_name, course_days in self.daily.items():
+            if course is None or course_name == course:
+                for day, hours in course_days.items():
+                    days[day] = days.get(day, 0.0) + hours
+        burn_down = []
+        for day in sorted(days):
+            estimate -= days[day]
+            burn_down.append((day, max(estimate, 0.0)))
+        return burn_down
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total().to_dict(),
+            "courses": [
+                {
+                    "course": course,
+                    **self.total(course).to_dict(),
+                    "burn_down": [
+                        {"day": day, "remaining": remaining}
+                        for day, remaining in self.burn_down(course)
+                    ],
+                    "tasks": [
+                        {"name": name, **self.tasks[name].to_dict()}
+                        for name in self.task_names(course)
+                    ],
+                }
+                for course in self.courses()
+            ],
+        }
@@ -1,41 +1,114 @@
-import difflib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date, time
-import tomllib
-from typing import List
+from functools import cache
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple, TypeVar
 
+import httpx
 import toggl_python
 from better_rich_prompts.prompt import ListPrompt
 from dateutil import tz
 from toggl_python.entities import TimeEntry
 
+from database_handler import UploadedTasksDB
+from tag_index import TagIndex
 import utils
+import worker_pool
 
-_config = {}
+CONFIG_FILE = ".toggl.toml"
+DEFAULT_POOL_SIZE = 10  # connections kept open to toggl
+DEFAULT_KEEPALIVE_EXPIRY = 30  # seconds an idle connection stays open
+DEFAULT_TIMEOUT = 10  # seconds
+WINDOW_DAYS = 30  # days of time entries fetched per request
+WINDOW_CONCURRENCY = 4  # windows fetched in parallel
 
-CONFIG_PATH = utils.get_project_root() / "things2reclaim/config/.toggl.toml"
-with open(CONFIG_PATH, "rb") as f:
-    _config = tomllib.load(f)
+T = TypeVar("T")
 
-TOKEN = _config["toggl_track"]["token"]
 
-auth = toggl_python.TokenAuth(TOKEN)
-workspace = toggl_python.Workspaces(auth=auth).list()[0]
-project_dict = {
-    project.name: project
-    for project in toggl_python.Workspaces(auth=auth).projects(_id=workspace.id)
-    if project.active
-}
-time_entry_editor = toggl_python.WorkspaceTimeEntries(
-    auth=auth, workspace_id=workspace.id
-)
+def get_base_url() -> Optional[str]:
+    """
+    api_url from the config, None uses the toggl api
+    """
+    return utils.load_config(CONFIG_FILE)["toggl_track"].get("api_url")
+
+
+@cache
+def get_auth() -> toggl_python.TokenAuth:
+    return toggl_python.TokenAuth(utils.load_config(CONFIG_FILE)["toggl_track"]["token"])
+
+
+@cache
+def get_http_client() -> httpx.Client:
+    """
+    One pooled keep-alive session shared by all toggl repositories
+    """
+    config = utils.load_config(CONFIG_FILE)["toggl_track"]
+    pool_size = config.get("pool_size", DEFAULT_POOL_SIZE)
+    return httpx.Client(
+        auth=get_auth(),
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=config.get("keepalive_expiry", DEFAULT_KEEPALIVE_EXPIRY),
+        ),
+        timeout=config.get("timeout", DEFAULT_TIMEOUT),
+    )
+
+
+def use_shared_client(repository: T) -> T:
+    """
+    Replaces the session every toggl_python repository opens for itself,
+    the repositories send absolute urls so they can share one client
+    """
+    repository.client.close()
+    repository.client = get_http_client()
+    return repository
+
+
+@cache
+def get_workspaces() -> toggl_python.Workspaces:
+    return use_shared_client(
+        toggl_python.Workspaces(base_url=get_base_url(), auth=get_auth())
+    )
+
+
+@cache
+def get_time_entries() -> toggl_python.TimeEntries:
+    return use_shared_client(
+        toggl_python.TimeEntries(base_url=get_base_url(), auth=get_auth())
+    )
+
+
+@cache
+def get_workspace() -> toggl_python.Workspace:
+    return get_workspaces().list()[0]
+
+
+@cache
+def get_project_dict() -> Dict[str, toggl_python.Project]:
+    return {
+        project.name: project
+        for project in get_workspaces().projects(_id=get_workspace().id)
+        if project.active
+    }
+
+
+@cache
+def get_time_entry_editor():
+    return use_shared_client(
+        toggl_python.WorkspaceTimeEntries(
+            base_url=get_base_url(), auth=get_auth(), workspace_id=get_workspace().id
+        )
+    )
 
 
 def get_time_entry(time_entry_id: int) -> toggl_python.TimeEntry:
-    return toggl_python.TimeEntries(auth=auth).retrieve(time_entry_id)
+    return get_time_entries().retrieve(time_entry_id)
 
 
 def delete_time_entry(time_entry_id: int) -> bool:
-    return time_entry_editor.delete_timeentry(time_entry_id)
+    return get_time_entry_editor().delete_timeentry(time_entry_id)
 
 
 def get_start_time(time_entry: toggl_python.TimeEntry):
@@ -49,11 +122,77 @@ def get_stop_time(time_entry: toggl_python.TimeEntry):
 
 
 def get_time_entries_date_range(from_date: date, to_date: date):
-    return toggl_python.TimeEntries(auth=auth).list(
-        start_date=from_date.isoformat(), end_date=to_date.isoformat()
+    # toggl_python returns None instead of an empty list
+    return (
+        get_time_entries().list(
+            start_date=from_date.isoformat(), end_date=to_date.isoformat()
+        )
+        or []
     )
 
 
+def get_windows(
+    from_date: date, to_date: date, window_days: int = WINDOW_DAYS
+) -> List[Tuple[date, date]]:
+    """
+    Splits [from_date, to_date) into consecutive windows of window_days
+    """
+    windows = []
+    start = from_date
+    while start < to_date:
+        end = min(start + timedelta(days=window_days), to_date)
+        windows.append((start, end))
+        start = end
+    return windows
+
+
+def iter_time_entry_windows(
+    from_date: date,
+    to_date: date,
+    window_days: int = WINDOW_DAYS,
+    concurrency: int = WINDOW_CONCURRENCY,
+) -> Iterator[Tuple[date, date, List[toggl_python.TimeEntry]]]:
+    """
+    Streams (window start, window end, entries in start order) for the
+    consecutive windows of [from_date, to_date). At most concurrency windows
+    are requested ahead of the one being consumed
+    """
+    windows = iter(get_windows(from_date, to_date, window_days))
+
+    def fetch(window: Tuple[date, date]):
+        return worker_pool.retry_with_backoff(
+            lambda: get_time_entries_date_range(*window)
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        pending = deque(
+            (window, executor.submit(fetch, window))
+            for window in islice(windows, max(1, concurrency))
+        )
+        while pending:
+            (window_start, window_end), future = pending.popleft()
+            entries = future.result()
+            next_window = next(windows, None)
+            if next_window is not None:
+                pending.append((next_window, executor.submit(fetch, next_window)))
+            yield window_start, window_end, sorted(entries, key=get_start_time)
+
+
+def iter_time_entries(
+    from_date: date,
+    to_date: date,
+    window_days: int = WINDOW_DAYS,
+    concurrency: int = WINDOW_CONCURRENCY,
+) -> Iterator[toggl_python.TimeEntry]:
+    """
+    Streams the time entries started in [from_date, to_date) in start order
+    """
+    for _, _, entries in iter_time_entry_windows(
+        from_date, to_date, window_days, concurrency
+    ):
+        yield from entries
+
+
 def get_time_entries_since(since_days: int = 30) -> List[toggl_python.TimeEntry]:
     """
     get time entries since days at midnight
@@ -62,11 +201,21 @@ def get_time_entries_since(since_days: int = 30) -> List[toggl_python.TimeEntry]
         raise ValueError("since_days can't be more than 90 days")
     midnight = datetime.combine(datetime.now(tz.tzlocal()), time.min)
     time_stamp = int((midnight - timedelta(days=since_days)).timestamp())
-    return toggl_python.TimeEntries(auth=auth).list(since=time_stamp)
+    return get_time_entries().list(since=time_stamp)
+
+
+def get_modified_time_entries(since: float) -> List[Dict]:
+    """
+    Raw time entries created, changed or deleted (server_deleted_at set)
+    since the unix timestamp, toggl only answers for the last three months
+    """
+    time_entries = get_time_entries()
+    response = time_entries.get(time_entries.LIST_URL, params={"since": int(since)})
+    return response.json()
 
 
 def get_current_time_entry() -> TimeEntry | None:
-    time_entries = toggl_python.TimeEntries(auth=auth)
+    time_entries = get_time_entries()
     time_entries.ADDITIONAL_METHODS = {
         "current": {
             "url": "me/time_entries/current",
@@ -78,25 +227,48 @@ def get_current_time_entry() -> TimeEntry | None:
 
 
 def get_tags() -> List[toggl_python.Tag]:
-    return toggl_python.Workspaces(auth=auth).tags(_id=workspace.id)
+    return get_workspaces().tags(_id=get_workspace().id)
+
+
+def get_tag_cache_ttl() -> float:
+    return utils.load_config(CONFIG_FILE)["toggl_track"].get("tag_cache_ttl", 86400)
+
+
+def get_tag_index() -> TagIndex:
+    """
+    Builds the tag index from the tag names cached in the database,
+    the tags are only fetched from toggl once the cache is older than its ttl.
+    Not memoized, so a long running daemon picks up new tags after the ttl
+    """
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        tag_names = db.get_cached_value("toggl_tags", get_tag_cache_ttl())
+        if tag_names is None:
+            tag_names = [tag.name for tag in get_tags() or []]
+            db.store_cached_value("toggl_tags", tag_names)
+    return TagIndex(tag_names)
 
 
 def get_approriate_tag(description: str) -> str | None:
-    tag_dict = {tag.name: tag for tag in get_tags()}
-    parts = description.replace("VL", "Vorlesung").split(" ")
-    possible_tags = set()
-    for part in parts:
-        possible_tags.update(difflib.get_close_matches(part, tag_dict.keys()))
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        previous_choice = db.get_tag_choice(description)
+    tag_index = get_tag_index()
+    if previous_choice is not None and previous_choice in tag_index:
+        return previous_choice
+
+    possible_tags = tag_index.match(description)
 
     if not possible_tags:
         print("Found no matching tags")
         return None
 
-    possible_tags = list(possible_tags)
+    possible_tags = sorted(possible_tags)
 
     if len(possible_tags) == 1:
         return possible_tags[0]
-    return ListPrompt.ask("Select the best fitting tag", possible_tags)
+    tag = ListPrompt.ask("Select the best fitting tag", possible_tags)
+    with UploadedTasksDB(utils.get_database_path()) as db:
+        db.store_tag_choice(description, tag)
+    return tag
 
 
 def create_task_time_entry(
@@ -105,12 +277,13 @@ def create_task_time_entry(
     """
     duration is in seconds
     """
+    project_dict = get_project_dict()
     if project not in project_dict.keys():
         raise ValueError(f"{project} is not an active toggl project")
 
     time_entry = TimeEntry(
         created_with="things-automation",
-        wid=workspace.id,
+        wid=get_workspace().id,
         pid=project_dict[project].id,
         description=description,
         duration=duration,
@@ -133,10 +306,11 @@ def create_task_time_entry(
 
 
 def start_task(description: str, project: str):
-    time_entry_editor.create(create_task_time_entry(description, project))
+    get_time_entry_editor().create(create_task_time_entry(description, project))
 
 
 def stop_task(task: TimeEntry) -> TimeEntry | None:
+    time_entry_editor = get_time_entry_editor()
     if time_entry_editor.DETAIL_URL is None:
         raise ValueError("DetailURL not set")
 
@@ -1,12 +1,13 @@
 from datetime import datetime, timedelta
+from functools import cache
+import os
 import re
-from typing import Union, Dict, TypeVar, List, Optional
-import difflib
+from typing import Any, Union, Dict, Optional
+import tomllib
 from dateutil import tz
 
 import emoji
 from pathlib import Path
-from better_rich_prompts.prompt import ListPrompt
 from rich import print as rprint
 from toggl_python import TimeEntry
 from reclaim_sdk.models.task_event import ReclaimTaskEvent
@@ -16,7 +17,7 @@ TIME_PATTERN = (
 )
 pattern = re.compile(TIME_PATTERN)
 
-T = TypeVar("T")  # generic type
+CONFIG_DIR_VARIABLE = "THINGS2RECLAIM_CONFIG_DIR"
 
 
 def calculate_time_on_unit(tag_value: str) -> float:
@@ -84,37 +85,21 @@ def map_tag_values(
                 print(f"Tag {tag} not recognized")
 
 
-def get_closest_match(name: str, candidates: Dict[str, T]) -> T | None:
-    possible_candidates: List[str] = difflib.get_close_matches(name, candidates.keys())
-
-    if not possible_candidates:
-        return None
-    if len(possible_candidates) == 1:
-        return candidates[possible_candidates[0]]
-
-    return candidates[ListPrompt.ask("Select a candidate", possible_candidates)]
-
-
-def nearest_time_entry(
-    items: Optional[List[ReclaimTaskEvent]], pivot: TimeEntry
-) -> Optional[ReclaimTaskEvent]:
-    if not items:
-        return None
-    return min(items, key=lambda x: abs(x.start - get_start_time(pivot)))
-
-
 def is_matching_time_entry(
     toggl_time_entry: Optional[TimeEntry],
     reclaim_time_entry: Optional[ReclaimTaskEvent],
+    verbose: bool = True,
 ):
     if toggl_time_entry is None or reclaim_time_entry is None:
-        print("One is none")
+        if verbose:
+            print("One is none")
         return False
     if toggl_time_entry.description != get_clean_time_entry_name(
         reclaim_time_entry.name
     ):
-        print(f"toggl title: {toggl_time_entry.description}")
-        print(f"reclaim title: {get_clean_time_entry_name(reclaim_time_entry.name)}")
+        if verbose:
+            print(f"toggl title: {toggl_time_entry.description}")
+            print(f"reclaim title: {get_clean_time_entry_name(reclaim_time_entry.name)}")
         return False
 
     toggl_start = get_start_time(toggl_time_entry)
@@ -132,12 +117,14 @@ def is_matching_time_entry(
         raise ValueError("Reclaim stop is not timezone aware.")
 
     if toggl_start.astimezone(tz.tzutc()) != reclaim_start.astimezone(tz.tzutc()):
-        print(f"toggl_start: {toggl_start.isoformat()}")
-        print(f"reclaim_start: {reclaim_start.isoformat()}")
+        if verbose:
+            print(f"toggl_start: {toggl_start.isoformat()}")
+            print(f"reclaim_start: {reclaim_start.isoformat()}")
         return False
     if toggl_stop.astimezone(tz.tzutc()) != reclaim_end.astimezone(tz.tzutc()):
-        print(f"toggl_end: {toggl_stop.isoformat()}")
-        print(f"reclaim_end: {reclaim_end.isoformat()}")
+        if verbose:
+            print(f"toggl_end: {toggl_stop.isoformat()}")
+            print(f"reclaim_end: {reclaim_end.isoformat()}")
         return False
     return True
 
@@ -194,3 +181,26 @@ def reclaim_task_pretty_print(task):
 
 def get_project_root() -> Path:
     return Path(__file__).parent.parent
+
+
+def get_config_dir() -> Path:
+    """
+    things2reclaim/config, or THINGS2RECLAIM_CONFIG_DIR if it is set
+    """
+    config_dir = os.environ.get(CONFIG_DIR_VARIABLE)
+    if config_dir is not None:
+        return Path(config_dir)
+    return get_project_root() / "things2reclaim/config"
+
+
+@cache
+def load_config(file_name: str) -> Dict[str, Any]:
+    """
+    Reads a toml file from the config directory once per process
+    """
+    with open(get_config_dir() / file_name, "rb") as f:
+        return tomllib.load(f)
+
+
+def get_database_path() -> Path:
+    return get_project_root() / load_config(".things2reclaim.toml")["database"]["path"]
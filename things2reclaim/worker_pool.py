@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import random
+import threading
+import time
+from typing import Any, Callable, Generic, Iterable, Iterator, NamedTuple, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# a create may have been applied before these failed, so only a rejected
+# request or one that never reached the server is sent again
+CREATE_RETRY_STATUS_CODES = {429}
+CREATE_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class RateLimiter:
+    """
+    Spaces calls from all threads at least 1/rate seconds apart
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+class TaskResult(NamedTuple, Generic[T]):
+    item: T
+    result: Any
+    error: Optional[Exception]
+    latency: float  # seconds including retries
+
+
+def get_http_error(exc: BaseException) -> Optional[httpx.HTTPStatusError]:
+    """
+    Finds the http error behind exc. The reclaim sdk raises its own
+    exceptions while handling the original httpx error
+    """
+    current: Optional[BaseException] = exc
+    while current is not None:
+        if isinstance(current, httpx.HTTPStatusError):
+            return current
+        current = current.__cause__ or current.__context__
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    http_error = get_http_error(exc)
+    return (
+        http_error is not None
+        and http_error.response.status_code in RETRY_STATUS_CODES
+    )
+
+
+def is_retryable_create(exc: BaseException) -> bool:
+    """
+    Retry policy for non-idempotent creates, a read timeout or server error
+    after the request was sent could create the task twice
+    """
+    current: Optional[BaseException] = exc
+    while current is not None:
+        if isinstance(current, CREATE_RETRY_ERRORS):
+            return True
+        current = current.__cause__ or current.__context__
+    http_error = get_http_error(exc)
+    return (
+        http_error is not None
+        and http_error.response.status_code in CREATE_RETRY_STATUS_CODES
+    )
+
+
+def get_retry_delay(exc: BaseException, attempt: int, base_delay: float) -> float:
+    http_error = get_http_error(exc)
+    if http_error is not None:
+        retry_after = http_error.response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+    return base_delay * 2**attempt + random.uniform(0, base_delay)
+
+
+def retry_with_backoff(
+    func: Callable[[], Any],
+    retries: int = 3,
+    base_delay: float = 0.5,
+    rate_limiter: Optional[RateLimiter] = None,
+    retryable: Callable[[BaseException], bool] = is_retryable,
+):
+    """
+    Calls func and retries it with exponential backoff on rate limits,
+    server errors and connection problems, or whatever retryable accepts
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= retries or not retryable(e):
+                raise
+            time.sleep(get_retry_delay(e, attempt, base_delay))
+            attempt += 1
+
+
+def run_concurrently(
+    func: Callable[[T], Any],
+    items: Iterable[T],
+    concurrency: int = 1,
+    rate_limiter: Optional[RateLimiter] = None,
+    retries: int = 3,
+    retryable: Callable[[BaseException], bool] = is_retryable,
+) -> Iterator[TaskResult[T]]:
+    """
+    Runs func for every item on a bounded thread pool and yields the
+    results in completion order, so the caller can act as single writer
+    """
+
+    def run(item: T) -> TaskResult[T]:
+        start = time.perf_counter()
+        try:
+            result = retry_with_backoff(
+                lambda: func(item),
+                retries=retries,
+                rate_limiter=rate_limiter,
+                retryable=retryable,
+            )
+            return TaskResult(item, result, None, time.perf_counter() - start)
+        except Exception as e:
+            return TaskResult(item, None, e, time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(run, item) for item in items]
+        for future in as_completed(futures):
+            yield future.result()